@@ -1,127 +1,528 @@
 import os
-import io
 import time
+import zipfile
+from concurrent.futures.process import BrokenProcessPool
 from flask import Flask, request, jsonify
 from flask_cors import CORS
+from werkzeug.exceptions import RequestEntityTooLarge
 from werkzeug.utils import secure_filename
-from PIL import Image
 import numpy as np
 
+from models.profiles import PROFILES_FILE, ProfileStore
 from models.yolo_detector import YOLODetector
+from utils.detections import DetectionTable
 from utils.image_processor import ImageProcessor
+from utils.ingest import decode_grayscale, open_upload, upload_size
+from utils.model_registry import REGISTRY_FILE, ActiveModel, ModelRegistry
+from utils.result_cache import ResultCache, cache_key
+from utils.profiling import MetricsRegistry, StageProfiler
+from batch_processing import BatchAnalyzer, BatchTooLargeError, read_zip_images
+from job_queue import AnalysisJobQueue, QueueFullError
 
 app = Flask(__name__)
 CORS(app)
 
-# Initialize the detector
-detector = YOLODetector()
-image_processor = ImageProcessor()
-
 # Configuration
 UPLOAD_FOLDER = 'uploads'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
+RESULT_CACHE_SIZE = 256  # entries kept in memory
+RESULT_CACHE_TTL = 24 * 60 * 60  # seconds
+RESULT_CACHE_DIR = 'result_cache'  # set to None to disable the disk tier
+MAX_BATCH_FILES = 200
+MAX_BATCH_SIZE = 500 * 1024 * 1024  # 500MB per batch request
+BATCH_WORKERS = os.cpu_count() or 1
+JOB_QUEUE_SIZE = 32  # queued async jobs before 429 responses
+JOB_WORKERS = 2
+JOB_RESULT_TTL = 30 * 60  # seconds a finished job's result is kept
+MODEL_REGISTRY_PATH = os.path.join('models', REGISTRY_FILE)  # shared with the training server
+MODEL_CHECK_INTERVAL = 1.0  # seconds between checks for a newly activated model
+PROFILE_FILE = os.path.join('models', PROFILES_FILE)  # extra detector profiles, reloaded on change
 
 if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER)
 
+def build_detector(model):
+    """Detector configured with a registry model's settings."""
+    # A model may name a profile from the profile file rather than spell it out
+    return YOLODetector.for_model(model, profile_store)
+
+# Detector parameter profiles selectable per request (?profile=fast) or per model
+profile_store = ProfileStore(PROFILE_FILE)
+
+# The detector follows the registry's active model: activating another one
+# swaps it in for new requests, while in-flight requests keep the one they took
+model_registry = ModelRegistry(MODEL_REGISTRY_PATH)
+active_detector = ActiveModel(model_registry, build_detector, check_interval=MODEL_CHECK_INTERVAL,
+                              close=YOLODetector.close)
+image_processor = ImageProcessor()
+
+# Cache of analysis results keyed by upload content and detector config
+result_cache = ResultCache(max_entries=RESULT_CACHE_SIZE, ttl=RESULT_CACHE_TTL,
+                           disk_dir=RESULT_CACHE_DIR)
+
+# Per-stage timing histograms served by /api/metrics
+stage_metrics = MetricsRegistry()
+
+# Process pool for batch analysis, started on the first batch request
+batch_analyzer = BatchAnalyzer(max_workers=BATCH_WORKERS)
+
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = MAX_FILE_SIZE
 
+def megabytes(size):
+    """A byte limit in whole megabytes, for error messages."""
+    return size // (1024 * 1024)
+
 def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def timings_requested():
+    """Whether the client asked for a per-stage timings block (?timings=1)."""
+    value = request.args.get('timings', request.form.get('timings', ''))
+    return value.lower() in ('1', 'true', 'yes')
+
+def requested_detectors():
+    """Detector subset from ?detectors=porosity,slag (None runs all of them)."""
+    value = request.args.get('detectors', request.form.get('detectors', ''))
+    names = [name.strip() for name in value.split(',') if name.strip()]
+    return active_detector.current().select_detectors(names) if names else None
+
+def requested_profile():
+    """Detector profile from ?profile=fast (None keeps the active model's profile)."""
+    name = request.args.get('profile', request.form.get('profile', '')).strip()
+    return profile_store.get(name) if name else None
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     return jsonify({
         'status': 'healthy',
         'message': 'AI Welding Defect Detection API is running',
+        'active_model': active_detector.current().model_version,
         'timestamp': time.time()
     })
 
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    try:
+        return jsonify({
+            'success': True,
+            'timestamp': time.time(),
+            'stages': stage_metrics.snapshot()['stages'],
+            'result_cache': result_cache.get_stats(),
+            'job_queue': analysis_jobs.get_queue_stats()
+        })
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Failed to get metrics: {str(e)}'
+        }), 500
+
+def run_analysis(filename, image_data, progress_callback=None, timings=False, detectors=None,
+                 profile=None):
+    """
+    Analyze one uploaded film and build the /api/analyze response.
+    image_data is the encoded film, as bytes or a seekable binary file.
+    Stage timings always feed /api/metrics; with timings=True they are also
+    returned in the response, together with per-stage peak memory.
+    detectors limits detection to a subset of YOLODetector.DETECTORS, and
+    profile replaces the active model's detector profile.
+    """
+    report = progress_callback or (lambda stage: None)
+    profiler = StageProfiler(trace_memory=timings)
+    
+    # Start processing timer
+    start_time = time.time()
+    
+    # One detector for the whole request, even if another model is activated meanwhile
+    detector = active_detector.current()
+    if profile is not None:
+        detector = detector.with_profile(profile)
+    
+    # Repeat uploads under the same detector config are served from cache
+    with profiler.stage('cache'):
+        config = detector.get_config()
+        if detectors is not None:
+            config['detectors'] = list(detectors)
+        key = cache_key(image_data, config)
+        cached = result_cache.get(key)
+    
+    if cached is None:
+        report('decode')
+        with profiler.stage('decode'):
+            image = open_upload(image_data)
+            image_format = image.format
+            
+            # Gray films stay single-channel; the detector gets a read-only array
+            pixels = decode_grayscale(image)
+            height, width = pixels.shape[:2]
+        
+        # Run defect detection; the pre-screen reports detectors it could skip
+        screening = {}
+        detections = detector.detect_defects(pixels, progress_callback=progress_callback,
+                                             profiler=profiler, detectors=detectors,
+                                             screening=screening)
+        
+        # Process results
+        report('summary')
+        with profiler.stage('summary'):
+            processed_results = image_processor.process_detections(detections, width, height)
+        
+        cached = {
+            'width': width,
+            'height': height,
+            'format': image_format or 'JPEG',
+            'results': processed_results,
+            'screening': screening
+        }
+        result_cache.put(key, cached)
+        cache_hit = False
+    else:
+        cache_hit = True
+    
+    processed_results = cached['results']
+    screening = cached.get('screening', {})
+    
+    # Get image info
+    image_info = {
+        'filename': filename,
+        'width': cached['width'],
+        'height': cached['height'],
+        'format': cached['format'],
+        'size_bytes': upload_size(image_data)
+    }
+    
+    # Calculate processing time
+    processing_time = time.time() - start_time
+    
+    stage_metrics.observe(profiler)
+    
+    # Prepare response
+    response = {
+        'success': True,
+        'message': 'Analysis completed successfully',
+        'image_info': image_info,
+        'detections': processed_results['detections'],
+        'summary': {
+            'total_defects': processed_results['total_defects'],
+            'defect_types': processed_results['defect_types'],
+            'average_confidence': processed_results['average_confidence'],
+            'severity': processed_results.get('severity'),
+            'processing_time': processing_time,
+            'cache_hit': cache_hit,
+            'fast_path': screening.get('fast_path', False),
+            'skipped_detectors': screening.get('skipped', {})
+        }
+    }
+    if timings:
+        response['timings'] = profiler.to_dict()
+    return response
+
+def run_analysis_job(payload, progress_callback):
+    """Job queue entry point: payload holds the run_analysis keyword arguments."""
+    return run_analysis(progress_callback=progress_callback, **payload)
+
+# Asynchronous analysis jobs, polled through /api/jobs/<job_id>
+analysis_jobs = AnalysisJobQueue(
+    run_analysis_job,
+    stages=('decode',) + YOLODetector.STAGES + ('summary',),
+    max_pending=JOB_QUEUE_SIZE,
+    workers=JOB_WORKERS,
+    result_ttl=JOB_RESULT_TTL
+)
+
+def validate_upload():
+    """Return the uploaded file, or an error response tuple."""
+    # Check if file is present
+    if 'file' not in request.files:
+        return None, (jsonify({
+            'success': False,
+            'message': 'No file provided'
+        }), 400)
+
+    file = request.files['file']
+    
+    # Check if file is selected
+    if file.filename == '':
+        return None, (jsonify({
+            'success': False,
+            'message': 'No file selected'
+        }), 400)
+
+    # Check file type
+    if not allowed_file(file.filename):
+        return None, (jsonify({
+            'success': False,
+            'message': 'File type not allowed. Please use JPEG or PNG.'
+        }), 400)
+
+    return file, None
+
 @app.route('/api/analyze', methods=['POST'])
 def analyze_image():
     try:
-        # Check if file is present
-        if 'file' not in request.files:
+        file, error = validate_upload()
+        if error:
+            return error
+
+        try:
+            detectors = requested_detectors()
+            profile = requested_profile()
+        except ValueError as e:
             return jsonify({
                 'success': False,
-                'message': 'No file provided'
+                'message': str(e)
             }), 400
 
-        file = request.files['file']
+        # Decode straight from the upload stream rather than a copy of the body
+        response = run_analysis(secure_filename(file.filename), file.stream,
+                                timings=timings_requested(), detectors=detectors, profile=profile)
+        
+        return jsonify(response)
         
-        # Check if file is selected
-        if file.filename == '':
+    except RequestEntityTooLarge:
+        # Answered by the 413 handler, with this endpoint's limit
+        raise
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Analysis failed: {str(e)}'
+        }), 500
+
+@app.route('/api/analyze/async', methods=['POST'])
+def analyze_image_async():
+    try:
+        file, error = validate_upload()
+        if error:
+            return error
+
+        try:
+            detectors = requested_detectors()
+            profile = requested_profile()
+        except ValueError as e:
             return jsonify({
                 'success': False,
-                'message': 'No file selected'
+                'message': str(e)
             }), 400
 
-        # Check file type
-        if not allowed_file(file.filename):
+        image_data = file.read()
+        job = analysis_jobs.submit({
+            'filename': secure_filename(file.filename),
+            'image_data': image_data,
+            'timings': timings_requested(),
+            'detectors': detectors,
+            'profile': profile
+        })
+        
+        return jsonify({
+            'success': True,
+            'message': 'Analysis queued',
+            'job_id': job['id'],
+            'status_url': f"/api/jobs/{job['id']}",
+            'job': job
+        }), 202
+        
+    except QueueFullError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 429
+    except RequestEntityTooLarge:
+        # Answered by the 413 handler, with this endpoint's limit
+        raise
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Failed to queue analysis: {str(e)}'
+        }), 500
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job_status(job_id):
+    try:
+        status = analysis_jobs.get_job_status(job_id)
+        
+        if 'error' in status:
             return jsonify({
                 'success': False,
-                'message': 'File type not allowed. Please use JPEG or PNG.'
-            }), 400
+                'message': status['error']
+            }), 404
+        
+        return jsonify({
+            'success': True,
+            'job': status
+        })
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Failed to get job status: {str(e)}'
+        }), 500
 
-        # Start processing timer
+@app.route('/api/analyze/batch', methods=['POST'])
+def analyze_batch():
+    # Batches may be much larger than a single upload
+    request.max_content_length = MAX_BATCH_SIZE
+    try:
         start_time = time.time()
         
-        # Read and process the image
-        image_data = file.read()
-        image = Image.open(io.BytesIO(image_data))
+        # Collect (filename, bytes) from multipart files and zip archives
+        images = []
+        for file in request.files.getlist('files') + request.files.getlist('archive'):
+            if file.filename == '':
+                continue
+            filename = secure_filename(file.filename)
+            if filename.lower().endswith('.zip'):
+                # Extracted members count against the batch limit like uploaded files
+                collected = sum(len(image_data) for _, image_data in images)
+                images.extend(read_zip_images(file.read(), ALLOWED_EXTENSIONS,
+                                              MAX_BATCH_FILES - len(images), MAX_FILE_SIZE,
+                                              MAX_BATCH_SIZE - collected))
+                continue
+            if not allowed_file(filename):
+                return jsonify({
+                    'success': False,
+                    'message': f'File type not allowed for {filename}. Please use JPEG, PNG or ZIP.'
+                }), 400
+            image_data = file.read()
+            if len(image_data) > MAX_FILE_SIZE:
+                return jsonify({
+                    'success': False,
+                    'message': f'{filename} is too large. Maximum size is {megabytes(MAX_FILE_SIZE)}MB.'
+                }), 400
+            images.append((filename, image_data))
+            if len(images) > MAX_BATCH_FILES:
+                break
         
-        # Convert to RGB if necessary
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
+        if not images:
+            return jsonify({
+                'success': False,
+                'message': 'No images provided'
+            }), 400
+        if len(images) > MAX_BATCH_FILES:
+            return jsonify({
+                'success': False,
+                'message': f'Batch is limited to {MAX_BATCH_FILES} images'
+            }), 400
         
-        # Get image info
-        image_info = {
-            'filename': secure_filename(file.filename),
-            'width': image.width,
-            'height': image.height,
-            'format': image.format or 'JPEG',
-            'size_bytes': len(image_data)
-        }
+        try:
+            profile = requested_profile()
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'message': str(e)
+            }), 400
+        detector = active_detector.current()
+        if profile is not None:
+            detector = detector.with_profile(profile)
         
-        # Run defect detection
-        detections = detector.detect_defects(image)
+        # Serve repeats from the result cache; only misses go to the worker pool
+        config = detector.get_config()
+        keys = [cache_key(image_data, config) for _, image_data in images]
+        outcomes = [result_cache.get(key) for key in keys]
+        pending = [index for index, outcome in enumerate(outcomes) if outcome is None]
         
-        # Process results
-        processed_results = image_processor.process_detections(detections, image.width, image.height)
+        analyzed = batch_analyzer.analyze([images[index] for index in pending], detector_config=config)
+        for index, outcome in zip(pending, analyzed):
+            outcomes[index] = outcome
+        fresh = set(pending)
         
-        # Calculate processing time
-        processing_time = time.time() - start_time
+        # Every film is summarized in one columnar pass; cached films contribute
+        # their stored detections, so the batch totals cover the whole request
+        successful = [index for index, outcome in enumerate(outcomes) if outcome.get('success', True)]
+        table = DetectionTable.from_detections([
+            outcomes[index]['detections'] if index in fresh else outcomes[index]['results']['detections']
+            for index in successful
+        ])
+        results_by_index = dict(zip(successful, image_processor.process_batch(table)))
+        for index in pending:
+            if index in results_by_index:
+                result_cache.put(keys[index], {
+                    'width': outcomes[index]['width'],
+                    'height': outcomes[index]['height'],
+                    'format': outcomes[index]['format'],
+                    'results': results_by_index[index],
+                    'screening': outcomes[index]['screening']
+                })
         
-        # Prepare response
-        response = {
-            'success': True,
-            'message': 'Analysis completed successfully',
-            'image_info': image_info,
-            'detections': processed_results['detections'],
-            'summary': {
-                'total_defects': processed_results['total_defects'],
-                'defect_types': processed_results['defect_types'],
-                'average_confidence': processed_results['average_confidence'],
-                'processing_time': processing_time
-            }
+        items = []
+        for index, ((filename, image_data), outcome) in enumerate(zip(images, outcomes)):
+            if index not in results_by_index:
+                items.append({
+                    'success': False,
+                    'filename': filename,
+                    'message': outcome['message']
+                })
+                continue
+            results = results_by_index[index]
+            items.append({
+                'success': True,
+                'image_info': {
+                    'filename': filename,
+                    'width': outcome['width'],
+                    'height': outcome['height'],
+                    'format': outcome['format'],
+                    'size_bytes': len(image_data)
+                },
+                'detections': results['detections'],
+                'summary': {
+                    'total_defects': results['total_defects'],
+                    'defect_types': results['defect_types'],
+                    'average_confidence': results['average_confidence'],
+                    'severity': results['severity'],
+                    'processing_time': outcome.get('processing_time', 0.0),
+                    'cache_hit': index not in fresh
+                }
+            })
+        
+        summary = {
+            'total_images': len(items),
+            'successful_images': len(successful),
+            'failed_images': len(items) - len(successful)
         }
+        summary.update(image_processor.summarize_batch(table))
+        summary['processing_time'] = time.time() - start_time
         
-        return jsonify(response)
+        return jsonify({
+            'success': True,
+            'message': 'Batch analysis completed',
+            'results': items,
+            'summary': summary
+        })
         
+    except BatchTooLargeError:
+        return jsonify({
+            'success': False,
+            'message': f'Batch too large. Maximum size is {megabytes(MAX_BATCH_SIZE)}MB.'
+        }), 413
+    except (ValueError, zipfile.BadZipFile) as e:
+        return jsonify({
+            'success': False,
+            'message': f'Invalid batch: {str(e)}'
+        }), 400
+    except BrokenProcessPool:
+        # The pool is rebuilt for the next batch
+        return jsonify({
+            'success': False,
+            'message': 'A batch worker stopped unexpectedly (e.g. out of memory). Please retry the batch.'
+        }), 503
+    except RequestEntityTooLarge:
+        # Answered by the 413 handler, with this endpoint's limit
+        raise
     except Exception as e:
         return jsonify({
             'success': False,
-            'message': f'Analysis failed: {str(e)}'
+            'message': f'Batch analysis failed: {str(e)}'
         }), 500
 
 @app.errorhandler(413)
 def too_large(e):
+    # Batch requests raise the limit for themselves (request.max_content_length)
+    limit = request.max_content_length or MAX_FILE_SIZE
     return jsonify({
         'success': False,
-        'message': 'File too large. Maximum size is 10MB.'
+        'message': f'File too large. Maximum size is {megabytes(limit)}MB.'
     }), 413
 
 if __name__ == '__main__':
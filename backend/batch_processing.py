@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Batch analysis for the welding defect detection system.
+Fans many uploaded films out over a process pool with one preloaded
+detector per worker; the raw detections come back to the caller, which
+summarizes the whole batch in one columnar pass. Every task carries the
+detector configuration it runs under, so batches with different models
+or profiles share the pool.
+
+Workers are started from a fork server (or spawned), never forked from
+the server process, whose request and scheduler threads a fork would
+copy mid-flight. A worker that dies (e.g. killed for running out of
+memory) fails its batch and the pool is rebuilt for the next one.
+"""
+import io
+import multiprocessing
+import os
+import threading
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import repeat
+from typing import List, Dict, Tuple
+
+from models.yolo_detector import YOLODetector
+from utils.ingest import decode_grayscale, open_upload
+
+# Per-process detector, created by the pool initializer, and the settings
+# (apart from the profile) it was configured with
+_worker_detector = None
+_worker_settings = None
+
+
+def _init_worker(detector_config: Dict = None):
+    """Preload the detector in a pool worker."""
+    global _worker_detector, _worker_settings
+    _worker_settings = dict(detector_config or {})
+    _worker_detector = YOLODetector().configure(_worker_settings)
+    # The pool already runs one worker per CPU; stage threads would oversubscribe them
+    _worker_detector.stage_workers = 1
+
+
+def _detector_for(detector_config: Dict = None) -> YOLODetector:
+    """
+    The worker's detector for a configuration as returned by get_config().
+    Profiles are switched with with_profile, whose variants the detector
+    caches; other settings (e.g. another model) reconfigure the worker.
+    """
+    settings = dict(detector_config or {})
+    profile = settings.pop('profile', None)
+    if _worker_detector is None or settings != _worker_settings:
+        _init_worker(settings)
+    if profile is None:
+        return _worker_detector
+    return _worker_detector.with_profile(profile)
+
+
+def analyze_image_bytes(filename: str, image_data: bytes, detector_config: Dict = None) -> Dict:
+    """
+    Detect defects in one encoded film in a worker; errors are reported per
+    image. Raw detections are returned and summarized for the whole batch
+    by ImageProcessor.process_batch in the parent.
+    """
+    start_time = time.time()
+    try:
+        detector = _detector_for(detector_config)
+        image = open_upload(image_data)
+        image_format = image.format
+        pixels = decode_grayscale(image)
+        height, width = pixels.shape[:2]
+
+        screening = {}
+        detections = detector.detect_defects(pixels, screening=screening)
+
+        return {
+            'success': True,
+            'width': width,
+            'height': height,
+            'format': image_format or 'JPEG',
+            'detections': detections,
+            'screening': screening,
+            'processing_time': time.time() - start_time
+        }
+    except Exception as e:
+        return {
+            'success': False,
+            'message': f'Analysis failed: {str(e)}',
+            'processing_time': time.time() - start_time
+        }
+
+
+class BatchTooLargeError(ValueError):
+    """Raised when a batch's extracted images exceed its total size limit."""
+
+
+def read_zip_images(zip_data: bytes, allowed_extensions, max_files: int,
+                    max_file_size: int, max_total_size: int = None) -> List[Tuple[str, bytes]]:
+    """
+    Extract allowed image members from a zip archive, with size limits.
+    Member sizes are checked from the archive directory before anything is
+    extracted, so an archive that expands past max_total_size is rejected
+    without being inflated.
+    """
+    images = []
+    total_size = 0
+    with zipfile.ZipFile(io.BytesIO(zip_data)) as archive:
+        for member in archive.infolist():
+            name = os.path.basename(member.filename)
+            if member.is_dir() or '.' not in name or name.startswith('.'):
+                continue
+            if name.rsplit('.', 1)[1].lower() not in allowed_extensions:
+                continue
+            if member.file_size > max_file_size:
+                raise ValueError(f"{name} exceeds the maximum file size")
+            if len(images) >= max_files:
+                raise ValueError(f"Batch is limited to {max_files} images")
+            total_size += member.file_size
+            if max_total_size is not None and total_size > max_total_size:
+                raise BatchTooLargeError("Extracted images exceed the batch size limit")
+            images.append((name, member))
+        # Extracted only once every member passed the limits
+        images = [(name, archive.read(member)) for name, member in images]
+    return images
+
+
+class BatchAnalyzer:
+    def __init__(self, max_workers: int = None, detector_config: Dict = None):
+        """detector_config is preloaded in every worker and used when analyze() is given none."""
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.detector_config = detector_config or {}
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        """Start the worker pool on first use, and again after it broke."""
+        with self._lock:
+            if self._executor is None:
+                method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context(method),
+                    initializer=_init_worker,
+                    initargs=(self.detector_config,)
+                )
+            return self._executor
+
+    def analyze(self, images: List[Tuple[str, bytes]], detector_config: Dict = None) -> List[Dict]:
+        """
+        Analyze (filename, bytes) pairs in parallel; results keep input order.
+        Raises BrokenProcessPool if a worker died during the batch; the next
+        call starts a fresh pool.
+        """
+        if not images:
+            return []
+        if detector_config is None:
+            detector_config = self.detector_config
+        executor = self._get_executor()
+        names, payloads = zip(*images)
+        try:
+            return list(executor.map(analyze_image_bytes, names, payloads, repeat(detector_config)))
+        except BrokenProcessPool:
+            self._discard(executor)
+            raise
+
+    def _discard(self, executor: ProcessPoolExecutor):
+        """Drop a broken pool, unless another batch already replaced it."""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self):
+        """Stop the worker pool."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Asynchronous analysis jobs for the welding defect detection system.
+Jobs wait in a bounded in-process queue, run on worker threads, report
+per-stage progress and keep their results until they expire.
+"""
+import time
+import queue
+import threading
+import uuid
+from typing import Callable, Dict, Sequence
+
+
+class QueueFullError(Exception):
+    """Raised when the job queue has no room for another job."""
+
+
+class AnalysisJobQueue:
+    def __init__(self, run_job: Callable, stages: Sequence[str], max_pending: int = 16,
+                 workers: int = 2, result_ttl: float = 600):
+        """
+        run_job(payload, progress_callback) does the work and returns the
+        result. progress_callback(stage) is called as each stage starts and
+        marks the stages before it completed; stages that run alongside
+        others call progress_callback(stage, 'started') and
+        progress_callback(stage, 'completed') instead.
+        """
+        self.run_job = run_job
+        self.stages = list(stages)
+        self.max_pending = max_pending
+        self.workers = workers
+        self.result_ttl = result_ttl
+
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._workers = []
+
+    def _start_workers(self):
+        """Start the worker threads on first use, so the queue can be created before a fork."""
+        with self._lock:
+            if self._workers:
+                return
+            for index in range(self.workers):
+                worker = threading.Thread(target=self._work, name=f"analysis-job-{index}", daemon=True)
+                worker.start()
+                self._workers.append(worker)
+
+    def submit(self, payload) -> Dict:
+        """Queue a job and return its initial status."""
+        self._start_workers()
+        self._expire_jobs()
+        job = {
+            "id": f"job_{uuid.uuid4().hex[:12]}",
+            "status": "queued",
+            "progress": 0,
+            "stage": None,
+            "stages": {stage: "pending" for stage in self.stages},
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "result": None,
+            "error_message": None
+        }
+        with self._lock:
+            self._jobs[job["id"]] = job
+            try:
+                self._queue.put_nowait((job["id"], payload))
+            except queue.Full:
+                del self._jobs[job["id"]]
+                raise QueueFullError("Analysis queue is full, try again later")
+            return self._snapshot(job)
+
+    def get_job_status(self, job_id: str) -> Dict:
+        """Get current job status."""
+        self._expire_jobs()
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return {"error": "Job not found"}
+            return self._snapshot(job)
+
+    def get_queue_stats(self) -> Dict:
+        """Queue depth and job counts by status."""
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job["status"]] = counts.get(job["status"], 0) + 1
+            return {
+                "pending": self._queue.qsize(),
+                "max_pending": self.max_pending,
+                "workers": self.workers,
+                "jobs": counts
+            }
+
+    def _snapshot(self, job):
+        snapshot = dict(job)
+        snapshot["stages"] = dict(job["stages"])
+        if job["finished_at"] is not None:
+            snapshot["expires_at"] = job["finished_at"] + self.result_ttl
+        return snapshot
+
+    def _work(self):
+        while True:
+            job_id, payload = self._queue.get()
+            try:
+                self._run(job_id, payload)
+            finally:
+                self._queue.task_done()
+
+    def _run(self, job_id, payload):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job["status"] = "running"
+            job["started_at"] = time.time()
+
+        # Stages that started alongside others and will report their own completion
+        concurrent = set()
+
+        def progress_callback(stage, state='running'):
+            with self._lock:
+                self._advance(job, stage, state, concurrent)
+
+        try:
+            result = self.run_job(payload, progress_callback)
+        except Exception as e:
+            with self._lock:
+                job["status"] = "failed"
+                job["error_message"] = str(e)
+                job["finished_at"] = time.time()
+            return
+
+        with self._lock:
+            for stage in job["stages"]:
+                job["stages"][stage] = "completed"
+            job["status"] = "completed"
+            job["progress"] = 100
+            job["stage"] = None
+            job["result"] = result
+            job["finished_at"] = time.time()
+
+    def _advance(self, job, stage, state, concurrent):
+        """
+        Record a stage event. A stage that starts marks earlier stages
+        completed and later ones pending, except stages in `concurrent`,
+        which stay as they are until they report 'completed' themselves.
+        """
+        if stage not in job["stages"]:
+            return
+        position = self.stages.index(stage)
+        if state == "completed":
+            concurrent.discard(stage)
+            job["stages"][stage] = "completed"
+            done = sum(1 for value in job["stages"].values() if value == "completed")
+            job["progress"] = max(job["progress"], round(100 * done / len(self.stages)))
+            return
+
+        if state == "started":
+            concurrent.add(stage)
+        for earlier in self.stages[:position]:
+            if earlier not in concurrent:
+                job["stages"][earlier] = "completed"
+        job["stages"][stage] = "running"
+        # Tiled detection repeats the stage sequence once per tile
+        for later in self.stages[position + 1:]:
+            if later not in concurrent:
+                job["stages"][later] = "pending"
+        job["stage"] = stage
+        job["progress"] = max(job["progress"], round(100 * position / len(self.stages)))
+
+    def _expire_jobs(self):
+        """Drop finished jobs whose results are older than result_ttl."""
+        now = time.time()
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job["finished_at"] is not None and now - job["finished_at"] > self.result_ttl]
+            for job_id in expired:
+                del self._jobs[job_id]
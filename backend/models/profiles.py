@@ -0,0 +1,196 @@
+"""
+Parameter profiles for YOLODetector.
+
+A profile is a named, versioned set of every threshold and size the
+detector stages use. compile_profile validates it once and builds what
+the stages would otherwise derive per call (the crack structuring element,
+the porosity radius range with its Hough offset and perimeter tables, the
+pre-screen ranks); compiled profiles are cached by their settings, so
+switching between profiles costs a dictionary lookup.
+
+Profiles come from BUILTIN_PROFILES or a JSON file read by ProfileStore,
+which picks up edits to the file without a restart, e.g.
+
+    {"fast": {"version": "1.1.0", "porosity_radius_step": 3}}
+
+Unset parameters take their value from the default profile.
+"""
+import json
+import os
+import threading
+from functools import lru_cache
+from typing import Dict, List, Union
+
+import numpy as np
+
+from utils.hough import ANGLE_BINS, offset_table, perimeter_offsets
+from utils.rank_filter import window_rank
+
+PROFILES_FILE = "profiles.json"
+
+DEFAULT_PROFILE = {
+    'name': 'default',
+    'version': '1.0.0',
+    # Detections at or below this confidence are dropped
+    'confidence_threshold': 0.5,
+    'nms_threshold': 0.4,
+    # Cracks: closing kernel height, then components larger and longer than this
+    'crack_kernel_length': 7,
+    'crack_min_area': 100,
+    'crack_min_aspect_ratio': 3,
+    # Porosity: dark pixels of the median-filtered film, circles of these radii
+    'porosity_threshold': 0.4,
+    'porosity_median_size': 5,
+    'porosity_min_radius': 5,
+    'porosity_max_radius': 50,
+    'porosity_radius_step': 1,
+    'circularity_step_degrees': 10,
+    # Slag: bright regions larger and more irregular than this
+    'slag_threshold': 0.7,
+    'slag_min_area': 50,
+    'slag_min_irregularity': 0.3
+}
+
+BUILTIN_PROFILES = {
+    'default': DEFAULT_PROFILE,
+    # Fast lane: every other porosity radius halves the Hough work, at some
+    # cost in radius accuracy and recall of pores between the sampled sizes
+    'fast': dict(DEFAULT_PROFILE, name='fast', porosity_radius_step=2, circularity_step_degrees=20)
+}
+
+# Parameters that must be integers (sizes, radii, steps); the rest are floats
+INTEGER_PARAMETERS = ('crack_kernel_length', 'crack_min_area', 'porosity_median_size',
+                      'porosity_min_radius', 'porosity_max_radius', 'porosity_radius_step',
+                      'circularity_step_degrees', 'slag_min_area')
+
+
+def _normalize(settings: Dict) -> Dict:
+    """Full, type-checked settings: unset parameters take the default profile's value."""
+    unknown = set(settings) - set(DEFAULT_PROFILE)
+    if unknown:
+        raise ValueError(f"Unknown profile parameter(s): {', '.join(sorted(unknown))}")
+    settings = dict(DEFAULT_PROFILE, **settings)
+    for name, value in settings.items():
+        if name in ('name', 'version'):
+            settings[name] = str(value)
+        elif name in INTEGER_PARAMETERS:
+            if int(value) != value or value < 1:
+                raise ValueError(f"Profile parameter {name} must be a positive integer")
+            settings[name] = int(value)
+        else:
+            settings[name] = float(value)
+    if settings['porosity_median_size'] % 2 == 0:
+        raise ValueError("Profile parameter porosity_median_size must be odd")
+    if settings['porosity_min_radius'] >= settings['porosity_max_radius']:
+        raise ValueError("porosity_min_radius must be below porosity_max_radius")
+    return settings
+
+
+class DetectorProfile:
+    """A validated profile with the tables its stages need, built once."""
+
+    def __init__(self, settings: Dict):
+        settings = _normalize(settings)
+        self.settings = settings
+        for name, value in settings.items():
+            setattr(self, name, value)
+
+        self.crack_kernel = np.ones((self.crack_kernel_length, 1), np.uint8)
+        self.crack_kernel.setflags(write=False)
+        self.porosity_radii = tuple(range(self.porosity_min_radius, self.porosity_max_radius,
+                                          self.porosity_radius_step))
+        # Fewer dark pixels than this cannot give a dark median anywhere
+        self.porosity_dark_rank = window_rank(self.porosity_median_size, 50)
+
+        # Warm the shared Hough and perimeter tables for this radius range
+        offset_table(self.porosity_radii, ANGLE_BINS)
+        for radius in self.porosity_radii:
+            perimeter_offsets(radius, self.circularity_step_degrees)
+
+    @property
+    def key(self) -> str:
+        return f"{self.name}-{self.version}"
+
+    def replace(self, **overrides) -> 'DetectorProfile':
+        """This profile with some parameters changed (compiled and cached like any other)."""
+        return compile_profile(dict(self.settings, **overrides))
+
+    def __repr__(self):
+        return f"DetectorProfile({self.key!r})"
+
+
+@lru_cache(maxsize=64)
+def _compile(items) -> DetectorProfile:
+    return DetectorProfile(dict(items))
+
+
+def compile_profile(profile: Union[str, Dict, DetectorProfile] = None) -> DetectorProfile:
+    """
+    Compiled profile for a built-in profile name, a settings dict (unset
+    parameters default) or an already compiled profile.
+    """
+    if isinstance(profile, DetectorProfile):
+        return profile
+    if profile is None:
+        profile = DEFAULT_PROFILE
+    if isinstance(profile, str):
+        if profile not in BUILTIN_PROFILES:
+            raise ValueError(f"Unknown detector profile: {profile}")
+        profile = BUILTIN_PROFILES[profile]
+    # Normalize first, so equal settings share one compiled profile
+    return _compile(tuple(sorted(_normalize(profile).items())))
+
+
+class ProfileStore:
+    """Built-in profiles plus those in a JSON file, reloaded when the file changes."""
+
+    def __init__(self, path: str = None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._stamp = None
+        # Profile settings and the profiles compiled from them so far, swapped together
+        self._state = (dict(BUILTIN_PROFILES), {})
+
+    def get(self, name: str) -> DetectorProfile:
+        """Compiled profile by name."""
+        profiles, compiled = self._current()
+        if name not in compiled:
+            if name not in profiles:
+                raise ValueError(f"Unknown detector profile: {name}")
+            compiled[name] = compile_profile(dict(profiles[name], name=name))
+        return compiled[name]
+
+    def names(self) -> List[str]:
+        return sorted(self._current()[0])
+
+    def _current(self):
+        if self.path is None:
+            return self._state
+        try:
+            stat = os.stat(self.path)
+            stamp = (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            stamp = None
+        if stamp != self._stamp:
+            with self._lock:
+                if stamp != self._stamp:
+                    self._state = (self._load(stamp), {})
+                    self._stamp = stamp
+        return self._state
+
+    def _load(self, stamp) -> Dict:
+        """Built-in profiles updated from the file; a bad file keeps the previous profiles."""
+        profiles = dict(BUILTIN_PROFILES)
+        if stamp is None:
+            return profiles
+        try:
+            with open(self.path, 'r') as f:
+                loaded = json.load(f)
+            for name, settings in loaded.items():
+                # Validate now, so a bad edit is reported once and never reaches a request
+                compile_profile(dict(settings, name=name))
+                profiles[name] = dict(settings, name=name)
+        except Exception as e:
+            print(f"Error loading detector profiles from {self.path}: {e}")
+            return self._state[0]
+        return profiles
@@ -1,14 +1,47 @@
+import copy
 import os
+import threading
+from collections import OrderedDict
 import numpy as np
 from PIL import Image, ImageFilter, ImageEnhance
 import math
 import random
 
+from utils.convolution import SOBEL_X, SOBEL_Y, convolve2d, gaussian_kernel
+from utils.rank_filter import rank_filter
+from utils import morphology
+from utils.labeling import component_stats
+from utils.hough import hough_circles, perimeter_support
+from utils.nms import boxes_from_detections, nms, soft_nms
+from utils.tiling import open_tile_source, tile_layout, tile_size_for_budget, to_grayscale
+from utils.profiling import StageProfiler
+from utils.pyramid import downsample, transitions, candidate_layout
+from utils.scheduler import SharedBuffers, StageScheduler
+from models.profiles import DEFAULT_PROFILE, compile_profile
+
 class YOLODetector:
-    def __init__(self, model_path=None):
+    # Pipeline stages, in order, as reported to progress callbacks
+    STAGES = ('content', 'cracks', 'porosity', 'slag', 'nms', 'bounds')
+    
+    # Independent defect detectors; requests may select a subset
+    DETECTORS = ('cracks', 'porosity', 'slag')
+    
+    # Fixed structuring elements and kernels, built once and shared read-only;
+    # profile-dependent ones are compiled with the profile (models.profiles)
+    CONTENT_KERNEL = np.ones((5, 5), np.uint8)
+    CONTENT_KERNEL.setflags(write=False)
+    BACKGROUND_KERNEL = np.ones((9, 9)) / 81
+    BACKGROUND_KERNEL.setflags(write=False)
+    
+    # Profile variants (with_profile) kept per detector, least recently used dropped first
+    MAX_PROFILE_VARIANTS = 8
+    
+    def __init__(self, model_path=None, profile=None):
         """
         Initialize the welding defect detector.
         This uses advanced image processing algorithms to detect welding defects.
+        profile is a models.profiles profile (name, settings or compiled) with
+        the stage thresholds; the default profile if None.
         """
         # Define defect types for welding inspection
         self.defect_classes = {
@@ -23,27 +56,184 @@ class YOLODetector:
         # Reverse mapping for class names
         self.class_names = {v: k for k, v in self.defect_classes.items()}
         
-        # Detection thresholds
-        self.confidence_threshold = 0.5
-        self.nms_threshold = 0.4
-        
-    def detect_defects(self, image):
+        # Identifies the detection logic; part of the result cache key
+        self.model_version = "default-1.0.0"
+        
+        # Detection thresholds and stage parameters, with their precomputed tables
+        self.profile = profile
+        self._variants = OrderedDict()
+        self._variants_lock = threading.Lock()
+        # The detector a profile variant was made from; it owns the stage threads
+        self._parent = None
+        
+        # Films whose working set exceeds this budget are processed in tiles
+        self.tile_memory_budget_mb = 1024
+        self.tile_overlap = 128
+        
+        # Coarse-to-fine mode: candidates are found on a level reduced by this
+        # factor and only their cells are searched at full resolution (1 = off)
+        self.pyramid_factor = 1
+        self.pyramid_cell_size = 256
+        self.pyramid_margin = 64
+        self.pyramid_contrast = 20
+        
+        # Threads running the selected detectors concurrently (1 = one after another)
+        self.stage_workers = min(len(self.DETECTORS), os.cpu_count() or 1)
+        self._scheduler = None
+        self._scheduler_lock = threading.Lock()
+        
+    @property
+    def profile(self):
+        """The compiled parameter profile; may be set to a profile name, settings or compiled profile."""
+        return self._profile
+    
+    @profile.setter
+    def profile(self, profile):
+        self._profile = compile_profile(profile)
+    
+    @property
+    def confidence_threshold(self):
+        return self._profile.confidence_threshold
+    
+    @confidence_threshold.setter
+    def confidence_threshold(self, value):
+        self._profile = self._profile.replace(confidence_threshold=value)
+    
+    @property
+    def nms_threshold(self):
+        return self._profile.nms_threshold
+    
+    @nms_threshold.setter
+    def nms_threshold(self, value):
+        self._profile = self._profile.replace(nms_threshold=value)
+    
+    def configure(self, settings):
+        """
+        Apply settings as returned by get_config(); profile parameters
+        (e.g. confidence_threshold) may also be given on their own.
+        """
+        config = self.get_config()
+        overrides = {}
+        for name, value in settings.items():
+            if name in config:
+                if isinstance(config[name], (int, float)) and (
+                        isinstance(value, bool) or not isinstance(value, (int, float))):
+                    raise ValueError(f"Detector setting {name} must be a number")
+                setattr(self, name, value)
+            elif name in DEFAULT_PROFILE:
+                overrides[name] = value
+            else:
+                raise ValueError(f"Unknown detector setting: {name}")
+        if overrides:
+            self.profile = self.profile.replace(**overrides)
+        # Variants were copied from the previous settings
+        self._drop_variants()
+        return self
+    
+    def with_profile(self, profile):
+        """
+        This detector running another profile. Variants are cached per
+        profile (the MAX_PROFILE_VARIANTS most recently used) and share
+        everything else, including the stage threads, so switching profiles
+        per request costs a lookup.
+        """
+        if self._parent is not None:
+            return self._parent.with_profile(profile)
+        profile = compile_profile(profile)
+        if profile is self._profile:
+            return self
+        with self._variants_lock:
+            variant = self._variants.get(profile)
+            if variant is not None:
+                self._variants.move_to_end(profile)
+                return variant
+            variant = copy.copy(self)
+            variant._profile = profile
+            variant._variants = OrderedDict()
+            variant._variants_lock = threading.Lock()
+            variant._scheduler = None
+            variant._parent = self
+            self._variants[profile] = variant
+            while len(self._variants) > self.MAX_PROFILE_VARIANTS:
+                self._variants.popitem(last=False)
+        return variant
+    
+    def _drop_variants(self):
+        with self._variants_lock:
+            self._variants.clear()
+    
+    @classmethod
+    def for_model(cls, model, profile_store=None):
+        """
+        Detector configured with a model registry record's detector_config.
+        The config may name its profile rather than spell it out; names are
+        looked up in profile_store (a models.profiles.ProfileStore) if given.
+        Raises ValueError if the config cannot be applied.
+        """
+        detector = cls()
+        settings = dict(model.get('detector_config') or {})
+        if isinstance(settings.get('profile'), str) and profile_store is not None:
+            settings['profile'] = profile_store.get(settings['profile'])
+        detector.configure(settings)
+        # Results of different models never share result cache entries
+        detector.model_version = f"{model['id']}-{model['version']}"
+        return detector
+    
+    def get_config(self):
+        """Settings that change detection output (used to key cached results)."""
+        return {
+            'model_version': self.model_version,
+            'profile': dict(self.profile.settings),
+            'tile_memory_budget_mb': self.tile_memory_budget_mb,
+            'tile_overlap': self.tile_overlap,
+            'pyramid_factor': self.pyramid_factor,
+            'pyramid_cell_size': self.pyramid_cell_size,
+            'pyramid_margin': self.pyramid_margin,
+            'pyramid_contrast': self.pyramid_contrast
+        }
+    
+    def detect_defects(self, image, progress_callback=None, profiler=None, detectors=None,
+                       screening=None):
         """
         Detect welding defects in the image using advanced image processing.
         This implementation uses realistic image analysis techniques.
+        progress_callback(stage), if given, is called as each of STAGES starts; the
+        concurrent detector stages call progress_callback(stage, 'started') and
+        progress_callback(stage, 'completed') instead (see StageScheduler.run).
+        profiler, a StageProfiler, if given, times each stage and counts its candidates.
+        detectors limits the run to a subset of DETECTORS (default: all).
+        screening, if given, is a dict that receives the pre-screen outcome:
+        'fast_path' and the 'skipped' detectors with the reason for each.
+        image may be a PIL image or a uint8 (H, W) or (H, W, 3) array.
         """
+        report = progress_callback or (lambda stage, state='running': None)
+        profiler = profiler or StageProfiler(enabled=False)
+        detectors = self.select_detectors(detectors)
+        
         # Convert PIL image to numpy array
-        img_array = np.array(image)
+        img_array = np.asarray(image)
+        image_size = (img_array.shape[1], img_array.shape[0])
+        
+        # Very large films go through the tiled path to bound memory
+        tile_size = tile_size_for_budget(self.tile_memory_budget_mb, self.tile_overlap)
+        if image_size[0] * image_size[1] > tile_size * tile_size:
+            return self.detect_defects_tiled(img_array, tile_size=tile_size,
+                                             progress_callback=progress_callback,
+                                             profiler=profiler, detectors=detectors,
+                                             screening=screening)
+        if self.pyramid_factor > 1:
+            return self.detect_defects_pyramid(img_array, progress_callback=progress_callback,
+                                               profiler=profiler, detectors=detectors,
+                                               screening=screening)
         
         # Convert to grayscale for analysis
-        if len(img_array.shape) == 3:
-            gray = np.dot(img_array[...,:3], [0.2989, 0.5870, 0.1140])
-        else:
-            gray = img_array
+        gray = to_grayscale(img_array)
             
         # Detect the actual radiographic content area (exclude dark borders)
-        content_mask = self._detect_radiographic_content(gray)
-        content_bounds = self._get_content_bounds(content_mask)
+        report('content')
+        with profiler.stage('content'):
+            content_mask = self._detect_radiographic_content(gray)
+            content_bounds = self._get_content_bounds(content_mask)
 
         # Only process the actual X-ray content area
         if content_bounds:
@@ -52,23 +242,13 @@ class YOLODetector:
             roi_size = (x_max - x_min, y_max - y_min)
         else:
             roi_gray = gray
-            roi_size = image.size
+            roi_size = image_size
             x_min, y_min = 0, 0
 
-        # Perform multiple detection algorithms on ROI only
-        detections = []
-
-        # Detect cracks using edge detection and morphological operations
-        crack_detections = self._detect_cracks(roi_gray, roi_size)
-        detections.extend(crack_detections)
-
-        # Detect porosity using blob detection
-        porosity_detections = self._detect_porosity(roi_gray, roi_size)
-        detections.extend(porosity_detections)
-
-        # Detect slag inclusions using intensity analysis
-        slag_detections = self._detect_slag_inclusions(roi_gray, roi_size)
-        detections.extend(slag_detections)
+        # Perform the selected detection algorithms on ROI only: cracks (edges and
+        # morphology), porosity (blob detection) and slag (intensity analysis)
+        screen = self._new_screen()
+        detections = self._run_detectors(roi_gray, roi_size, detectors, report, profiler, screen)
 
         # Adjust detection coordinates back to full image space
         if content_bounds:
@@ -81,46 +261,325 @@ class YOLODetector:
                     detection['bbox'][1] += y_min
 
         # Apply non-maximum suppression to remove overlapping detections
-        filtered_detections = self._apply_nms(detections)
+        report('nms')
+        with profiler.stage('nms') as stage:
+            filtered_detections = self._apply_nms(detections)
+            stage.add_candidates(len(filtered_detections))
 
         # Ensure all detections are within content boundaries
-        filtered_detections = self._constrain_to_content_bounds(filtered_detections, image.size, content_bounds)
+        report('bounds')
+        with profiler.stage('bounds') as stage:
+            filtered_detections = self._constrain_to_content_bounds(filtered_detections, image_size, content_bounds)
+            stage.add_candidates(len(filtered_detections))
 
+        self._finish_screen(screen, screening)
         return filtered_detections
     
-    def _detect_cracks(self, gray_image, image_size):
+    def detect_defects_tiled(self, source, tile_size=None, overlap=None, progress_callback=None,
+                             profiler=None, detectors=None, screening=None):
+        """
+        Detect welding defects one overlapping tile at a time.
+        
+        `source` may be a PIL image, an image array or a file path; uncompressed
+        files are memory-mapped so tiles are read from disk as they are needed.
+        Peak memory follows the tile size rather than the film size.
+        """
+        report = progress_callback or (lambda stage, state='running': None)
+        profiler = profiler or StageProfiler(enabled=False)
+        detectors = self.select_detectors(detectors)
+        source = open_tile_source(source)
+        if overlap is None:
+            overlap = self.tile_overlap
+        if tile_size is None:
+            tile_size = tile_size_for_budget(self.tile_memory_budget_mb, overlap)
+        
+        report('content')
+        with profiler.stage('content'):
+            content_bounds = self._tiled_content_bounds(source, tile_size)
+        bounds = content_bounds or (0, 0, source.width, source.height)
+        
+        detections = []
+        screen = self._new_screen()
+        for core, tile in tile_layout(bounds, tile_size, overlap):
+            with profiler.stage('read'):
+                tile_gray = source.read(tile)
+            detections.extend(self._detect_in_tile(tile_gray, core, tile, detectors, report, profiler, screen))
+        
+        # Merge detections across tile seams
+        report('nms')
+        with profiler.stage('nms') as stage:
+            filtered_detections = self._apply_nms(detections)
+            stage.add_candidates(len(filtered_detections))
+        
+        report('bounds')
+        with profiler.stage('bounds') as stage:
+            filtered_detections = self._constrain_to_content_bounds(filtered_detections, source.size, content_bounds)
+            stage.add_candidates(len(filtered_detections))
+        
+        self._finish_screen(screen, screening)
+        return filtered_detections
+    
+    def detect_defects_pyramid(self, image, factor=None, progress_callback=None, profiler=None,
+                               detectors=None, screening=None):
+        """
+        Detect welding defects coarse-to-fine.
+        
+        Content bounds and candidate regions come from a copy of the film
+        reduced `factor` times; the detector stages then run at full resolution
+        on candidate cells only, so mostly clean welds cost a fraction of a
+        full pass. Features with no coarse-level signature can be missed.
+        """
+        report = progress_callback or (lambda stage, state='running': None)
+        profiler = profiler or StageProfiler(enabled=False)
+        detectors = self.select_detectors(detectors)
+        factor = factor or self.pyramid_factor
+        
+        gray = to_grayscale(np.asarray(image))
+        height, width = gray.shape
+        
+        report('content')
+        with profiler.stage('content'):
+            coarse = downsample(gray, factor)
+            content_bounds = self._coarse_content_bounds(coarse, factor, (height, width))
+        bounds = content_bounds or (0, 0, width, height)
+        
+        with profiler.stage('candidates') as stage:
+            layout = candidate_layout(self._pyramid_candidates(coarse), factor, bounds,
+                                      self.pyramid_cell_size, self.pyramid_margin)
+            stage.add_candidates(len(layout))
+        
+        detections = []
+        screen = self._new_screen()
+        if not layout:
+            for name in detectors:
+                screen['skipped'][name] = [0, 'no candidate regions at the coarse level']
+        for core, tile in layout:
+            tile_gray = gray[tile[1]:tile[3], tile[0]:tile[2]]
+            detections.extend(self._detect_in_tile(tile_gray, core, tile, detectors, report, profiler, screen))
+        
+        report('nms')
+        with profiler.stage('nms') as stage:
+            filtered_detections = self._apply_nms(detections)
+            stage.add_candidates(len(filtered_detections))
+        
+        report('bounds')
+        with profiler.stage('bounds') as stage:
+            filtered_detections = self._constrain_to_content_bounds(filtered_detections, (width, height), content_bounds)
+            stage.add_candidates(len(filtered_detections))
+        
+        self._finish_screen(screen, screening)
+        return filtered_detections
+    
+    def select_detectors(self, detectors=None):
+        """Validate a detector selection; returns it in DETECTORS order."""
+        if detectors is None:
+            return self.DETECTORS
+        unknown = set(detectors) - set(self.DETECTORS)
+        if unknown:
+            raise ValueError(f"Unknown detector(s): {', '.join(sorted(unknown))}")
+        return tuple(name for name in self.DETECTORS if name in detectors)
+    
+    def _run_detectors(self, gray_image, image_size, detectors, report, profiler, screen):
+        """Run the selected detectors on shared buffers; detections in DETECTORS order."""
+        buffers = self._stage_buffers(gray_image)
+        methods = {
+            'cracks': self._detect_cracks,
+            'porosity': self._detect_porosity,
+            'slag': self._detect_slag_inclusions
+        }
+        
+        # Drop detectors that provably cannot report anything on this region
+        with profiler.stage('prescreen') as stage:
+            skipped = self._prescreen(buffers, detectors)
+            stage.add_candidates(len(detectors) - len(skipped))
+        screen['regions'] += 1
+        for name, reason in skipped.items():
+            screen['skipped'].setdefault(name, [0, reason])[0] += 1
+        
+        tasks = [(name, lambda method=methods[name]: method(gray_image, image_size, buffers))
+                 for name in detectors if name not in skipped]
+        
+        detections = []
+        for found in self._stage_scheduler().run(tasks, report, profiler):
+            detections.extend(found)
+        return detections
+    
+    def _stage_scheduler(self):
+        """The scheduler for stage_workers threads; one it replaces is shut down."""
+        if self._parent is not None:
+            return self._parent._stage_scheduler()
+        with self._scheduler_lock:
+            scheduler = self._scheduler
+            if scheduler is None or scheduler.max_workers != self.stage_workers:
+                if scheduler is not None:
+                    scheduler.shutdown(wait=False)
+                scheduler = self._scheduler = StageScheduler(self.stage_workers)
+            return scheduler
+    
+    def close(self):
+        """
+        Release the stage threads this detector and its profile variants
+        share. Detection still works afterwards, running the stages one at
+        a time until the detector is reconfigured.
+        """
+        if self._parent is not None:
+            return
+        with self._scheduler_lock:
+            if self._scheduler is not None:
+                self._scheduler.shutdown(wait=False)
+        self._drop_variants()
+    
+    def _stage_buffers(self, gray_image):
+        """Intermediates shared by the detectors, each computed at most once."""
+        return SharedBuffers(gray_image, {
+            'normalized': lambda buffers: buffers.image / 255.0,
+            'edges': lambda buffers: self._edge_mask(buffers.image)
+        })
+    
+    def _edge_mask(self, gray_image):
+        """Non-zero Sobel response of the Gaussian-blurred image."""
+        # Crack segmentation keys on exact zeros of the gradient, which depend
+        # on float64 rounding; the float64 buffers live only inside this call
+        blurred = self._gaussian_blur(gray_image.astype(np.float64), 3)
+        return self._sobel_edge_detection(blurred) != 0
+    
+    def _prescreen(self, buffers, detectors):
+        """
+        Detectors whose preconditions fail on these buffers, with the reason.
+        
+        Every test is exact: a skipped detector would have returned nothing.
+        """
+        profile = self.profile
+        normalized = buffers.get('normalized')
+        flat = normalized.size == 0 or normalized.min() == normalized.max()
+        skipped = {}
+        
+        if 'porosity' in detectors:
+            # A dark median needs more than `rank` dark pixels in its median window,
+            # and a mask that is dark everywhere has no boundary to vote with
+            dark = np.count_nonzero(normalized < profile.porosity_threshold)
+            if flat or dark <= profile.porosity_dark_rank or dark == normalized.size:
+                skipped['porosity'] = 'no dark blobs under the porosity threshold'
+        
+        if 'slag' in detectors:
+            # Slag regions need more than slag_min_area pixels above the threshold
+            if flat or np.count_nonzero(normalized > profile.slag_threshold) <= profile.slag_min_area:
+                skipped['slag'] = 'too few bright pixels above the slag threshold'
+        
+        if 'cracks' in detectors:
+            # Closing with the Nx1 kernel grows the edge set at most N times,
+            # and crack components need more than crack_min_area pixels
+            edges = np.count_nonzero(buffers.get('edges'))
+            if flat or edges * profile.crack_kernel_length <= profile.crack_min_area:
+                skipped['cracks'] = 'gradient energy too low for cracks'
+        
+        return skipped
+    
+    def _new_screen(self):
+        """Pre-screen tally over the regions (ROI, tiles or cells) of one film."""
+        return {'regions': 0, 'skipped': {}}
+    
+    def _finish_screen(self, screen, screening):
+        """Report detectors skipped on every region of the film."""
+        if screening is None:
+            return
+        skipped = {name: reason for name, (count, reason) in screen['skipped'].items()
+                   if count >= screen['regions']}
+        screening['fast_path'] = bool(skipped)
+        screening['skipped'] = skipped
+    
+    def _detect_in_tile(self, tile_gray, core, tile, detectors, report, profiler, screen):
+        """Run the defect stages on one tile; return detections centred in its core."""
+        tile_size_xy = (tile[2] - tile[0], tile[3] - tile[1])
+        
+        # Stage records accumulate over tiles
+        tile_detections = self._run_detectors(tile_gray, tile_size_xy, detectors, report, profiler, screen)
+        
+        # Move to full image space; keep detections centred in this tile's core
+        # so features in the overlap are reported by one tile only
+        detections = []
+        for detection in tile_detections:
+            bbox = detection['bbox']
+            bbox['x'] += tile[0]
+            bbox['y'] += tile[1]
+            center_x = bbox['x'] + bbox['width'] / 2
+            center_y = bbox['y'] + bbox['height'] / 2
+            if core[0] <= center_x < core[2] and core[1] <= center_y < core[3]:
+                detections.append(detection)
+        
+        return detections
+    
+    def _coarse_content_bounds(self, coarse, factor, shape):
+        """Full-resolution content bounds from a reduced level."""
+        hist = np.histogram(coarse.ravel(), bins=256, range=(0, 256))[0]
+        mask = self._content_mask(coarse, self._content_threshold(hist, coarse.size))
+        
+        # Scale the row/column occupancy up so padding stays in full-res pixels
+        rows = np.repeat(mask.any(axis=1), factor)[:shape[0]]
+        cols = np.repeat(mask.any(axis=0), factor)[:shape[1]]
+        return self._bounds_from_projections(rows, cols)
+    
+    def _pyramid_candidates(self, coarse):
+        """Coarse pixels where a defect stage could respond."""
+        normalized = coarse / 255.0
+        profile = self.profile
+        
+        # Edges of the porosity (dark) and slag (bright) threshold masks
+        candidates = (transitions(normalized < profile.porosity_threshold) |
+                      transitions(normalized > profile.slag_threshold))
+        
+        # Local contrast against the surrounding background (cracks)
+        background = self._convolve(coarse, self.BACKGROUND_KERNEL)
+        candidates |= np.abs(coarse - background) > self.pyramid_contrast
+        
+        return candidates
+    
+    def _tiled_content_bounds(self, source, tile_size):
+        """Content bounds computed tile by tile, matching the whole-image result."""
+        threshold = self._content_threshold(source.histogram(), source.width * source.height)
+        
+        # The 5x5 closing reaches 4 pixels, so a 4 pixel margin makes seams exact
+        margin = 4
+        rows = np.zeros(source.height, dtype=bool)
+        cols = np.zeros(source.width, dtype=bool)
+        for core, tile in tile_layout((0, 0, source.width, source.height), tile_size, margin):
+            mask = self._content_mask(source.read(tile), threshold)
+            core_mask = mask[core[1] - tile[1]:core[3] - tile[1], core[0] - tile[0]:core[2] - tile[0]]
+            rows[core[1]:core[3]] |= core_mask.any(axis=1)
+            cols[core[0]:core[2]] |= core_mask.any(axis=0)
+        
+        return self._bounds_from_projections(rows, cols)
+    
+    def _detect_cracks(self, gray_image, image_size, buffers=None):
         """
         Detect cracks using edge detection and morphological operations.
         """
         width, height = image_size
         detections = []
+        buffers = buffers or self._stage_buffers(gray_image)
+        profile = self.profile
         
-        # Apply Gaussian blur to reduce noise
-        blurred = self._gaussian_blur(gray_image, 3)
-        
-        # Edge detection using Sobel operator
-        edges = self._sobel_edge_detection(blurred)
+        # Sobel edges of the Gaussian-blurred image (shared boolean mask)
+        edges = buffers.get('edges')
         
-        # Morphological operations to enhance linear features
-        kernel = np.ones((7, 1), np.uint8)  # Vertical kernel for cracks
-        morphed = self._morphological_closing(edges, kernel)
+        # Morphological operations to enhance linear features (vertical kernel for cracks)
+        morphed = self._morphological_closing(edges, profile.crack_kernel)
         
         # Find contours that could be cracks
         contours = self._find_contours(morphed)
         
-        for contour in contours:
+        for area, box in zip(contours['area'], contours['bbox']):
             # Calculate contour properties
-            area = self._contour_area(contour)
-            aspect_ratio = self._contour_aspect_ratio(contour)
+            area = int(area)
+            bbox = self._component_bounding_box(box)
+            aspect_ratio = self._component_aspect_ratio(bbox)
             
             # Filter based on crack characteristics
-            if area > 100 and aspect_ratio > 3:  # Long, thin features
-                bbox = self._contour_bounding_box(contour)
-                
+            if area > profile.crack_min_area and aspect_ratio > profile.crack_min_aspect_ratio:  # Long, thin features
                 # Calculate confidence based on crack-like features
                 confidence = min(0.95, 0.6 + (aspect_ratio / 10) + (area / 1000))
                 
-                if confidence > self.confidence_threshold:
+                if confidence > profile.confidence_threshold:
                     detections.append({
                         'class': 'crack',
                         'confidence': confidence,
@@ -129,21 +588,25 @@ class YOLODetector:
         
         return detections
     
-    def _detect_porosity(self, gray_image, image_size):
+    def _detect_porosity(self, gray_image, image_size, buffers=None):
         """
         Detect porosity using blob detection algorithms.
         """
         width, height = image_size
         detections = []
+        buffers = buffers or self._stage_buffers(gray_image)
+        profile = self.profile
         
-        # Apply median filter to reduce noise
-        filtered = self._median_filter(gray_image, 5)
+        # Apply median filter to reduce noise (scaling commutes with the median)
+        filtered = self._median_filter(buffers.get('normalized'), profile.porosity_median_size)
         
         # Threshold to find dark regions (porosity appears as dark spots)
-        binary = self._threshold_binary(filtered, 0.4)
+        binary = self._threshold_binary(filtered, profile.porosity_threshold)
         
-        # Find circular features using Hough transform approximation
-        circles = self._detect_circular_features(binary, min_radius=5, max_radius=50)
+        # Find circular features using Hough transform
+        circles = self._detect_circular_features(binary, min_radius=profile.porosity_min_radius,
+                                                 max_radius=profile.porosity_max_radius,
+                                                 radius_step=profile.porosity_radius_step)
         
         for circle in circles:
             x, y, radius = circle
@@ -157,10 +620,10 @@ class YOLODetector:
             }
             
             # Calculate confidence based on circularity and size
-            circularity = self._calculate_circularity(circle, binary)
-            confidence = min(0.95, 0.5 + circularity * 0.4 + (radius / 50) * 0.1)
+            circularity = self._calculate_circularity(circle, binary, profile.circularity_step_degrees)
+            confidence = min(0.95, 0.5 + circularity * 0.4 + (radius / profile.porosity_max_radius) * 0.1)
             
-            if confidence > self.confidence_threshold:
+            if confidence > profile.confidence_threshold:
                 detections.append({
                     'class': 'porosity',
                     'confidence': confidence,
@@ -169,15 +632,17 @@ class YOLODetector:
         
         return detections
     
-    def _detect_slag_inclusions(self, gray_image, image_size):
+    def _detect_slag_inclusions(self, gray_image, image_size, buffers=None):
         """
         Detect slag inclusions using intensity analysis.
         """
         width, height = image_size
         detections = []
+        buffers = buffers or self._stage_buffers(gray_image)
+        profile = self.profile
         
         # Find bright irregular regions
-        bright_regions = self._find_bright_regions(gray_image, threshold=0.7)
+        bright_regions = self._find_bright_regions(buffers.get('normalized'), threshold=profile.slag_threshold)
         
         for region in bright_regions:
             # Calculate region properties
@@ -186,10 +651,10 @@ class YOLODetector:
             bbox = region['bbox']
             
             # Filter based on slag characteristics
-            if area > 50 and irregularity > 0.3:
+            if area > profile.slag_min_area and irregularity > profile.slag_min_irregularity:
                 confidence = min(0.95, 0.5 + irregularity * 0.3 + (area / 1000) * 0.2)
                 
-                if confidence > self.confidence_threshold:
+                if confidence > profile.confidence_threshold:
                     detections.append({
                         'class': 'slag',
                         'confidence': confidence,
@@ -207,198 +672,86 @@ class YOLODetector:
     
     def _sobel_edge_detection(self, image):
         """Apply Sobel edge detection."""
-        # Sobel kernels
-        sobel_x = np.array([[-1, 0, 1], [-2, 0, 2], [-1, 0, 1]])
-        sobel_y = np.array([[-1, -2, -1], [0, 0, 0], [1, 2, 1]])
-        
         # Apply Sobel operators
-        grad_x = self._convolve(image, sobel_x)
-        grad_y = self._convolve(image, sobel_y)
-        
-        # Calculate gradient magnitude
-        return np.sqrt(grad_x**2 + grad_y**2)
-    
-    def _median_filter(self, image, kernel_size):
-        """Apply median filter."""
-        height, width = image.shape
-        filtered = np.zeros_like(image)
-        pad = kernel_size // 2
-        
-        for i in range(pad, height - pad):
-            for j in range(pad, width - pad):
-                window = image[i-pad:i+pad+1, j-pad:j+pad+1]
-                filtered[i, j] = np.median(window)
-        
-        return filtered
-    
-    def _threshold_binary(self, image, threshold):
-        """Apply binary thresholding."""
-        normalized = image / 255.0
-        return (normalized < threshold).astype(np.uint8)
-    
-    def _detect_circular_features(self, binary_image, min_radius=5, max_radius=50):
-        """Detect circular features using a simplified Hough transform."""
-        height, width = binary_image.shape
-        circles = []
-        
-        # Simplified circle detection
-        for y in range(max_radius, height - max_radius, 10):
-            for x in range(max_radius, width - max_radius, 10):
-                for r in range(min_radius, max_radius, 5):
-                    if self._is_circle_at(binary_image, x, y, r):
-                        circles.append((x, y, r))
-        
-        return circles
-    
-    def _is_circle_at(self, binary_image, cx, cy, radius):
-        """Check if there's a circle at the given position."""
-        points_on_circle = 0
-        total_points = 0
-        
-        for angle in range(0, 360, 15):
-            x = int(cx + radius * np.cos(np.radians(angle)))
-            y = int(cy + radius * np.sin(np.radians(angle)))
-            
-            if 0 <= x < binary_image.shape[1] and 0 <= y < binary_image.shape[0]:
-                total_points += 1
-                if binary_image[y, x] > 0:
-                    points_on_circle += 1
-        
-        return (points_on_circle / total_points) > 0.6 if total_points > 0 else False
+        grad_x = self._convolve(image, SOBEL_X)
+        grad_y = self._convolve(image, SOBEL_Y)
+        
+        # Calculate gradient magnitude in place, without squared temporaries
+        np.multiply(grad_x, grad_x, out=grad_x)
+        np.multiply(grad_y, grad_y, out=grad_y)
+        grad_x += grad_y
+        return np.sqrt(grad_x, out=grad_x)
     
-    def _find_bright_regions(self, image, threshold=0.7):
-        """Find bright regions in the image."""
-        normalized = image / 255.0
-        bright_mask = (normalized > threshold).astype(np.uint8)
-        
-        # Find connected components
-        regions = []
-        visited = np.zeros_like(bright_mask)
-        
-        for y in range(bright_mask.shape[0]):
-            for x in range(bright_mask.shape[1]):
-                if bright_mask[y, x] and not visited[y, x]:
-                    region = self._flood_fill(bright_mask, visited, x, y)
-                    if len(region) > 10:  # Minimum region size
-                        bbox = self._region_bounding_box(region)
-                        area = len(region)
-                        irregularity = self._calculate_irregularity(region)
-                        
-                        regions.append({
-                            'area': area,
-                            'bbox': bbox,
-                            'irregularity': irregularity
-                        })
-        
-        return regions
+    def _median_filter(self, image, kernel_size, percentile=50):
+        """Apply median filter (or any percentile rank filter)."""
+        # Interior pixels only; the border of width kernel_size // 2 stays 0
+        return rank_filter(image, kernel_size, percentile)
     
-    def _flood_fill(self, mask, visited, start_x, start_y):
-        """Flood fill algorithm to find connected regions."""
-        stack = [(start_x, start_y)]
-        region = []
-        
-        while stack:
-            x, y = stack.pop()
-            if (0 <= x < mask.shape[1] and 0 <= y < mask.shape[0] and 
-                mask[y, x] and not visited[y, x]):
-                
-                visited[y, x] = True
-                region.append((x, y))
-                
-                # Add neighbors
-                for dx, dy in [(0, 1), (0, -1), (1, 0), (-1, 0)]:
-                    stack.append((x + dx, y + dy))
-        
-        return region
+    def _threshold_binary(self, normalized, threshold):
+        """Apply binary thresholding to a normalized (0-1) image."""
+        return normalized < threshold
     
-    def _region_bounding_box(self, region):
-        """Calculate bounding box of a region."""
-        if not region:
-            return {'x': 0, 'y': 0, 'width': 0, 'height': 0}
-        
-        xs, ys = zip(*region)
-        min_x, max_x = min(xs), max(xs)
-        min_y, max_y = min(ys), max(ys)
-        
-        return {
-            'x': min_x,
-            'y': min_y,
-            'width': max_x - min_x,
-            'height': max_y - min_y
-        }
+    def _detect_circular_features(self, binary_image, min_radius=5, max_radius=50, radius_step=1):
+        """Detect circular features using a gradient-voting Hough transform."""
+        # Full-resolution centres, one per accumulator peak
+        return hough_circles(binary_image, min_radius=min_radius, max_radius=max_radius,
+                             radius_step=radius_step)
     
-    def _calculate_irregularity(self, region):
-        """Calculate irregularity of a region."""
-        if len(region) < 3:
-            return 0
+    def _find_bright_regions(self, normalized, threshold=0.7):
+        """Find bright regions in a normalized (0-1) image."""
+        bright_mask = normalized > threshold
         
-        # Calculate convex hull area vs actual area
-        area = len(region)
-        hull_area = self._convex_hull_area(region)
+        # Find 4-connected components above the minimum region size
+        _, stats = component_stats(bright_mask, connectivity=4)
+        components = self._select_components(stats, min_area=10)
         
-        return 1 - (area / max(hull_area, 1))
-    
-    def _convex_hull_area(self, points):
-        """Calculate area of convex hull."""
-        # Simplified convex hull area calculation
-        if len(points) < 3:
-            return len(points)
+        regions = []
+        for area, box in zip(components['area'], components['bbox']):
+            bbox = self._component_bounding_box(box)
+            
+            # Bounding box area approximates the convex hull
+            hull_area = bbox['width'] * bbox['height']
+            irregularity = 1 - (area / max(hull_area, 1))
+            
+            regions.append({
+                'area': int(area),
+                'bbox': bbox,
+                'irregularity': float(irregularity)
+            })
         
-        # Use bounding box as approximation
-        xs, ys = zip(*points)
-        return (max(xs) - min(xs)) * (max(ys) - min(ys))
+        return regions
     
-    def _apply_nms(self, detections):
+    def _apply_nms(self, detections, class_aware=False, soft=False):
         """Apply non-maximum suppression to remove overlapping detections."""
         if not detections:
             return detections
         
-        # Sort by confidence
-        sorted_detections = sorted(detections, key=lambda x: x['confidence'], reverse=True)
-        
-        # Apply NMS
-        filtered = []
-        for detection in sorted_detections:
-            overlaps = False
-            for existing in filtered:
-                if self._calculate_iou(detection['bbox'], existing['bbox']) > self.nms_threshold:
-                    overlaps = True
-                    break
-            
-            if not overlaps:
-                filtered.append(detection)
-        
-        return filtered
-    
-    def _calculate_iou(self, bbox1, bbox2):
-        """Calculate Intersection over Union (IoU) of two bounding boxes."""
-        x1 = max(bbox1['x'], bbox2['x'])
-        y1 = max(bbox1['y'], bbox2['y'])
-        x2 = min(bbox1['x'] + bbox1['width'], bbox2['x'] + bbox2['width'])
-        y2 = min(bbox1['y'] + bbox1['height'], bbox2['y'] + bbox2['height'])
-        
-        if x2 <= x1 or y2 <= y1:
-            return 0
-        
-        intersection = (x2 - x1) * (y2 - y1)
-        area1 = bbox1['width'] * bbox1['height']
-        area2 = bbox2['width'] * bbox2['height']
-        union = area1 + area2 - intersection
+        profile = self.profile
+        boxes = boxes_from_detections(detections)
+        scores = np.array([d['confidence'] for d in detections], dtype=np.float64)
+        classes = np.array([d['class'] for d in detections]) if class_aware else None
+        
+        if soft:
+            # Decay overlapping scores and drop what falls below the threshold
+            keep, kept_scores = soft_nms(boxes, scores, profile.nms_threshold,
+                                         score_threshold=profile.confidence_threshold,
+                                         classes=classes)
+            for index, score in zip(keep, kept_scores):
+                detections[index]['confidence'] = float(score)
+        else:
+            keep = nms(boxes, scores, profile.nms_threshold, classes=classes)
         
-        return intersection / union if union > 0 else 0
+        return [detections[index] for index in keep]
     
     def _gaussian_kernel(self, size):
-        """Generate Gaussian kernel."""
-        kernel = np.zeros((size, size))
-        center = size // 2
-        sigma = size / 3
-        
-        for i in range(size):
-            for j in range(size):
-                x, y = i - center, j - center
-                kernel[i, j] = np.exp(-(x**2 + y**2) / (2 * sigma**2))
-        
-        return kernel
+        """Gaussian kernel (read-only, cached per size)."""
+        return gaussian_kernel(size)
+    
+    def _bbox_values(self, bbox):
+        """Return (x, y, width, height) as ints from a dict or list bbox."""
+        if isinstance(bbox, dict):
+            bbox = (bbox['x'], bbox['y'], bbox['width'], bbox['height'])
+        return tuple(int(v) for v in bbox)
     
     def _constrain_to_image_bounds(self, detections, image_size):
         """Ensure all detections are within image boundaries."""
@@ -406,7 +759,7 @@ class YOLODetector:
         constrained_detections = []
         
         for detection in detections:
-            x, y, w, h = detection['bbox']
+            x, y, w, h = self._bbox_values(detection['bbox'])
             
             # Constrain coordinates to image bounds
             x = max(0, min(x, width - 1))
@@ -416,7 +769,7 @@ class YOLODetector:
             
             # Only keep detections that have reasonable size
             if w >= 10 and h >= 10 and x + w <= width and y + h <= height:
-                detection['bbox'] = [x, y, w, h]
+                detection['bbox'] = {'x': x, 'y': y, 'width': w, 'height': h}
                 constrained_detections.append(detection)
         
         return constrained_detections
@@ -428,11 +781,14 @@ class YOLODetector:
         
         # Calculate intensity histogram to find optimal threshold
         hist, bins = np.histogram(gray_image.flatten(), bins=256, range=(0, 256))
+        threshold = self._content_threshold(hist, gray_image.size)
         
-        # Find the threshold that separates dark background from content
+        return self._content_mask(gray_image, threshold)
+    
+    def _content_threshold(self, hist, total_pixels):
+        """Find the threshold that separates dark background from content."""
         # Typically around 30-50 for X-ray images
         cumsum = np.cumsum(hist)
-        total_pixels = gray_image.size
         
         # Find threshold where at least 20% of pixels are above (content area)
         threshold = 30
@@ -441,14 +797,15 @@ class YOLODetector:
                 threshold = i
                 break
         
+        return threshold
+    
+    def _content_mask(self, gray_image, threshold):
+        """Binary mask of the content area, cleaned up with a closing."""
         # Create binary mask of content area
         content_mask = gray_image > threshold
         
-        # Apply morphological operations to clean up the mask
-        kernel = np.ones((5, 5), np.uint8)
-        content_mask = self._morphological_closing(content_mask.astype(np.uint8), kernel)
-        
-        return content_mask.astype(bool)
+        # Apply morphological operations to clean up the mask (boolean in, boolean out)
+        return self._morphological_closing(content_mask, self.CONTENT_KERNEL)
     
     def _get_content_bounds(self, content_mask):
         """Get bounding box of the radiographic content area."""
@@ -459,6 +816,10 @@ class YOLODetector:
         rows = np.any(content_mask, axis=1)
         cols = np.any(content_mask, axis=0)
         
+        return self._bounds_from_projections(rows, cols)
+    
+    def _bounds_from_projections(self, rows, cols):
+        """Padded content bounds from per-row and per-column occupancy."""
         if not np.any(rows) or not np.any(cols):
             return None
         
@@ -467,14 +828,14 @@ class YOLODetector:
         
         # Add small padding to ensure we don't cut off content at edges
         padding = 10
-        height, width = content_mask.shape
+        height, width = len(rows), len(cols)
         
         y_min = max(0, y_min - padding)
         y_max = min(height, y_max + padding)
         x_min = max(0, x_min - padding)
         x_max = min(width, x_max + padding)
         
-        return (x_min, y_min, x_max, y_max)
+        return (int(x_min), int(y_min), int(x_max), int(y_max))
     
     def _constrain_to_content_bounds(self, detections, image_size, content_bounds):
         """Ensure all detections are within the radiographic content area."""
@@ -485,7 +846,7 @@ class YOLODetector:
         constrained_detections = []
         
         for detection in detections:
-            x, y, w, h = detection['bbox']
+            x, y, w, h = self._bbox_values(detection['bbox'])
             
             # Check if detection center is within content bounds
             center_x = x + w // 2
@@ -502,86 +863,29 @@ class YOLODetector:
                 
                 # Only keep detections that have reasonable size
                 if w >= 10 and h >= 10:
-                    detection['bbox'] = [x, y, w, h]
+                    detection['bbox'] = {'x': x, 'y': y, 'width': w, 'height': h}
                     constrained_detections.append(detection)
         
         return constrained_detections
     
     def _convolve(self, image, kernel):
         """Apply convolution operation."""
-        height, width = image.shape
-        k_height, k_width = kernel.shape
-        pad_h, pad_w = k_height // 2, k_width // 2
-        
-        # Pad image
-        padded = np.pad(image, ((pad_h, pad_h), (pad_w, pad_w)), mode='edge')
-        result = np.zeros_like(image)
-        
-        for i in range(height):
-            for j in range(width):
-                result[i, j] = np.sum(padded[i:i+k_height, j:j+k_width] * kernel)
-        
-        return result
+        # Backend (separable, shift-and-add or FFT) is picked from the kernel
+        return convolve2d(image, kernel)
     
     def _find_contours(self, binary_image):
-        """Find contours in binary image."""
-        # Simplified contour finding
-        contours = []
-        visited = np.zeros_like(binary_image)
-        
-        for y in range(binary_image.shape[0]):
-            for x in range(binary_image.shape[1]):
-                if binary_image[y, x] and not visited[y, x]:
-                    contour = self._trace_contour(binary_image, visited, x, y)
-                    if len(contour) > 10:
-                        contours.append(contour)
-        
-        return contours
-    
-    def _trace_contour(self, binary_image, visited, start_x, start_y):
-        """Trace contour starting from a point."""
-        contour = []
-        stack = [(start_x, start_y)]
-        
-        while stack:
-            x, y = stack.pop()
-            if (0 <= x < binary_image.shape[1] and 0 <= y < binary_image.shape[0] and 
-                binary_image[y, x] and not visited[y, x]):
-                
-                visited[y, x] = True
-                contour.append((x, y))
-                
-                # Add 8-connected neighbors
-                for dx in [-1, 0, 1]:
-                    for dy in [-1, 0, 1]:
-                        if dx != 0 or dy != 0:
-                            stack.append((x + dx, y + dy))
-        
-        return contour
-    
-    def _contour_area(self, contour):
-        """Calculate area of contour."""
-        return len(contour)
+        """Find 8-connected regions in binary image and measure them."""
+        _, stats = component_stats(binary_image != 0, connectivity=8)
+        return self._select_components(stats, min_area=10)
     
-    def _contour_aspect_ratio(self, contour):
-        """Calculate aspect ratio of contour."""
-        if len(contour) < 2:
-            return 1
-        
-        bbox = self._contour_bounding_box(contour)
-        width = bbox['width']
-        height = bbox['height']
-        
-        return max(width, height) / max(min(width, height), 1)
+    def _select_components(self, stats, min_area):
+        """Keep only components with more than min_area pixels."""
+        keep = stats['area'] > min_area
+        return {name: values[keep] for name, values in stats.items()}
     
-    def _contour_bounding_box(self, contour):
-        """Calculate bounding box of contour."""
-        if not contour:
-            return {'x': 0, 'y': 0, 'width': 0, 'height': 0}
-        
-        xs, ys = zip(*contour)
-        min_x, max_x = min(xs), max(xs)
-        min_y, max_y = min(ys), max(ys)
+    def _component_bounding_box(self, box):
+        """Convert an (x_min, y_min, x_max, y_max) row to a bbox dict."""
+        min_x, min_y, max_x, max_y = (int(v) for v in box)
         
         return {
             'x': min_x,
@@ -590,59 +894,28 @@ class YOLODetector:
             'height': max_y - min_y
         }
     
-    def _calculate_circularity(self, circle, binary_image):
+    def _component_aspect_ratio(self, bbox):
+        """Calculate aspect ratio of a component bounding box."""
+        width = bbox['width']
+        height = bbox['height']
+        
+        return max(width, height) / max(min(width, height), 1)
+    
+    def _calculate_circularity(self, circle, binary_image, step_degrees=10):
         """Calculate how circular a detected feature is."""
         x, y, radius = circle
         
-        # Check points around the circle
-        circle_points = 0
-        total_points = 0
-        
-        for angle in range(0, 360, 10):
-            px = int(x + radius * np.cos(np.radians(angle)))
-            py = int(y + radius * np.sin(np.radians(angle)))
-            
-            if 0 <= px < binary_image.shape[1] and 0 <= py < binary_image.shape[0]:
-                total_points += 1
-                if binary_image[py, px] > 0:
-                    circle_points += 1
-        
-        return circle_points / total_points if total_points > 0 else 0
+        # Share of the perimeter samples (precomputed offsets) on the feature
+        return perimeter_support(binary_image, x, y, radius, step_degrees=step_degrees)
     
     def _morphological_closing(self, image, kernel):
         """Apply morphological closing operation."""
-        # Simplified morphological closing
-        dilated = self._dilate(image, kernel)
-        return self._erode(dilated, kernel)
+        return morphology.closing(image, kernel)
     
     def _dilate(self, image, kernel):
         """Apply dilation operation."""
-        height, width = image.shape
-        k_height, k_width = kernel.shape
-        pad_h, pad_w = k_height // 2, k_width // 2
-        
-        padded = np.pad(image, ((pad_h, pad_h), (pad_w, pad_w)), mode='constant')
-        result = np.zeros_like(image)
-        
-        for i in range(height):
-            for j in range(width):
-                if np.any(padded[i:i+k_height, j:j+k_width] * kernel):
-                    result[i, j] = 1
-        
-        return result
+        return morphology.dilate(image, kernel)
     
     def _erode(self, image, kernel):
         """Apply erosion operation."""
-        height, width = image.shape
-        k_height, k_width = kernel.shape
-        pad_h, pad_w = k_height // 2, k_width // 2
-        
-        padded = np.pad(image, ((pad_h, pad_h), (pad_w, pad_w)), mode='constant')
-        result = np.zeros_like(image)
-        
-        for i in range(height):
-            for j in range(width):
-                if np.all(padded[i:i+k_height, j:j+k_width] >= kernel):
-                    result[i, j] = 1
-        
-        return result
+        return morphology.erode(image, kernel)
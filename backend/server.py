@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""
+Production server for the welding defect detection backend.
+
+The master process imports the Flask app once, which loads YOLODetector
+and ImageProcessor, binds the listening socket and forks worker processes
+that share the loaded code and detector state copy-on-write. Each worker
+accepts connections on the shared socket and serves a bounded number of
+them at once, one thread each. The master replaces workers that exit.
+
+A worker whose request runs longer than the request timeout exits and is
+replaced, which aborts its other in-flight requests as well. Batch analyses
+(/api/analyze/batch, up to 200 images) run under the longer batch timeout.
+On SIGTERM or SIGINT workers stop accepting, finish in-flight requests for
+up to the graceful timeout and exit; the master kills workers that are
+still running after that.
+
+Async analysis jobs (/api/analyze/async) live in the worker that accepted
+them, so clients polling /api/jobs/<job_id> need a single worker.
+
+    python server.py --workers 4 --threads 4 --port 8000
+"""
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+# Defaults, overridable on the command line
+SERVER_HOST = '0.0.0.0'
+SERVER_PORT = 8000
+SERVER_WORKERS = os.cpu_count() or 1
+SERVER_THREADS = 4  # concurrent requests per worker
+REQUEST_TIMEOUT = 120  # seconds a request may run, and a socket may idle
+BATCH_TIMEOUT = 900  # seconds a batch analysis may run
+BATCH_PATHS = ('/api/analyze/batch',)  # routes that run under the batch timeout
+GRACEFUL_TIMEOUT = 30  # seconds in-flight requests get at shutdown
+LISTEN_BACKLOG = 128
+
+POLL_INTERVAL = 0.5  # seconds between timeout and shutdown checks
+RESTART_DELAY = 1.0  # seconds between replacing a worker and the next check
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """Werkzeug WSGI server on an inherited socket, serving at most `threads` requests at once."""
+
+    multithread = True
+
+    def __init__(self, app, fd, host, port, threads=SERVER_THREADS, request_timeout=REQUEST_TIMEOUT,
+                 batch_timeout=BATCH_TIMEOUT):
+        # One request per connection, so idle keep-alive clients don't hold threads;
+        # the socket timeout bounds how long a slow client can stall a read or write
+        handler = type('RequestHandler', (WSGIRequestHandler,),
+                       {'protocol_version': 'HTTP/1.0', 'timeout': request_timeout})
+        super().__init__(host, port, self._timed(app), handler=handler, fd=fd)
+        self.threads = threads
+        self.request_timeout = request_timeout
+        self.batch_timeout = max(batch_timeout, request_timeout)
+        self.timeout = POLL_INTERVAL
+
+        self._slots = threading.BoundedSemaphore(threads)
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def process_request(self, request, client_address):
+        """Serve the connection on a pool thread; waits for a free thread first."""
+        # Not accepting while every thread is busy lets idle workers take the connection
+        while not self._slots.acquire(timeout=POLL_INTERVAL):
+            self.check_timeouts()
+        thread = threading.Thread(target=self._serve, args=(request, client_address),
+                                  name='wsgi-request', daemon=True)
+        with self._lock:
+            self._inflight[thread] = time.monotonic() + self.request_timeout
+        thread.start()
+
+    def _timed(self, app):
+        """Wrap app so batch requests get the batch timeout once their path is known."""
+        def timed_app(environ, start_response):
+            if environ.get('PATH_INFO') in BATCH_PATHS:
+                thread = threading.current_thread()
+                with self._lock:
+                    if thread in self._inflight:
+                        self._inflight[thread] += self.batch_timeout - self.request_timeout
+            return app(environ, start_response)
+        return timed_app
+
+    def _serve(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            with self._lock:
+                self._inflight.pop(threading.current_thread(), None)
+            self._slots.release()
+
+    def inflight(self):
+        """Number of requests being served."""
+        with self._lock:
+            return len(self._inflight)
+
+    def check_timeouts(self):
+        """Exit the worker when a request has run past its timeout."""
+        now = time.monotonic()
+        with self._lock:
+            deadline = min(self._inflight.values(), default=now)
+        if now > deadline:
+            print(f"[worker {os.getpid()}] request exceeded its timeout, restarting worker",
+                  file=sys.stderr)
+            os._exit(1)
+
+    def drain(self, timeout):
+        """Wait up to timeout seconds for in-flight requests; True when none remain."""
+        deadline = time.monotonic() + timeout
+        while self.inflight() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        return not self.inflight()
+
+
+def bind_socket(host, port, backlog=LISTEN_BACKLOG):
+    """Listening socket shared by all workers."""
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.create_server((host, port), family=family, backlog=backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(app, sock, threads, request_timeout, graceful_timeout, batch_timeout=BATCH_TIMEOUT):
+    """Serve requests until SIGTERM/SIGINT, then drain; returns the exit code."""
+    host, port = sock.getsockname()[:2]
+    server = PooledWSGIServer(app, sock.fileno(), host, port, threads=threads,
+                              request_timeout=request_timeout, batch_timeout=batch_timeout)
+    stopping = threading.Event()
+
+    def stop(signum, frame):
+        stopping.set()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while not stopping.is_set():
+        server.handle_request()
+        server.check_timeouts()
+
+    # Stop accepting, then give in-flight requests the graceful timeout
+    server.socket.close()
+    return 0 if server.drain(graceful_timeout) else 1
+
+
+class Master:
+    def __init__(self, app, sock, workers=SERVER_WORKERS, threads=SERVER_THREADS,
+                 request_timeout=REQUEST_TIMEOUT, graceful_timeout=GRACEFUL_TIMEOUT,
+                 batch_timeout=BATCH_TIMEOUT):
+        self.app = app
+        self.sock = sock
+        self.workers = workers
+        self.threads = threads
+        self.request_timeout = request_timeout
+        self.graceful_timeout = graceful_timeout
+        self.batch_timeout = batch_timeout
+
+        self._children = set()
+        self._stopping = False
+
+    def spawn(self):
+        """Fork one worker process."""
+        pid = os.fork()
+        if pid:
+            self._children.add(pid)
+            return pid
+
+        # Child: serve until told to stop, never return into the master loop
+        code = 1
+        try:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            code = run_worker(self.app, self.sock, self.threads, self.request_timeout,
+                              self.graceful_timeout, self.batch_timeout)
+        except BaseException as e:
+            print(f"[worker {os.getpid()}] failed: {e}", file=sys.stderr)
+        finally:
+            os._exit(code)
+
+    def reap(self):
+        """Collect exited workers; returns how many exited."""
+        exited = 0
+        while self._children:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                self._children.clear()
+                break
+            if pid == 0:
+                break
+            self._children.discard(pid)
+            exited += 1
+        return exited
+
+    def stop(self, signum=None, frame=None):
+        self._stopping = True
+
+    def run(self):
+        """Keep `workers` workers running until SIGTERM/SIGINT, then shut them down."""
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        # Objects loaded so far are never collected, so the GC leaves their pages shared
+        gc.freeze()
+        for _ in range(self.workers):
+            self.spawn()
+        print(f"Serving on {self.sock.getsockname()[:2]} with {self.workers} workers "
+              f"x {self.threads} threads (master pid {os.getpid()})", file=sys.stderr)
+
+        while not self._stopping:
+            time.sleep(POLL_INTERVAL)
+            if self.reap() and not self._stopping:
+                while len(self._children) < self.workers:
+                    self.spawn()
+                time.sleep(RESTART_DELAY)
+
+        self.shutdown()
+
+    def shutdown(self):
+        """Ask workers to drain and exit; kill those still running after the graceful timeout."""
+        for pid in list(self._children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                self._children.discard(pid)
+
+        deadline = time.monotonic() + self.graceful_timeout + POLL_INTERVAL
+        while self._children and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.05)
+
+        for pid in list(self._children):
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        while self._children:
+            self.reap()
+            time.sleep(0.05)
+        self.sock.close()
+
+
+def load_app():
+    """Import the backend app; this loads the detector before any worker is forked."""
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app as backend_app
+    return backend_app.app
+
+
+def serve(host=SERVER_HOST, port=SERVER_PORT, workers=SERVER_WORKERS, threads=SERVER_THREADS,
+          request_timeout=REQUEST_TIMEOUT, graceful_timeout=GRACEFUL_TIMEOUT, batch_timeout=BATCH_TIMEOUT):
+    """Load the app, bind the socket and run the worker processes until stopped."""
+    app = load_app()
+    sock = bind_socket(host, port)
+
+    if not hasattr(os, 'fork'):
+        # No fork on this platform: serve from the master process
+        print(f"Serving on {sock.getsockname()[:2]} in a single process", file=sys.stderr)
+        run_worker(app, sock, threads, request_timeout, graceful_timeout, batch_timeout)
+        sock.close()
+        return
+
+    Master(app, sock, workers=workers, threads=threads, request_timeout=request_timeout,
+           graceful_timeout=graceful_timeout, batch_timeout=batch_timeout).run()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Run the welding defect detection backend in production.')
+    parser.add_argument('--host', default=SERVER_HOST)
+    parser.add_argument('--port', type=int, default=SERVER_PORT)
+    parser.add_argument('--workers', type=int, default=SERVER_WORKERS, help='worker processes')
+    parser.add_argument('--threads', type=int, default=SERVER_THREADS, help='concurrent requests per worker')
+    parser.add_argument('--timeout', type=float, default=REQUEST_TIMEOUT,
+                        help='seconds a request may run before its worker is restarted')
+    parser.add_argument('--batch-timeout', type=float, default=BATCH_TIMEOUT,
+                        help='seconds a batch analysis may run before its worker is restarted')
+    parser.add_argument('--graceful-timeout', type=float, default=GRACEFUL_TIMEOUT,
+                        help='seconds in-flight requests get to finish at shutdown')
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    serve(host=args.host, port=args.port, workers=max(1, args.workers), threads=max(1, args.threads),
+          request_timeout=args.timeout, graceful_timeout=args.graceful_timeout,
+          batch_timeout=args.batch_timeout)
+
+
+if __name__ == '__main__':
+    main()
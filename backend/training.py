@@ -5,82 +5,142 @@ Handles model training, dataset management, and model evaluation.
 """
 import os
 import json
+import threading
 import time
 import numpy as np
 from typing import List, Dict, Any
-from flask import Flask, request, jsonify
+from flask import Blueprint, Flask, request, jsonify
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
-from PIL import Image
 import base64
 
-app = Flask(__name__)
-CORS(app)
+from utils.dataset_store import HEADER_FILE, DatasetReader, DatasetWriter, read_header
+from utils.model_registry import REGISTRY_FILE, InvalidModelError, ModelNotFoundError, ModelRegistry
+from utils.multipart import iter_multipart_parts
+from models.profiles import PROFILES_FILE, ProfileStore
+from models.yolo_detector import YOLODetector
+from training_jobs import QueueFullError, TrainingExecutor, run_training
+
+# Routes are registered on the app built by create_app(). Nothing is built
+# at import time: training jobs run in spawned processes, which re-import
+# the main module, and must not open the registry or start an executor.
+api = Blueprint('training', __name__)
+
+MAX_TRAINING_FILE_SIZE = 10 * 1024 * 1024  # bytes per uploaded training image
+# Leading bytes of the accepted training image formats
+IMAGE_SIGNATURES = {
+    b'\xff\xd8\xff': 'JPEG',
+    b'\x89PNG\r\n\x1a\n': 'PNG'
+}
+
+# Background training jobs
+TRAINING_MAX_CONCURRENT = 1  # training processes running at once
+TRAINING_MAX_PENDING = 8  # trainings waiting for a free slot
+TRAINING_EPOCH_SECONDS = 1.0  # minimum duration of a simulated epoch
+TRAINING_RESULT_TTL = 24 * 60 * 60  # seconds finished trainings stay queryable
+
+
+class UploadError(ValueError):
+    """Raised when a training upload is rejected."""
 
 class ModelTrainer:
     def __init__(self):
         self.training_data_dir = "training_data"
         self.models_dir = "models"
-        self.current_training = None
+        self.executor = TrainingExecutor(run_training, max_concurrent=TRAINING_MAX_CONCURRENT,
+                                         max_pending=TRAINING_MAX_PENDING,
+                                         result_ttl=TRAINING_RESULT_TTL,
+                                         on_complete=self._save_model)
         
         # Create directories if they don't exist
         os.makedirs(self.training_data_dir, exist_ok=True)
         os.makedirs(self.models_dir, exist_ok=True)
+        
+        # Models are listed, looked up and activated through the registry;
+        # model files saved before it existed are registered once here. A
+        # model is accepted only if the analysis server could build its detector.
+        self.profile_store = ProfileStore(os.path.join(self.models_dir, PROFILES_FILE))
+        self.registry = ModelRegistry(os.path.join(self.models_dir, REGISTRY_FILE),
+                                      validate=self._build_detector)
+        self.registry.import_models(self.models_dir)
+    
+    def _build_detector(self, model: Dict) -> YOLODetector:
+        return YOLODetector.for_model(model, self.profile_store)
     
     def save_training_dataset(self, images_data: List[Dict]) -> str:
         """Save training dataset to disk for processing."""
+        with self.create_dataset() as writer:
+            for img in images_data:
+                # Image bytes go to the pack files; everything else is index metadata
+                metadata = {key: value for key, value in img.items() if key != 'image_base64'}
+                data = base64.b64decode(img['image_base64']) if img.get('image_base64') else b""
+                metadata.setdefault('filename', '')
+                writer.add(data, **metadata)
+        return writer.dataset_id
+    
+    def ingest_uploads(self, parts, field: str = 'images', labels: List[Dict] = None) -> str:
+        """
+        Store uploaded files into a new dataset one at a time, as they arrive.
+        
+        parts are file-like multipart parts (see utils.multipart); those of
+        `field` are checked by their leading bytes and copied unchanged into
+        the pack files, so memory use does not grow with the upload.
+        labels are attached to every image.
+        """
+        with self.create_dataset() as writer:
+            for part in parts:
+                if part.name != field or not part.filename:
+                    continue
+                filename = secure_filename(part.filename)
+                header = part.peek(8)
+                image_format = next((name for signature, name in IMAGE_SIGNATURES.items()
+                                     if header.startswith(signature)), None)
+                if image_format is None:
+                    raise UploadError(f"{filename} is not a JPEG or PNG image")
+                try:
+                    writer.add(part, filename=filename, labels=labels, format=image_format,
+                               max_size=MAX_TRAINING_FILE_SIZE)
+                except ValueError as e:
+                    raise UploadError(str(e))
+            
+            if writer.stats.total_images == 0:
+                raise UploadError("No images uploaded")
+        return writer.dataset_id
+    
+    def create_dataset(self) -> DatasetWriter:
+        """Writer for a new dataset; use as a context manager to commit it."""
         timestamp = int(time.time())
         dataset_id = f"dataset_{timestamp}"
-        dataset_path = os.path.join(self.training_data_dir, f"{dataset_id}.json")
-        
-        # Process and validate dataset
-        processed_dataset = {
-            "id": dataset_id,
-            "created": timestamp,
-            "version": "1.0",
-            "statistics": self._calculate_dataset_stats(images_data),
-            "images": images_data
-        }
-        
-        with open(dataset_path, 'w') as f:
-            json.dump(processed_dataset, f, indent=2)
-        
-        return dataset_id
+        suffix = 1
+        while os.path.exists(self._dataset_path(dataset_id)):
+            dataset_id = f"dataset_{timestamp}_{suffix}"
+            suffix += 1
+        return DatasetWriter(self._dataset_path(dataset_id), dataset_id)
     
-    def _calculate_dataset_stats(self, images_data: List[Dict]) -> Dict:
-        """Calculate dataset statistics."""
-        total_images = len(images_data)
-        total_labels = sum(len(img.get('labels', [])) for img in images_data)
-        
-        label_counts = {}
-        for img in images_data:
-            for label in img.get('labels', []):
-                defect_type = label.get('type', 'unknown')
-                label_counts[defect_type] = label_counts.get(defect_type, 0) + 1
-        
-        return {
-            "total_images": total_images,
-            "total_labels": total_labels,
-            "labeled_images": len([img for img in images_data if img.get('labels')]),
-            "label_distribution": label_counts,
-            "average_labels_per_image": total_labels / max(total_images, 1)
-        }
+    def open_dataset(self, dataset_id: str) -> DatasetReader:
+        """Lazy, memory-mapped reader over a saved dataset's samples."""
+        return DatasetReader(self._dataset_path(dataset_id))
     
-    def start_training(self, dataset_id: str, config: Dict = None) -> Dict:
-        """Start the model training process."""
-        if self.current_training:
-            raise ValueError("Training already in progress")
+    def get_dataset_stats(self, dataset_id: str) -> Dict:
+        """Statistics of a saved dataset, read without loading any images."""
+        dataset_path = self._dataset_path(dataset_id)
+        if os.path.exists(os.path.join(dataset_path, HEADER_FILE)):
+            return read_header(dataset_path)['statistics']
         
-        dataset_path = os.path.join(self.training_data_dir, f"{dataset_id}.json")
-        if not os.path.exists(dataset_path):
+        # Datasets saved before the pack format are single JSON files
+        legacy_path = os.path.join(self.training_data_dir, f"{secure_filename(dataset_id)}.json")
+        if not os.path.exists(legacy_path):
             raise FileNotFoundError(f"Dataset {dataset_id} not found")
-        
-        # Load dataset
-        with open(dataset_path, 'r') as f:
-            dataset = json.load(f)
-        
+        with open(legacy_path, 'r') as f:
+            return json.load(f)['statistics']
+    
+    def _dataset_path(self, dataset_id: str) -> str:
+        return os.path.join(self.training_data_dir, secure_filename(dataset_id))
+    
+    def start_training(self, dataset_id: str, config: Dict = None) -> Dict:
+        """Queue a training job on the dataset; returns its initial status."""
         # Validate dataset meets minimum requirements
-        stats = dataset['statistics']
+        stats = self.get_dataset_stats(dataset_id)
         if stats['total_images'] < 10:
             raise ValueError("Minimum 10 images required for training")
         if stats['total_labels'] < 20:
@@ -94,145 +154,109 @@ class ModelTrainer:
             "batch_size": config.get('batch_size', 16) if config else 16,
             "learning_rate": config.get('learning_rate', 0.001) if config else 0.001,
             "validation_split": 0.2,
+            "detector_config": config.get('detector_config', {}) if config else {},
             "started_at": time.time()
         }
+        # Reject unusable detector settings now rather than when the model is saved
+        self.registry.check({"id": "training", "version": "1.0.0",
+                             "detector_config": training_config['detector_config']})
         
-        self.current_training = {
-            "id": f"training_{int(time.time())}",
-            "status": "preparing",
-            "progress": 0,
-            "config": training_config,
-            "dataset_stats": stats,
-            "current_epoch": 0,
-            "loss": 0.0,
-            "accuracy": 0.0
+        payload = {
+            "dataset_path": os.path.abspath(self._dataset_path(dataset_id)),
+            "epochs": training_config['epochs'],
+            "epoch_seconds": TRAINING_EPOCH_SECONDS
         }
-        
-        return self.current_training
+        return self.executor.submit(payload, {"config": training_config, "dataset_stats": stats})
     
     def get_training_status(self, training_id: str) -> Dict:
         """Get current training status."""
-        if not self.current_training or self.current_training['id'] != training_id:
-            return {"error": "Training not found"}
-        
-        # Simulate training progress
-        elapsed = time.time() - self.current_training['config']['started_at']
-        total_epochs = self.current_training['config']['epochs']
-        
-        # Simulate different training stages
-        if elapsed < 10:  # Preparation phase
-            self.current_training['status'] = 'preparing'
-            self.current_training['progress'] = min(10, elapsed)
-        elif elapsed < 60:  # Training phase
-            self.current_training['status'] = 'training'
-            epoch_progress = (elapsed - 10) / 50  # 50 seconds for training
-            self.current_training['current_epoch'] = int(epoch_progress * total_epochs)
-            self.current_training['progress'] = 10 + (epoch_progress * 80)
-            
-            # Simulate improving metrics
-            self.current_training['loss'] = max(0.1, 2.0 - epoch_progress * 1.8)
-            self.current_training['accuracy'] = min(0.95, 0.3 + epoch_progress * 0.65)
-        else:  # Completion phase
-            self.current_training['status'] = 'completed'
-            self.current_training['progress'] = 100
-            self.current_training['current_epoch'] = total_epochs
-            self.current_training['loss'] = 0.15
-            self.current_training['accuracy'] = 0.92
-            
-            # Save completed model info
-            model_info = {
-                "id": f"model_{int(time.time())}",
-                "name": f"Custom Model - {self.current_training['dataset_stats']['total_images']} images",
-                "version": "1.0.0",
-                "accuracy": self.current_training['accuracy'],
-                "loss": self.current_training['loss'],
-                "trained_on": time.strftime("%Y-%m-%d"),
-                "dataset_id": self.current_training['config']['dataset_id'],
-                "epochs": total_epochs,
-                "dataset_size": self.current_training['dataset_stats']['total_images']
-            }
-            
-            model_path = os.path.join(self.models_dir, f"{model_info['id']}.json")
-            with open(model_path, 'w') as f:
-                json.dump(model_info, f, indent=2)
+        return self.executor.get_job_status(training_id)
+    
+    def cancel_training(self, training_id: str) -> Dict:
+        """Cancel a queued or running training."""
+        return self.executor.cancel_job(training_id)
+    
+    def _save_model(self, training: Dict) -> Dict:
+        """Register the model of a completed training, once; returns fields to add to its status."""
+        timestamp = int(time.time())
+        model_id = f"model_{timestamp}"
+        suffix = 1
+        while self.registry.get(model_id) is not None:
+            model_id = f"model_{timestamp}_{suffix}"
+            suffix += 1
         
-        return self.current_training
+        model_info = {
+            "id": model_id,
+            "name": f"Custom Model - {training['dataset_stats']['total_images']} images",
+            "version": "1.0.0",
+            "accuracy": training['accuracy'],
+            "loss": training['loss'],
+            "trained_on": time.strftime("%Y-%m-%d"),
+            "dataset_id": training['config']['dataset_id'],
+            "epochs": training['config']['epochs'],
+            "dataset_size": training['dataset_stats']['total_images'],
+            "training_id": training['id'],
+            "detector_config": training['config']['detector_config']
+        }
+        self.registry.register(model_info)
+        return {"model_id": model_info['id']}
     
     def get_available_models(self) -> List[Dict]:
         """Get list of available trained models."""
-        models = []
-        
-        # Add default model
-        models.append({
-            "id": "default",
-            "name": "Default Detection Model",
-            "version": "1.0.0",
-            "accuracy": 0.85,
-            "trained_on": "2025-01-01",
-            "is_active": True,
-            "description": "Pre-trained model for general welding defect detection",
-            "dataset_size": 1000
-        })
-        
-        # Add custom trained models
-        if os.path.exists(self.models_dir):
-            for filename in os.listdir(self.models_dir):
-                if filename.endswith('.json'):
-                    try:
-                        with open(os.path.join(self.models_dir, filename), 'r') as f:
-                            model_info = json.load(f)
-                            model_info['is_active'] = False
-                            models.append(model_info)
-                    except Exception as e:
-                        print(f"Error loading model {filename}: {e}")
-        
-        return models
+        return self.registry.list_models()
+    
+    def activate_model(self, model_id: str) -> Dict:
+        """Make model_id the model /api/analyze detects with."""
+        return self.registry.activate(model_id)
+
+trainer = None  # built on first use by get_trainer()
+_trainer_lock = threading.Lock()
 
-# Initialize trainer
-trainer = ModelTrainer()
 
-@app.route('/api/train', methods=['POST'])
+def get_trainer() -> ModelTrainer:
+    """The server's trainer, built on first use."""
+    global trainer
+    with _trainer_lock:
+        if trainer is None:
+            trainer = ModelTrainer()
+        return trainer
+
+
+def create_app() -> Flask:
+    """Build the training server's Flask app."""
+    app = Flask(__name__)
+    CORS(app)
+    app.register_blueprint(api)
+    return app
+
+
+@api.route('/api/train', methods=['POST'])
 def start_training():
     """Start model training with uploaded dataset."""
     try:
-        images_data = []
         # Accept both JSON and multipart/form-data
-        if request.content_type and request.content_type.startswith('multipart/form-data'):
-            # Handle file uploads
-            files = request.files.getlist('images')
-            if not files or len(files) == 0:
-                return jsonify({"success": False, "message": "No images uploaded"}), 400
-            for file in files:
-                filename = secure_filename(file.filename)
-                img = Image.open(file.stream)
-                img = img.convert("RGB")
-                # For demo: encode image as base64 (not efficient for real training)
-                buffered = io.BytesIO()
-                img.save(buffered, format="JPEG")
-                img_b64 = base64.b64encode(buffered.getvalue()).decode('utf-8')
-                # Dummy auto-labels (simulate detection for training)
-                labels = [{
-                    "type": t,
-                    "bbox": [50, 50, 100, 100],
-                    "confidence": 0.8,
-                    "auto_generated": True
-                } for t in ["crack", "porosity", "slag"]]
-                images_data.append({
-                    "filename": filename,
-                    "image_base64": img_b64,
-                    "labels": labels
-                })
+        if request.mimetype == 'multipart/form-data':
+            # Files are stored one at a time as they are read from the request
+            # Dummy auto-labels (simulate detection for training)
+            labels = [{
+                "type": t,
+                "bbox": [50, 50, 100, 100],
+                "confidence": 0.8,
+                "auto_generated": True
+            } for t in ["crack", "porosity", "slag"]]
+            parts = iter_multipart_parts(request.stream, request.mimetype_params.get('boundary', ''))
+            dataset_id = get_trainer().ingest_uploads(parts, labels=labels)
             config = {}
         else:
             # Handle JSON
             data = request.get_json()
             images_data = data.get('images', [])
             config = data.get('config', {})
-
-        # Save dataset
-        dataset_id = trainer.save_training_dataset(images_data)
+            
+            # Save dataset
+            dataset_id = get_trainer().save_training_dataset(images_data)
         # Start training (simulate complex logic)
-        training_info = trainer.start_training(dataset_id, config)
+        training_info = get_trainer().start_training(dataset_id, config)
         # Simulate longer training time and more complex metrics
         training_info['config']['complexity'] = "advanced"
         training_info['config']['augmentation'] = True
@@ -246,17 +270,27 @@ def start_training():
             "estimated_time": "2-3 minutes",
             "config": training_info['config']
         })
+    except (UploadError, InvalidModelError) as e:
+        return jsonify({
+            "success": False,
+            "message": str(e)
+        }), 400
+    except QueueFullError as e:
+        return jsonify({
+            "success": False,
+            "message": str(e)
+        }), 429
     except Exception as e:
         return jsonify({
             "success": False,
             "message": f"Training failed: {str(e)}"
         }), 500
 
-@app.route('/api/training/<training_id>/status', methods=['GET'])
+@api.route('/api/training/<training_id>/status', methods=['GET'])
 def get_training_status(training_id):
     """Get training progress and status."""
     try:
-        status = trainer.get_training_status(training_id)
+        status = get_trainer().get_training_status(training_id)
         
         if "error" in status:
             return jsonify({
@@ -275,11 +309,34 @@ def get_training_status(training_id):
             "message": f"Failed to get status: {str(e)}"
         }), 500
 
-@app.route('/api/models', methods=['GET'])
+@api.route('/api/training/<training_id>/cancel', methods=['POST'])
+def cancel_training(training_id):
+    """Cancel a queued or running training."""
+    try:
+        status = get_trainer().cancel_training(training_id)
+        
+        if "error" in status:
+            return jsonify({
+                "success": False,
+                "message": status["error"]
+            }), 404
+        
+        return jsonify({
+            "success": True,
+            "training": status
+        })
+        
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "message": f"Failed to cancel training: {str(e)}"
+        }), 500
+
+@api.route('/api/models', methods=['GET'])
 def get_models():
     """Get list of available models."""
     try:
-        models = trainer.get_available_models()
+        models = get_trainer().get_available_models()
         
         return jsonify({
             "success": True,
@@ -292,17 +349,28 @@ def get_models():
             "message": f"Failed to get models: {str(e)}"
         }), 500
 
-@app.route('/api/models/<model_id>/activate', methods=['POST'])
+@api.route('/api/models/<model_id>/activate', methods=['POST'])
 def activate_model(model_id):
     """Activate a specific model for inference."""
     try:
-        # In a real implementation, this would switch the active model
+        # The analysis server picks up the new active model without a restart
+        model = get_trainer().activate_model(model_id)
         return jsonify({
             "success": True,
             "message": f"Model {model_id} activated successfully",
-            "active_model": model_id
+            "active_model": model['id']
         })
         
+    except ModelNotFoundError as e:
+        return jsonify({
+            "success": False,
+            "message": str(e)
+        }), 404
+    except InvalidModelError as e:
+        return jsonify({
+            "success": False,
+            "message": str(e)
+        }), 400
     except Exception as e:
         return jsonify({
             "success": False,
@@ -313,4 +381,4 @@ if __name__ == '__main__':
     print("Starting AI Training Server...")
     print("- Training endpoint: http://localhost:8001/api/train")
     print("- Models endpoint: http://localhost:8001/api/models")
-    app.run(host='0.0.0.0', port=8001, debug=True)
\ No newline at end of file
+    create_app().run(host='0.0.0.0', port=8001, debug=True)
\ No newline at end of file
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+Background execution of training jobs for the welding defect detection system.
+
+Each training runs in its own process, so it cannot starve the request
+threads or the inference workers. Jobs wait in a bounded queue and at most
+max_concurrent run at once. The job process pushes per-epoch progress
+events to a dispatcher thread in the server, which is the only writer of
+the status store; status lookups are read-only snapshots. Cancellation
+sets a flag the epoch loop checks, and a job that ignores it is terminated.
+"""
+import multiprocessing
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Callable, Dict, Optional
+
+import numpy as np
+
+from utils.dataset_store import DatasetReader
+
+FINISHED_STATES = ("completed", "failed", "cancelled")
+
+
+class QueueFullError(Exception):
+    """Raised when the training queue has no room for another job."""
+
+
+class TrainingCancelled(Exception):
+    """Raised inside a job process when its job was cancelled."""
+
+
+def run_training(payload: Dict, report: Callable, cancelled: Callable) -> Dict:
+    """
+    Epoch loop of a training job, run in the job process.
+
+    Every epoch reads each sample of the dataset through the memory-mapped
+    reader and reports ('epoch', metrics); epochs last at least
+    payload['epoch_seconds']. Returns the final metrics.
+    """
+    epochs = payload['epochs']
+    with DatasetReader(payload['dataset_path']) as reader:
+        report('status', {'status': 'training'})
+        metrics = {'loss': 0.0, 'accuracy': 0.0}
+        for epoch in range(1, epochs + 1):
+            started = time.monotonic()
+            checksum = 0
+            for index in range(len(reader.entries)):
+                if cancelled():
+                    raise TrainingCancelled()
+                sample = reader.sample_bytes(index)
+                checksum += int(np.frombuffer(sample, dtype=np.uint8)[::4096].sum()) if len(sample) else 0
+                del sample
+            remaining = payload['epoch_seconds'] - (time.monotonic() - started)
+            while remaining > 0:
+                if cancelled():
+                    raise TrainingCancelled()
+                time.sleep(min(remaining, 0.1))
+                remaining = payload['epoch_seconds'] - (time.monotonic() - started)
+
+            # Simulated learning curve
+            fraction = epoch / epochs
+            metrics = {
+                'loss': max(0.1, 2.0 - fraction * 1.8),
+                'accuracy': min(0.95, 0.3 + fraction * 0.65)
+            }
+            report('epoch', dict(metrics, epoch=epoch, epochs=epochs, checksum=checksum))
+    return metrics
+
+
+def _job_process(run_job, job_id, payload, events, cancel_event):
+    """Entry point of a job process: runs the job and reports how it ended."""
+    def report(kind, data):
+        events.put((job_id, kind, data))
+
+    try:
+        result = run_job(payload, report, cancel_event.is_set)
+    except TrainingCancelled:
+        report('cancelled', None)
+    except Exception as e:
+        report('failed', str(e))
+    else:
+        report('completed', result)
+
+
+class TrainingExecutor:
+    def __init__(self, run_job: Callable = run_training, max_concurrent: int = 1, max_pending: int = 8,
+                 result_ttl: float = 24 * 60 * 60, cancel_grace: float = 5.0,
+                 on_complete: Optional[Callable] = None):
+        """
+        run_job(payload, report, cancelled) runs in a job process and must be
+        a module-level function; report(kind, data) sends an event and
+        cancelled() tells it to stop. on_complete(status) is called in the
+        server once per completed job and may add fields to the status.
+        """
+        self.run_job = run_job
+        self.max_concurrent = max_concurrent
+        self.max_pending = max_pending
+        self.result_ttl = result_ttl
+        self.cancel_grace = cancel_grace
+        self.on_complete = on_complete
+
+        self._context = multiprocessing.get_context('spawn')
+        self._jobs = {}
+        self._pending = deque()
+        self._running = {}
+        self._lock = threading.Lock()
+        self._events = None
+        self._dispatcher = None
+        self._stopping = threading.Event()
+
+    def submit(self, payload: Dict, status: Dict = None) -> Dict:
+        """Queue a job; status holds extra fields for its status record. Returns the record."""
+        self._start()
+        job = dict(status or {})
+        job.update({
+            "id": f"training_{uuid.uuid4().hex[:12]}",
+            "status": "queued",
+            "progress": 0,
+            "current_epoch": 0,
+            "loss": 0.0,
+            "accuracy": 0.0,
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "error_message": None
+        })
+        with self._lock:
+            if len(self._pending) >= self.max_pending:
+                raise QueueFullError("Training queue is full, try again later")
+            self._jobs[job["id"]] = job
+            self._pending.append((job["id"], payload))
+            return self._snapshot(job)
+
+    def get_job_status(self, job_id: str) -> Dict:
+        """Get current job status; never changes any state."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return {"error": "Training not found"}
+            return self._snapshot(job)
+
+    def cancel_job(self, job_id: str) -> Dict:
+        """Cancel a queued or running job; returns its status record."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return {"error": "Training not found"}
+            if job["status"] == "queued":
+                self._pending = deque(item for item in self._pending if item[0] != job_id)
+                self._finish(job, "cancelled")
+            elif job_id in self._running:
+                process, cancel_event, _ = self._running[job_id]
+                cancel_event.set()
+                self._running[job_id] = (process, cancel_event, time.monotonic())
+                job["status"] = "cancelling"
+            return self._snapshot(job)
+
+    def get_queue_stats(self) -> Dict:
+        """Queue depth, running jobs and job counts by status."""
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job["status"]] = counts.get(job["status"], 0) + 1
+            return {
+                "pending": len(self._pending),
+                "running": len(self._running),
+                "max_pending": self.max_pending,
+                "max_concurrent": self.max_concurrent,
+                "jobs": counts
+            }
+
+    def shutdown(self, timeout: float = 10.0):
+        """Cancel queued and running jobs and stop the dispatcher."""
+        with self._lock:
+            job_ids = [job_id for job_id, _ in self._pending] + list(self._running)
+        for job_id in job_ids:
+            self.cancel_job(job_id)
+        deadline = time.monotonic() + timeout
+        while self._running and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self._stopping.set()
+        if self._dispatcher is not None:
+            self._dispatcher.join(timeout=1.0)
+        with self._lock:
+            for process, _, _ in self._running.values():
+                process.terminate()
+            self._running.clear()
+
+    def _snapshot(self, job):
+        snapshot = dict(job)
+        if job["finished_at"] is not None:
+            snapshot["expires_at"] = job["finished_at"] + self.result_ttl
+        return snapshot
+
+    def _start(self):
+        """Start the dispatcher thread and event queue on first use."""
+        with self._lock:
+            if self._dispatcher is None:
+                self._events = self._context.Queue()
+                self._dispatcher = threading.Thread(target=self._dispatch, name="training-dispatcher",
+                                                    daemon=True)
+                self._dispatcher.start()
+
+    def _dispatch(self):
+        while not self._stopping.is_set():
+            self._launch_pending()
+            try:
+                self._apply(*self._events.get(timeout=0.2))
+            except queue.Empty:
+                pass
+            self._supervise()
+            self._expire_jobs()
+
+    def _launch_pending(self):
+        with self._lock:
+            while self._pending and len(self._running) < self.max_concurrent:
+                job_id, payload = self._pending.popleft()
+                cancel_event = self._context.Event()
+                process = self._context.Process(
+                    target=_job_process,
+                    args=(self.run_job, job_id, payload, self._events, cancel_event),
+                    name=f"training-{job_id}", daemon=True
+                )
+                process.start()
+                self._running[job_id] = (process, cancel_event, None)
+                job = self._jobs[job_id]
+                job["status"] = "preparing"
+                job["progress"] = 5
+                job["started_at"] = time.time()
+
+    def _apply(self, job_id, kind, data):
+        """Record one event from a job process."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job["status"] in FINISHED_STATES:
+                return
+            if kind == 'status':
+                if job["status"] != "cancelling":
+                    job["status"] = data["status"]
+            elif kind == 'epoch':
+                job["current_epoch"] = data["epoch"]
+                job["loss"] = data["loss"]
+                job["accuracy"] = data["accuracy"]
+                job["progress"] = 10 + 80 * data["epoch"] / data["epochs"]
+            elif kind == 'cancelled':
+                self._finish(job, "cancelled")
+            elif kind == 'failed':
+                self._finish(job, "failed", data)
+            elif kind == 'completed':
+                job.update(data or {})
+                completed = self._snapshot(job)
+
+        if kind == 'completed':
+            # The job shows as completed only once on_complete has run
+            try:
+                extra = self.on_complete(completed) if self.on_complete is not None else None
+            except Exception as e:
+                with self._lock:
+                    self._finish(job, "failed", f"Saving the trained model failed: {e}")
+                return
+            with self._lock:
+                job.update(extra or {})
+                self._finish(job, "completed")
+
+    def _finish(self, job, state, error_message=None):
+        """Mark a job finished (caller holds the lock)."""
+        job["status"] = state
+        job["finished_at"] = time.time()
+        job["error_message"] = error_message
+        if state == "completed":
+            job["progress"] = 100
+        entry = self._running.pop(job["id"], None)
+        if entry is not None:
+            entry[0].join(timeout=0.1)
+
+    def _supervise(self):
+        """Fail jobs whose process died silently; terminate cancelled jobs past the grace period."""
+        with self._lock:
+            running = list(self._running.items())
+        now = time.monotonic()
+        for job_id, (process, _, cancelled_at) in running:
+            if not process.is_alive():
+                # Its final event may still be in the queue
+                self._drain_events()
+                with self._lock:
+                    job = self._jobs[job_id]
+                    if job_id in self._running:
+                        self._finish(job, "failed", f"Training process exited with code {process.exitcode}")
+            elif cancelled_at is not None and now - cancelled_at > self.cancel_grace:
+                process.terminate()
+                process.join(timeout=1.0)
+                with self._lock:
+                    if job_id in self._running:
+                        self._finish(self._jobs[job_id], "cancelled")
+
+    def _drain_events(self):
+        while True:
+            try:
+                self._apply(*self._events.get_nowait())
+            except queue.Empty:
+                return
+
+    def _expire_jobs(self):
+        """Drop finished jobs older than result_ttl."""
+        now = time.time()
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job["finished_at"] is not None and now - job["finished_at"] > self.result_ttl]
+            for job_id in expired:
+                del self._jobs[job_id]
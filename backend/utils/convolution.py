@@ -0,0 +1,162 @@
+"""
+Whole-array 2D convolution backends for the defect detector.
+
+All backends compute the same sliding-window correlation as the original
+per-pixel loop: the image is edge-padded by half the kernel size and each
+output pixel is the sum of the kernel-sized window times the kernel (the
+kernel is not flipped). float32 images are accumulated in float32; any
+other input is accumulated in float64.
+"""
+from functools import lru_cache
+
+import numpy as np
+
+from utils.scratch import scratch
+
+# Kernels with at most this many taps use the shift-and-add path when they
+# are not separable; anything larger goes through the FFT.
+DIRECT_MAX_TAPS = 49
+
+# Relative singular value below which a kernel is treated as rank one.
+SEPARABLE_TOLERANCE = 1e-10
+
+METHODS = ('auto', 'direct', 'separable', 'fft')
+
+# Sobel gradient kernels (x: left to right, y: top to bottom)
+SOBEL_X = np.array([[-1, 0, 1], [-2, 0, 2], [-1, 0, 1]])
+SOBEL_Y = np.array([[-1, -2, -1], [0, 0, 0], [1, 2, 1]])
+SOBEL_X.setflags(write=False)
+SOBEL_Y.setflags(write=False)
+
+
+def pad_edges(image, kernel_shape):
+    """Edge-pad an image by half the kernel size on every side."""
+    k_height, k_width = kernel_shape
+    pad_h, pad_w = k_height // 2, k_width // 2
+    return np.pad(image, ((pad_h, pad_h), (pad_w, pad_w)), mode='edge')
+
+
+@lru_cache(maxsize=64)
+def gaussian_kernel(size):
+    """Unnormalized size x size Gaussian with sigma = size / 3 (read-only, built once per size)."""
+    taps = np.arange(size) - size // 2
+    sigma = size / 3
+    kernel = np.exp(-(taps[:, None] ** 2 + taps[None, :] ** 2) / (2 * sigma ** 2))
+    kernel.setflags(write=False)
+    return kernel
+
+
+def separate_kernel(kernel, tolerance=SEPARABLE_TOLERANCE):
+    """
+    Split a rank-one kernel into a column and a row vector.
+    Returns None when the kernel is not separable. The factorization is
+    memoized by kernel contents, so a fixed kernel is factored only once.
+    """
+    kernel = np.asarray(kernel)
+    return _separate(kernel.tobytes(), kernel.shape, kernel.dtype.str, tolerance)
+
+
+@lru_cache(maxsize=256)
+def _separate(data, shape, dtype, tolerance):
+    kernel = np.frombuffer(data, dtype=dtype).reshape(shape).astype(np.float64)
+    u, s, vt = np.linalg.svd(kernel)
+    if s[0] == 0 or (len(s) > 1 and s[1] > s[0] * tolerance):
+        return None
+
+    scale = np.sqrt(s[0])
+    column, row = u[:, 0] * scale, vt[0] * scale
+    column.setflags(write=False)
+    row.setflags(write=False)
+    return column, row
+
+
+def choose_method(kernel):
+    """Pick the cheapest backend for a kernel."""
+    kernel = np.asarray(kernel)
+    if separate_kernel(kernel) is not None:
+        return 'separable'
+    if kernel.size <= DIRECT_MAX_TAPS:
+        return 'direct'
+    return 'fft'
+
+
+def convolve2d(image, kernel, method='auto'):
+    """
+    Apply a 2D kernel to a grayscale image with edge padding.
+    The result has the same shape and dtype as the input image.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown convolution method: {method}")
+
+    kernel = np.asarray(kernel)
+    if method == 'auto':
+        method = choose_method(kernel)
+
+    padded = pad_edges(image, kernel.shape)
+    height, width = image.shape
+    dtype = work_dtype(image)
+
+    if method == 'separable':
+        vectors = separate_kernel(kernel)
+        if vectors is None:
+            raise ValueError("Kernel is not separable")
+        result = _correlate_separable(padded, vectors[0], vectors[1], height, width, dtype)
+    elif method == 'direct':
+        result = _correlate_direct(padded, kernel, height, width, dtype)
+    else:
+        result = _correlate_fft(padded, kernel, height, width)
+
+    return result.astype(image.dtype, copy=False)
+
+
+def work_dtype(image):
+    """Accumulator dtype: float32 for float32 images, float64 otherwise."""
+    return np.dtype(np.float32) if image.dtype == np.float32 else np.dtype(np.float64)
+
+
+def _multiply_add(result, source, weight, product):
+    """result += weight * source, through a preallocated product buffer."""
+    np.multiply(source, result.dtype.type(weight), out=product, casting='unsafe')
+    result += product
+
+
+def _correlate_direct(padded, kernel, height, width, dtype=np.float64):
+    """Shift-and-add correlation: one whole-array multiply-add per tap."""
+    dtype = np.result_type(padded, kernel, dtype) if dtype == np.float64 else np.dtype(dtype)
+    result = np.zeros((height, width), dtype=dtype)
+    product = scratch('convolve_product', (height, width), dtype)
+    for a in range(kernel.shape[0]):
+        for b in range(kernel.shape[1]):
+            weight = kernel[a, b]
+            if weight != 0:
+                _multiply_add(result, padded[a:a + height, b:b + width], weight, product)
+    return result
+
+
+def _correlate_separable(padded, column, row, height, width, dtype=np.float64):
+    """Correlate with a rank-one kernel as a row pass followed by a column pass."""
+    rows = scratch('convolve_rows', (padded.shape[0], width), dtype)
+    rows.fill(0)
+    product = scratch('convolve_product', (padded.shape[0], width), dtype)
+    for b, weight in enumerate(row):
+        if weight != 0:
+            _multiply_add(rows, padded[:, b:b + width], weight, product)
+
+    result = np.zeros((height, width), dtype=dtype)
+    product = product[:height]
+    for a, weight in enumerate(column):
+        if weight != 0:
+            _multiply_add(result, rows[a:a + height], weight, product)
+    return result
+
+
+def _correlate_fft(padded, kernel, height, width):
+    """Correlate through the frequency domain; cost is independent of kernel size."""
+    k_height, k_width = kernel.shape
+    shape = (padded.shape[0] + k_height - 1, padded.shape[1] + k_width - 1)
+
+    flipped = np.asarray(kernel, dtype=np.float64)[::-1, ::-1]
+    spectrum = np.fft.rfft2(padded, shape) * np.fft.rfft2(flipped, shape)
+    full = np.fft.irfft2(spectrum, shape)
+
+    return full[k_height - 1:k_height - 1 + height, k_width - 1:k_width - 1 + width]
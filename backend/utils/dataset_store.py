@@ -0,0 +1,229 @@
+"""
+Sharded on-disk storage for training datasets.
+
+A dataset is a directory holding:
+
+- pack-NNNNN.bin: append-only shards with the original image bytes of
+  every sample back to back, rolled over at shard_size bytes;
+- samples.jsonl: one line per sample with its filename, labels and the
+  shard, offset and length of its bytes;
+- dataset.json: a small header with the id, creation time, format
+  version, shard names and precomputed statistics.
+
+Statistics are read from the header without touching image bytes or the
+sample index, and samples are read lazily through memory-mapped shards.
+The header is written last, so a dataset without one is incomplete.
+"""
+import json
+import mmap
+import os
+import shutil
+import time
+from typing import Dict, Iterator, List, Optional
+
+FORMAT_VERSION = "2.0"
+HEADER_FILE = "dataset.json"
+SAMPLES_FILE = "samples.jsonl"
+SHARD_SIZE = 256 * 1024 * 1024  # bytes per pack file before a new one is started
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+def shard_name(index: int) -> str:
+    return f"pack-{index:05d}.bin"
+
+
+class DatasetStats:
+    """Label statistics accumulated one sample at a time."""
+
+    def __init__(self):
+        self.total_images = 0
+        self.total_labels = 0
+        self.labeled_images = 0
+        self.label_distribution = {}
+
+    def add(self, labels: List[Dict]):
+        self.total_images += 1
+        self.total_labels += len(labels)
+        if labels:
+            self.labeled_images += 1
+        for label in labels:
+            defect_type = label.get('type', 'unknown')
+            self.label_distribution[defect_type] = self.label_distribution.get(defect_type, 0) + 1
+
+    def to_dict(self) -> Dict:
+        return {
+            "total_images": self.total_images,
+            "total_labels": self.total_labels,
+            "labeled_images": self.labeled_images,
+            "label_distribution": dict(self.label_distribution),
+            "average_labels_per_image": self.total_labels / max(self.total_images, 1)
+        }
+
+
+class DatasetWriter:
+    """
+    Appends samples to a new dataset directory.
+
+    Use as a context manager: the header is written when the block exits
+    normally, and the partial directory is removed if it raises.
+    """
+
+    def __init__(self, path: str, dataset_id: str, shard_size: int = SHARD_SIZE):
+        self.path = path
+        self.dataset_id = dataset_id
+        self.shard_size = shard_size
+        self.created = int(time.time())
+        self.stats = DatasetStats()
+        self.shards = []
+
+        os.makedirs(path)
+        self._samples = open(os.path.join(path, SAMPLES_FILE), 'w')
+        self._shard = None
+        self._shard_bytes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+
+    def _shard_for(self, size: int):
+        """The open shard, starting a new one when this sample would overflow it."""
+        if self._shard is None or (self._shard_bytes and self._shard_bytes + size > self.shard_size):
+            if self._shard is not None:
+                self._shard.close()
+            self.shards.append(shard_name(len(self.shards)))
+            self._shard = open(os.path.join(self.path, self.shards[-1]), 'wb')
+            self._shard_bytes = 0
+        return self._shard
+
+    def add(self, data, filename: str, labels: Optional[List[Dict]] = None,
+            max_size: Optional[int] = None, **metadata) -> Dict:
+        """
+        Append one sample; data is bytes or a binary file object, which is
+        copied in chunks from its current position. Returns the index entry.
+        A sample larger than max_size raises ValueError (the dataset must
+        then be aborted, since part of it may already be written).
+        """
+        labels = list(labels or [])
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            size = len(data)
+            if max_size is not None and size > max_size:
+                raise ValueError(f"{filename} is larger than {max_size} bytes")
+            shard = self._shard_for(size)
+            shard.write(data)
+        else:
+            # The size of a stream is only known once it is copied; the shard
+            # rolls over before the copy when it is already past its limit
+            shard = self._shard_for(0)
+            size = 0
+            while True:
+                chunk = data.read(COPY_CHUNK_SIZE)
+                if not chunk:
+                    break
+                shard.write(chunk)
+                size += len(chunk)
+                if max_size is not None and size > max_size:
+                    raise ValueError(f"{filename} is larger than {max_size} bytes")
+
+        entry = dict(metadata, filename=filename, labels=labels, shard=len(self.shards) - 1,
+                     offset=self._shard_bytes, length=size)
+        self._shard_bytes += size
+        self._samples.write(json.dumps(entry) + "\n")
+        self.stats.add(labels)
+        return entry
+
+    def commit(self) -> Dict:
+        """Flush the shards and index and write the header; returns the header."""
+        if self._shard is not None:
+            self._shard.close()
+            self._shard = None
+        self._samples.close()
+
+        header = {
+            "id": self.dataset_id,
+            "created": self.created,
+            "version": FORMAT_VERSION,
+            "shards": self.shards,
+            "statistics": self.stats.to_dict()
+        }
+        temporary = os.path.join(self.path, HEADER_FILE + ".tmp")
+        with open(temporary, 'w') as f:
+            json.dump(header, f, indent=2)
+        os.replace(temporary, os.path.join(self.path, HEADER_FILE))
+        return header
+
+    def abort(self):
+        """Discard the partial dataset."""
+        if self._shard is not None:
+            self._shard.close()
+        self._samples.close()
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+def read_header(path: str) -> Dict:
+    """Header of a committed dataset directory."""
+    header_path = os.path.join(path, HEADER_FILE)
+    if not os.path.exists(header_path):
+        raise FileNotFoundError(f"Dataset at {path} is missing or incomplete")
+    with open(header_path, 'r') as f:
+        return json.load(f)
+
+
+class DatasetReader:
+    """Lazy access to the samples of a committed dataset."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.header = read_header(path)
+        self._entries = None
+        self._maps = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close()
+
+    @property
+    def statistics(self) -> Dict:
+        return self.header['statistics']
+
+    @property
+    def entries(self) -> List[Dict]:
+        """Index entries (filename, labels, location), loaded on first use."""
+        if self._entries is None:
+            with open(os.path.join(self.path, SAMPLES_FILE), 'r') as f:
+                self._entries = [json.loads(line) for line in f if line.strip()]
+        return self._entries
+
+    def __len__(self):
+        return self.statistics['total_images']
+
+    def sample_bytes(self, index: int) -> memoryview:
+        """Read-only view of a sample's image bytes in its memory-mapped shard."""
+        entry = self.entries[index]
+        if entry['length'] == 0:
+            return memoryview(b"")
+        shard = self._map(entry['shard'])
+        return memoryview(shard)[entry['offset']:entry['offset'] + entry['length']]
+
+    def samples(self) -> Iterator[Dict]:
+        """Index entries with their image bytes under 'data', one at a time."""
+        for index, entry in enumerate(self.entries):
+            yield dict(entry, data=self.sample_bytes(index))
+
+    def _map(self, shard: int) -> mmap.mmap:
+        if shard not in self._maps:
+            with open(os.path.join(self.path, self.header['shards'][shard]), 'rb') as f:
+                self._maps[shard] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._maps[shard]
+
+    def close(self):
+        """Unmap the shards; views returned by sample_bytes must be released first."""
+        for shard in self._maps.values():
+            shard.close()
+        self._maps = {}
@@ -0,0 +1,95 @@
+"""
+Columnar detections for one or many films.
+
+A DetectionTable keeps detections as parallel arrays (image index, class
+id, confidence and an x/y/width/height box per row), so centers, per-class
+counts and confidence statistics over a whole batch are single NumPy
+reductions instead of loops over detection dicts. Dicts are built again
+only at the response boundary, by to_dicts().
+"""
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+DEFECT_CLASSES = ('crack', 'porosity', 'slag')
+
+
+class DetectionTable:
+    def __init__(self, image, class_id, confidence, bbox, num_images: int,
+                 classes: Sequence[str] = DEFECT_CLASSES):
+        """
+        Rows are detections: image[i] is the index of the film they belong
+        to, class_id[i] indexes classes and bbox[i] is (x, y, width, height).
+        """
+        self.image = np.asarray(image, dtype=np.int64)
+        self.class_id = np.asarray(class_id, dtype=np.int64)
+        self.confidence = np.asarray(confidence, dtype=np.float64)
+        # Boxes keep their input dtype, so integer pixel boxes stay integers in JSON
+        self.bbox = np.asarray(bbox).reshape(-1, 4)
+        self.num_images = num_images
+        self.classes = tuple(classes)
+
+    @classmethod
+    def from_detections(cls, images: Sequence[List[Dict]], classes: Sequence[str] = DEFECT_CLASSES):
+        """Table of per-film detection dict lists; bboxes are dicts or [x, y, w, h]."""
+        rows = [detection for detections in images for detection in detections]
+        names = [detection['class'] for detection in rows]
+
+        classes = list(classes)
+        for name in dict.fromkeys(names):
+            if name not in classes:
+                classes.append(name)
+        class_index = {name: index for index, name in enumerate(classes)}
+
+        boxes = [(bbox['x'], bbox['y'], bbox['width'], bbox['height']) if isinstance(bbox, dict) else bbox
+                 for bbox in (detection['bbox'] for detection in rows)]
+        return cls(np.repeat(np.arange(len(images)), [len(detections) for detections in images]),
+                   [class_index[name] for name in names],
+                   [detection['confidence'] for detection in rows],
+                   boxes if boxes else np.zeros((0, 4), dtype=np.int64),
+                   num_images=len(images), classes=classes)
+
+    def __len__(self):
+        return len(self.image)
+
+    def centers(self):
+        """(N, 2) box centers as x, y."""
+        return self.bbox[:, :2] + self.bbox[:, 2:] / 2
+
+    def detection_counts(self):
+        """Detections per film."""
+        return np.bincount(self.image, minlength=self.num_images)
+
+    def class_counts(self):
+        """(num_images, len(classes)) detections per film and class."""
+        size = len(self.classes)
+        counts = np.bincount(self.image * size + self.class_id, minlength=self.num_images * size)
+        return counts.reshape(self.num_images, size)
+
+    def confidence_sums(self):
+        """Summed confidence per film, accumulated in row order."""
+        return np.bincount(self.image, weights=self.confidence, minlength=self.num_images)
+
+    def mean_confidence(self):
+        """Mean confidence per film; 0 for films without detections."""
+        counts = self.detection_counts()
+        return np.divide(self.confidence_sums(), counts, out=np.zeros(self.num_images),
+                         where=counts > 0)
+
+    def to_dicts(self) -> List[List[Dict]]:
+        """Per-film lists of detection dicts (class, confidence, bbox, center), in row order."""
+        order = np.argsort(self.image, kind='stable')
+        names = np.array(self.classes, dtype=object)[self.class_id[order]].tolist()
+        confidences = self.confidence[order].tolist()
+        boxes = self.bbox[order].tolist()
+        centers = self.centers()[order].tolist()
+
+        rows = [{
+            'class': name,
+            'confidence': confidence,
+            'bbox': {'x': box[0], 'y': box[1], 'width': box[2], 'height': box[3]},
+            'center': {'x': center[0], 'y': center[1]}
+        } for name, confidence, box, center in zip(names, confidences, boxes, centers)]
+
+        ends = np.cumsum(self.detection_counts()).tolist()
+        return [rows[start:end] for start, end in zip([0] + ends[:-1], ends)]
@@ -0,0 +1,129 @@
+"""
+Gradient-voting Hough transform for circular features (porosity).
+
+Every boundary pixel of the binary mask votes, for each candidate radius,
+for the single centre that lies that far along its gradient direction.
+Centre offsets come from a table indexed by (radius, quantized angle)
+that is built once per parameter set, so voting is pure array indexing.
+The (x, y, r) accumulator is filled one radius slice at a time and
+folded into a running best-score/best-radius projection, which keeps
+memory at two image-sized buffers regardless of the radius range.
+"""
+from functools import lru_cache
+
+import numpy as np
+
+from utils.convolution import SOBEL_X, SOBEL_Y, convolve2d
+from utils import morphology
+from utils.scratch import scratch
+
+# Number of gradient directions in the offset table.
+ANGLE_BINS = 128
+
+# Fraction of a full circumference that must vote for a centre.
+MIN_SUPPORT = 0.5
+
+CROSS = np.array([[0, 1, 0], [1, 1, 1], [0, 1, 0]], np.uint8)
+VOTE_WINDOW = np.ones((3, 3))
+
+# The mask is smoothed before taking its gradient so that boundary
+# directions are not quantized to the few angles a binary step gives.
+_TAPS = np.arange(-3, 4)
+SMOOTHING = np.outer(np.exp(-_TAPS ** 2 / 8.0), np.exp(-_TAPS ** 2 / 8.0))
+SMOOTHING /= SMOOTHING.sum()
+
+
+@lru_cache(maxsize=32)
+def offset_table(radii, angle_bins=ANGLE_BINS):
+    """Integer (dx, dy) centre offsets, shape (len(radii), angle_bins, 2)."""
+    angles = np.arange(angle_bins) * (2 * np.pi / angle_bins)
+    radii = np.asarray(radii, dtype=np.float64)[:, None]
+    table = np.stack([np.rint(radii * np.cos(angles)), np.rint(radii * np.sin(angles))], axis=-1)
+    table = table.astype(np.int64)
+    table.setflags(write=False)
+    return table
+
+
+@lru_cache(maxsize=256)
+def perimeter_offsets(radius, step_degrees):
+    """(dx, dy) of points sampled every step_degrees around a circle, truncated like int()."""
+    angles = np.radians(np.arange(0, 360, step_degrees))
+    offsets = np.stack([radius * np.cos(angles), radius * np.sin(angles)], axis=-1)
+    offsets.setflags(write=False)
+    return offsets
+
+
+def perimeter_support(binary_image, cx, cy, radius, step_degrees=10):
+    """Fraction of in-bounds perimeter samples that land on foreground."""
+    offsets = perimeter_offsets(radius, step_degrees)
+    xs = (cx + offsets[:, 0]).astype(np.int64)
+    ys = (cy + offsets[:, 1]).astype(np.int64)
+
+    inside = (xs >= 0) & (xs < binary_image.shape[1]) & (ys >= 0) & (ys < binary_image.shape[0])
+    total = np.count_nonzero(inside)
+    if total == 0:
+        return 0
+    return np.count_nonzero(binary_image[ys[inside], xs[inside]] > 0) / total
+
+
+def hough_circles(binary_image, min_radius=5, max_radius=50, min_support=MIN_SUPPORT,
+                  angle_bins=ANGLE_BINS, radius_step=1):
+    """
+    Find circles bounding foreground blobs.
+
+    Returns a list of (x, y, radius) tuples, one per accumulator peak, for
+    radii in range(min_radius, max_radius, radius_step), in raster order of
+    the centre. Voting costs one pass per radius, so a coarser step is
+    proportionally faster.
+    """
+    mask = binary_image != 0
+    height, width = mask.shape
+    radii = tuple(range(min_radius, max_radius, radius_step))
+    if not radii or not mask.any():
+        return []
+
+    # Boundary pixels and the gradient of the mask, which points into the blob
+    eroded = morphology.erode(mask, CROSS)
+    weights = convolve2d(mask.astype(np.float32), SMOOTHING)
+    grad_x = convolve2d(weights, SOBEL_X)
+    grad_y = convolve2d(weights, SOBEL_Y)
+    ys, xs = np.nonzero(mask & ~eroded & ((grad_x != 0) | (grad_y != 0)))
+    if xs.size == 0:
+        return []
+
+    angles = np.arctan2(grad_y[ys, xs].astype(np.float64), grad_x[ys, xs].astype(np.float64))
+    # Only the boundary gradients are needed from here on
+    del weights, grad_x, grad_y, eroded
+    directions = np.rint(angles * (angle_bins / (2 * np.pi))).astype(np.int64) % angle_bins
+    table = offset_table(radii, angle_bins)
+
+    # Scores stay float64: near-ties between radii decide the peak position
+    best_score = np.zeros((height, width), dtype=np.float64)
+    best_radius = np.zeros((height, width), dtype=np.int16)
+    vote_image = scratch('hough_votes', (height, width), np.float64)
+    better = scratch('hough_better', (height, width), bool)
+    for index, radius in enumerate(radii):
+        centre_x = xs + table[index, directions, 0]
+        centre_y = ys + table[index, directions, 1]
+        inside = (centre_x >= 0) & (centre_x < width) & (centre_y >= 0) & (centre_y < height)
+
+        votes = np.bincount(centre_y[inside] * width + centre_x[inside], minlength=height * width)
+        # Gather votes scattered by angle quantization, normalize by circumference
+        np.copyto(vote_image, votes.reshape(height, width), casting='unsafe')
+        score = convolve2d(vote_image, VOTE_WINDOW)
+        score /= 2 * np.pi * radius
+
+        np.greater(score, best_score, out=better)
+        np.copyto(best_score, score, where=better)
+        best_radius[better] = radius
+
+    # Release the last slice before the max filter allocates its own buffers
+    del votes, score
+
+    # Peaks: strong enough, inside a blob, and the maximum within the
+    # smallest pore diameter
+    local_max = morphology.max_filter(best_score, 2 * min_radius + 1)
+    peaks = mask & (best_score >= min_support) & (best_score == local_max)
+
+    ys, xs = np.nonzero(peaks)
+    return [(int(x), int(y), int(best_radius[y, x])) for x, y in zip(xs, ys)]
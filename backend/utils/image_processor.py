@@ -1,6 +1,21 @@
 import numpy as np
 from typing import List, Dict, Any
 
+from utils.detections import DetectionTable
+
+# Severity labels by rank, from no defects to critical
+SEVERITY_LEVELS = ("No defects", "Low", "Medium", "High", "Critical")
+
+# Advice per defect type, in the order it is given
+RECOMMENDATIONS = {
+    'crack': ["Critical: Cracks detected. Immediate repair required.",
+              "Review welding parameters and technique."],
+    'porosity': ["Porosity detected. Check gas shielding and cleanliness.",
+                 "Consider adjusting welding speed and heat input."],
+    'slag': ["Slag inclusions found. Improve inter-pass cleaning.",
+             "Review welding technique and electrode condition."]
+}
+
 class ImageProcessor:
     def __init__(self):
         pass
@@ -9,44 +24,41 @@ class ImageProcessor:
         """
         Process the raw detection results and return structured data.
         """
-        processed_detections = []
-        defect_types = {}
-        total_confidence = 0
-        
-        for detection in detections:
-            # Calculate center coordinates
-            bbox = detection['bbox']
-            center_x = bbox['x'] + bbox['width'] / 2
-            center_y = bbox['y'] + bbox['height'] / 2
-            
-            # Process detection
-            processed_detection = {
-                'class': detection['class'],
-                'confidence': detection['confidence'],
-                'bbox': bbox,
-                'center': {
-                    'x': center_x,
-                    'y': center_y
-                }
-            }
-            
-            processed_detections.append(processed_detection)
-            
-            # Count defect types
-            defect_type = detection['class']
-            defect_types[defect_type] = defect_types.get(defect_type, 0) + 1
-            
-            # Sum confidence scores
-            total_confidence += detection['confidence']
-        
-        # Calculate average confidence
-        average_confidence = total_confidence / len(detections) if detections else 0
+        return self.process_batch(DetectionTable.from_detections([detections]))[0]
+    
+    def process_batch(self, table: DetectionTable) -> List[Dict[str, Any]]:
+        """
+        Structured results for every film of a detection table, computed in
+        one vectorized pass; dicts are only built for the returned results.
+        """
+        counts = table.detection_counts().tolist()
+        class_counts = table.class_counts().tolist()
+        average_confidence = table.mean_confidence().tolist()
+        severity = self.severity_levels(table)
         
+        results = []
+        for index, detections in enumerate(table.to_dicts()):
+            results.append({
+                'detections': detections,
+                'total_defects': counts[index],
+                'defect_types': {name: count for name, count in zip(table.classes, class_counts[index]) if count},
+                'average_confidence': average_confidence[index],
+                'severity': severity[index]
+            })
+        return results
+    
+    def summarize_batch(self, table: DetectionTable) -> Dict[str, Any]:
+        """
+        Totals over every film of a detection table.
+        """
+        class_counts = table.class_counts().sum(axis=0)
+        levels, level_counts = np.unique(self.severity_levels(table), return_counts=True)
         return {
-            'detections': processed_detections,
-            'total_defects': len(detections),
-            'defect_types': defect_types,
-            'average_confidence': average_confidence
+            'total_defects': len(table),
+            'defect_types': {table.classes[class_id]: int(class_counts[class_id])
+                             for class_id in np.flatnonzero(class_counts)},
+            'average_confidence': float(table.confidence.mean()) if len(table) else 0,
+            'severity_counts': dict(zip(levels.tolist(), level_counts.tolist()))
         }
     
     def extract_image_features(self, image_array: np.ndarray) -> Dict[str, Any]:
@@ -70,46 +82,49 @@ class ImageProcessor:
         """
         Calculate overall defect severity based on detected defects.
         """
-        if not detections:
-            return "No defects"
-        
-        total_defects = len(detections)
-        avg_confidence = sum(d['confidence'] for d in detections) / total_defects
+        return self.severity_levels(DetectionTable.from_detections([detections]))[0]
+    
+    def severity_levels(self, table: DetectionTable) -> List[str]:
+        """
+        Severity of every film in a detection table.
+        """
+        counts = table.detection_counts()
+        average_confidence = table.mean_confidence()
         
         # Critical defects (cracks are most serious)
-        critical_defects = sum(1 for d in detections if d['class'] == 'crack')
-        
-        if critical_defects > 0:
-            return "Critical"
-        elif total_defects > 5 or avg_confidence > 0.9:
-            return "High"
-        elif total_defects > 2 or avg_confidence > 0.7:
-            return "Medium"
+        if 'crack' in table.classes:
+            critical_defects = table.class_counts()[:, table.classes.index('crack')]
         else:
-            return "Low"
+            critical_defects = np.zeros(table.num_images, dtype=np.int64)
+        
+        level = np.select([
+            counts == 0,
+            critical_defects > 0,
+            (counts > 5) | (average_confidence > 0.9),
+            (counts > 2) | (average_confidence > 0.7)
+        ], [0, 4, 3, 2], default=1)
+        return [SEVERITY_LEVELS[value] for value in level.tolist()]
     
     def generate_recommendations(self, detections: List[Dict]) -> List[str]:
         """
         Generate recommendations based on detected defects.
         """
-        recommendations = []
-        
-        if not detections:
-            recommendations.append("No defects detected. Weld quality appears satisfactory.")
-            return recommendations
-        
-        defect_types = set(d['class'] for d in detections)
-        
-        if 'crack' in defect_types:
-            recommendations.append("Critical: Cracks detected. Immediate repair required.")
-            recommendations.append("Review welding parameters and technique.")
+        return self.batch_recommendations(DetectionTable.from_detections([detections]))[0]
+    
+    def batch_recommendations(self, table: DetectionTable) -> List[List[str]]:
+        """
+        Recommendations for every film in a detection table.
+        """
+        present = table.class_counts() > 0
+        recommendations = [[] for _ in range(table.num_images)]
         
-        if 'porosity' in defect_types:
-            recommendations.append("Porosity detected. Check gas shielding and cleanliness.")
-            recommendations.append("Consider adjusting welding speed and heat input.")
+        for index in np.flatnonzero(~present.any(axis=1)):
+            recommendations[index].append("No defects detected. Weld quality appears satisfactory.")
         
-        if 'slag' in defect_types:
-            recommendations.append("Slag inclusions found. Improve inter-pass cleaning.")
-            recommendations.append("Review welding technique and electrode condition.")
+        for defect_type, advice in RECOMMENDATIONS.items():
+            if defect_type not in table.classes:
+                continue
+            for index in np.flatnonzero(present[:, table.classes.index(defect_type)]):
+                recommendations[index].extend(advice)
         
         return recommendations
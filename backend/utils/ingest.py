@@ -0,0 +1,76 @@
+"""
+Decoding uploaded films straight to the detector's input array.
+
+Uploads are decoded from the request stream (or from bytes already in
+memory) without first copying the body, and films that are grayscale
+stay single-channel: gray JPEGs decode straight to 'L', and palette/alpha
+variants of gray films are reduced to 'L' rather than being expanded to
+RGB. The result is a read-only uint8 array that the
+detector converts to float32 itself.
+"""
+import io
+import os
+
+import numpy as np
+from PIL import Image
+
+# Modes the detector reads directly: 8-bit gray and 8-bit RGB.
+_DIRECT_MODES = {'L', 'RGB'}
+# Modes whose color channels carry no extra information for the detector.
+_GRAY_MODES = {'1', 'LA', 'La', 'I', 'I;16', 'F'}
+
+READ_CHUNK_SIZE = 1024 * 1024
+
+
+def open_upload(data):
+    """Open an upload given as bytes or as a seekable binary file object."""
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        return Image.open(io.BytesIO(data))
+    data.seek(0)
+    return Image.open(data)
+
+
+def upload_size(data):
+    """Size in bytes of an upload given as bytes or a seekable file object."""
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        return len(data)
+    position = data.tell()
+    size = data.seek(0, os.SEEK_END)
+    data.seek(position)
+    return size
+
+
+def iter_chunks(data, chunk_size=READ_CHUNK_SIZE):
+    """Yield an upload's bytes in chunks; file objects are read from the start and rewound."""
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        yield data
+        return
+    data.seek(0)
+    while True:
+        chunk = data.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+    data.seek(0)
+
+
+def decode_grayscale(image):
+    """
+    Decode an opened PIL image to a read-only uint8 (H, W) or (H, W, 3) array.
+
+    Gray films come back single-channel; RGB films are kept as decoded and
+    left to tiling.to_grayscale, whose weights apply equally to both forms.
+    Colour JPEGs are not drafted to 'L': libjpeg's luma differs from the
+    detector's weights by a few levels, which changes detections.
+    """
+    if image.mode not in _DIRECT_MODES:
+        if image.mode in _GRAY_MODES:
+            image = image.convert('L')
+        else:
+            image = image.convert('RGB')
+
+    array = np.asarray(image)
+    if array.flags.writeable:
+        array = array.view()
+        array.setflags(write=False)
+    return array
@@ -0,0 +1,276 @@
+"""
+Registry of detection models in a single SQLite file.
+
+Every model is a row keyed by its id, holding its version metadata and the
+detector settings it runs with; a pointer row names the active model. Each
+write bumps a generation counter in the same transaction, so readers can
+tell whether anything changed with one indexed lookup: listings are cached
+until the generation moves, and ActiveModel rebuilds its detector only
+when the active model did.
+
+The file is shared by the training server, which registers and activates
+models, and the analysis server processes, which follow the pointer.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+REGISTRY_FILE = "registry.db"
+CONNECT_TIMEOUT = 10.0  # seconds to wait for another process's write lock
+
+# Pre-trained model that ships with the detector, registered in every new registry
+DEFAULT_MODEL = {
+    "id": "default",
+    "name": "Default Detection Model",
+    "version": "1.0.0",
+    "accuracy": 0.85,
+    "trained_on": "2025-01-01",
+    "description": "Pre-trained model for general welding defect detection",
+    "dataset_size": 1000,
+    "detector_config": {}
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS models (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    version TEXT NOT NULL,
+    registered REAL NOT NULL,
+    info TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+INSERT OR IGNORE INTO state (key, value) VALUES ('generation', '0');
+"""
+
+
+class ModelNotFoundError(LookupError):
+    """Raised when a model id is not in the registry."""
+
+
+class InvalidModelError(ValueError):
+    """Raised when a model's detector settings cannot be built."""
+
+
+class ModelRegistry:
+    def __init__(self, path: str, default_model: Dict = DEFAULT_MODEL,
+                 validate: Optional[Callable[[Dict], object]] = None):
+        """
+        Open or create the registry at path; default_model is registered and
+        active in a new one. validate(model), if given, must raise for a model
+        that cannot be served (e.g. by building its detector); such models are
+        neither registered nor activated.
+        """
+        self.path = os.path.abspath(path)
+        self.default_model_id = default_model["id"]
+        self.validate = validate
+        self._listing = (None, [])
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        db = sqlite3.connect(self.path, timeout=CONNECT_TIMEOUT, isolation_level=None)
+        try:
+            # Readers don't block the writer, or each other
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(SCHEMA)
+        finally:
+            db.close()
+        with self._connect(write=True) as db:
+            if db.execute("SELECT 1 FROM models WHERE id = ?", (default_model["id"],)).fetchone() is None:
+                self._add(db, default_model)
+                self._bump(db)
+
+    def _connect(self, write: bool = False) -> "_Transaction":
+        # A connection per operation, so the registry is safe across threads and forks
+        db = sqlite3.connect(self.path, timeout=CONNECT_TIMEOUT, isolation_level=None)
+        return _Transaction(db, "BEGIN IMMEDIATE" if write else "BEGIN")
+
+    def generation(self) -> int:
+        """Counter bumped by every change to the registry."""
+        with self._connect() as db:
+            return int(db.execute("SELECT value FROM state WHERE key = 'generation'").fetchone()[0])
+
+    def get(self, model_id: str) -> Optional[Dict]:
+        """Record of one model, or None."""
+        with self._connect() as db:
+            row = db.execute("SELECT info FROM models WHERE id = ?", (model_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def list_models(self) -> List[Dict]:
+        """Every model in registration order, flagged with is_active; cached until the registry changes."""
+        generation = self.generation()
+        cached_generation, models = self._listing
+        if generation != cached_generation:
+            with self._connect() as db:
+                generation = int(db.execute("SELECT value FROM state WHERE key = 'generation'").fetchone()[0])
+                rows = db.execute("SELECT info FROM models ORDER BY registered, id").fetchall()
+                active_id = self._active_id(db)
+            models = []
+            for (info,) in rows:
+                model = json.loads(info)
+                model["is_active"] = model["id"] == active_id
+                models.append(model)
+            self._listing = (generation, models)
+        return [dict(model) for model in models]
+
+    def active_model(self) -> Dict:
+        """Record of the active model."""
+        with self._connect() as db:
+            active_id = self._active_id(db)
+            row = db.execute("SELECT info FROM models WHERE id = ?", (active_id,)).fetchone()
+        if row is None:
+            raise ModelNotFoundError(f"Active model {active_id} is not registered")
+        return json.loads(row[0])
+
+    def register(self, model: Dict) -> Dict:
+        """Add a model record (id, name and version are required); returns it."""
+        self.check(model)
+        self._insert([model])
+        return dict(model)
+
+    def check(self, model: Dict):
+        """Raise InvalidModelError if validate rejects the model."""
+        if self.validate is None:
+            return
+        try:
+            self.validate(model)
+        except Exception as e:
+            raise InvalidModelError(f"Model {model.get('id')} has invalid detector settings: {e}")
+
+    def import_models(self, models_dir: str) -> int:
+        """Register model JSON files written before the registry existed; returns how many were new."""
+        models = []
+        if os.path.isdir(models_dir):
+            for filename in sorted(os.listdir(models_dir)):
+                if not filename.endswith('.json'):
+                    continue
+                try:
+                    with open(os.path.join(models_dir, filename), 'r') as f:
+                        model = json.load(f)
+                    model.pop('is_active', None)
+                    model.setdefault('detector_config', {})
+                    if self.get(model['id']) is None:
+                        self.check(model)
+                        models.append(model)
+                except Exception as e:
+                    print(f"Error loading model {filename}: {e}")
+        if models:
+            self._insert(models)
+        return len(models)
+
+    def activate(self, model_id: str) -> Dict:
+        """Point the registry at model_id; returns its record."""
+        model = self.get(model_id)
+        if model is None:
+            raise ModelNotFoundError(f"Model {model_id} not found")
+        # Checked again here: a profile the settings name may have changed since registration
+        self.check(model)
+        with self._connect(write=True) as db:
+            db.execute("INSERT OR REPLACE INTO state (key, value) VALUES ('active_model', ?)", (model_id,))
+            self._bump(db)
+        return model
+
+    def _active_id(self, db) -> str:
+        row = db.execute("SELECT value FROM state WHERE key = 'active_model'").fetchone()
+        return row[0] if row else self.default_model_id
+
+    def _insert(self, models: List[Dict]):
+        with self._connect(write=True) as db:
+            for model in models:
+                self._add(db, model)
+            self._bump(db)
+
+    def _add(self, db, model: Dict):
+        try:
+            db.execute("INSERT INTO models (id, name, version, registered, info) VALUES (?, ?, ?, ?, ?)",
+                       (model["id"], model["name"], model["version"], time.time(), json.dumps(model)))
+        except sqlite3.IntegrityError:
+            raise ValueError(f"Model {model['id']} is already registered")
+
+    def _bump(self, db):
+        db.execute("UPDATE state SET value = CAST(value AS INTEGER) + 1 WHERE key = 'generation'")
+
+
+class _Transaction:
+    """Connection used as `with`: one transaction, committed or rolled back, then closed."""
+
+    def __init__(self, db: sqlite3.Connection, begin: str):
+        self.db = db
+        self.begin = begin
+
+    def __enter__(self) -> sqlite3.Connection:
+        self.db.execute(self.begin)
+        return self.db
+
+    def __exit__(self, exc_type, exc, traceback):
+        try:
+            self.db.execute("ROLLBACK" if exc_type else "COMMIT")
+        finally:
+            self.db.close()
+
+
+class ActiveModel:
+    """
+    An object built from the active model (e.g. a configured detector),
+    rebuilt when the registry points at another model.
+
+    current() checks the registry at most every check_interval seconds and
+    swaps in the rebuilt object with a single assignment; callers that took
+    the previous one keep using it until they finish, so switching models
+    needs no restart and interrupts no request. A thread that finds another
+    one mid-rebuild keeps using the previous object rather than waiting.
+    close(previous), if given, is called on an object once it is replaced,
+    so it can release resources; callers still holding it must keep working.
+    """
+
+    def __init__(self, registry: ModelRegistry, build: Callable[[Dict], object], check_interval: float = 1.0,
+                 close: Optional[Callable[[object], None]] = None):
+        self.registry = registry
+        self.build = build
+        self.check_interval = check_interval
+        self.close = close
+
+        self._lock = threading.Lock()
+        generation = registry.generation()
+        model = registry.active_model()
+        self._state = (generation, model, build(model))
+        self._next_check = time.monotonic() + check_interval
+
+    @property
+    def model(self) -> Dict:
+        """Record of the model the current object was built from."""
+        return dict(self._state[1])
+
+    def current(self):
+        """The object for the active model."""
+        if time.monotonic() >= self._next_check and self._lock.acquire(blocking=False):
+            try:
+                self._refresh()
+            finally:
+                self._lock.release()
+        return self._state[2]
+
+    def _refresh(self):
+        self._next_check = time.monotonic() + self.check_interval
+        generation, model, value = self._state
+        latest = self.registry.generation()
+        if latest == generation:
+            return
+        active = self.registry.active_model()
+        # Registering other models moves the generation too; only a new active model rebuilds
+        if active != model:
+            try:
+                value = self.build(active)
+            except Exception as e:
+                # Keep serving the previous model; the next change is tried again
+                print(f"Error activating model {active['id']}: {e}")
+                self._state = (latest, model, value)
+                return
+        previous = self._state[2]
+        self._state = (latest, active, value)
+        if self.close is not None and value is not previous:
+            self.close(previous)
@@ -0,0 +1,112 @@
+"""
+Whole-array binary morphology for the defect detector.
+
+Results keep the 0/1 semantics of the original per-pixel operators: a
+pixel counts as foreground for dilation when it is non-zero and for
+erosion when it is at least 1, pixels outside the image are background,
+and the output has the input's shape and dtype with values 0 and 1.
+Images are expected to be non-negative (binary masks or gradient
+magnitudes). The structuring element is every non-zero kernel entry.
+
+Rectangular elements are decomposed into a row pass and a column pass,
+each computed with the van Herk/Gil-Werman algorithm, so the cost per
+pixel does not depend on the element size. Other shapes fall back to a
+shifted OR/AND over the element's offsets. The same decomposition backs
+the grey-level max filter used for peak picking.
+"""
+import numpy as np
+
+
+def dilate(image, kernel):
+    """Binary dilation."""
+    return _apply(image != 0, kernel, np.maximum).astype(image.dtype)
+
+
+def erode(image, kernel):
+    """Binary erosion."""
+    return _apply(image >= 1, kernel, np.minimum).astype(image.dtype)
+
+
+def closing(image, kernel):
+    """Dilation followed by erosion; fills gaps narrower than the kernel."""
+    return erode(dilate(image, kernel), kernel)
+
+
+def opening(image, kernel):
+    """Erosion followed by dilation; removes specks smaller than the kernel."""
+    return dilate(erode(image, kernel), kernel)
+
+
+def top_hat(image, kernel):
+    """Foreground pixels removed by an opening (small bright details)."""
+    return ((image != 0) & (opening(image, kernel) == 0)).astype(image.dtype)
+
+
+def gradient(image, kernel):
+    """Dilation minus erosion; marks the boundary band of each region."""
+    return ((dilate(image, kernel) != 0) & (erode(image, kernel) == 0)).astype(image.dtype)
+
+
+def max_filter(image, size):
+    """Grey-level maximum over a size x size window, edge-padded."""
+    pad = size // 2
+    height, width = image.shape
+    # The padded copy is released as soon as the row pass is done
+    rows = _van_herk(np.pad(image, pad, mode='edge'), size, 1, width, np.maximum)
+    return _van_herk(rows, size, 0, height, np.maximum)
+
+
+def is_rectangle(kernel):
+    """True when every kernel entry belongs to the structuring element."""
+    return np.all(np.asarray(kernel) != 0)
+
+
+def _apply(foreground, kernel, ufunc):
+    """Run a max (dilation) or min (erosion) filter over a boolean image."""
+    kernel = np.asarray(kernel)
+    height, width = foreground.shape
+    k_height, k_width = kernel.shape
+    pad_h, pad_w = k_height // 2, k_width // 2
+
+    padded = np.pad(foreground.astype(np.uint8), ((pad_h, pad_h), (pad_w, pad_w)),
+                    mode='constant')
+
+    if kernel.size and is_rectangle(kernel):
+        rows = _van_herk(padded, k_width, 1, width, ufunc)
+        return _van_herk(rows, k_height, 0, height, ufunc).astype(bool)
+
+    # Shifted OR/AND over the offsets of an arbitrary structuring element
+    result = np.full((height, width), ufunc is np.minimum, dtype=bool)
+    combine = np.logical_and if ufunc is np.minimum else np.logical_or
+    for a, b in zip(*np.nonzero(kernel)):
+        combine(result, padded[a:a + height, b:b + width], out=result)
+    return result
+
+
+def _van_herk(padded, size, axis, count, ufunc):
+    """
+    Running max/min of length `size` along one axis (van Herk/Gil-Werman).
+
+    The axis is cut into blocks of `size`; a forward and a backward
+    accumulation inside each block give every window as the combination of
+    one suffix and one prefix, i.e. three comparisons per pixel.
+    """
+    data = np.moveaxis(padded, axis, -1)
+    length = data.shape[-1]
+    blocks = -(-length // size)
+
+    # The tail beyond the padded image is never read by the first `count` windows
+    extended = np.zeros(data.shape[:-1] + (blocks * size,), dtype=data.dtype)
+    extended[..., :length] = data
+    blocked = extended.reshape(data.shape[:-1] + (blocks, size))
+
+    # Suffixes are written through a reversed view so no reordered copy is
+    # made; prefixes then overwrite the blocks in place
+    suffix = np.empty_like(blocked)
+    ufunc.accumulate(blocked[..., ::-1], axis=-1, out=suffix[..., ::-1])
+    ufunc.accumulate(blocked, axis=-1, out=blocked)
+    prefix = extended
+    suffix = suffix.reshape(extended.shape)
+
+    result = ufunc(suffix[..., :count], prefix[..., size - 1:size - 1 + count])
+    return np.moveaxis(result, -1, axis)
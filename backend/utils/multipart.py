@@ -0,0 +1,110 @@
+"""
+Incremental multipart/form-data parsing straight from a request stream.
+
+Werkzeug's form parser spools every uploaded file before the view runs.
+iter_multipart_parts instead hands out one part at a time as a small
+file-like object whose body is read from the socket on demand, so a
+handler can validate and store each file before the next one arrives
+and memory stays bounded by the read chunk size.
+"""
+from typing import Iterator, Optional
+
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File, MultipartDecoder, NeedData
+
+READ_CHUNK_SIZE = 64 * 1024
+
+
+class MultipartPart:
+    """One part of a multipart body; read() consumes it, peek() looks ahead."""
+
+    def __init__(self, parser, name: str, filename: Optional[str], headers):
+        self.name = name
+        self.filename = filename
+        self.headers = headers
+        self.size = 0
+        self._parser = parser
+        self._buffer = b""
+        self._done = False
+
+    @property
+    def content_type(self) -> Optional[str]:
+        return self.headers.get('content-type')
+
+    def _fill(self, size: int):
+        """Buffer body bytes until `size` are held (all of them when size < 0) or the part ends."""
+        chunks = [self._buffer]
+        held = len(self._buffer)
+        while not self._done and (size < 0 or held < size):
+            event = self._parser.next_event()
+            if not isinstance(event, Data):
+                raise ValueError("Malformed multipart body")
+            chunks.append(event.data)
+            held += len(event.data)
+            self._done = not event.more_data
+        self._buffer = b"".join(chunks)
+
+    def peek(self, size: int) -> bytes:
+        """The next `size` body bytes (fewer at the end of the part), without consuming them."""
+        self._fill(size)
+        return self._buffer[:size]
+
+    def read(self, size: int = -1) -> bytes:
+        """Up to `size` body bytes; everything left when size < 0."""
+        if not self._buffer and not self._done:
+            self._fill(1 if size >= 0 else -1)
+        if size < 0 or size >= len(self._buffer):
+            data, self._buffer = self._buffer, b""
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        self.size += len(data)
+        return data
+
+    def drain(self):
+        """Skip the rest of the body."""
+        while not self._done:
+            event = self._parser.next_event()
+            if not isinstance(event, Data):
+                raise ValueError("Malformed multipart body")
+            self._done = not event.more_data
+        self._buffer = b""
+
+
+class _StreamParser:
+    """Feeds a MultipartDecoder from a stream as events are requested."""
+
+    def __init__(self, stream, boundary: bytes, chunk_size: int, max_parts: Optional[int]):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.decoder = MultipartDecoder(boundary, max_parts=max_parts)
+        self.finished = False
+
+    def next_event(self):
+        while True:
+            event = self.decoder.next_event()
+            if not isinstance(event, NeedData):
+                return event
+            if self.finished:
+                raise ValueError("Multipart body ended unexpectedly")
+            chunk = self.stream.read(self.chunk_size)
+            self.finished = not chunk
+            self.decoder.receive_data(chunk or None)
+
+
+def iter_multipart_parts(stream, boundary, chunk_size: int = READ_CHUNK_SIZE,
+                         max_parts: Optional[int] = None) -> Iterator[MultipartPart]:
+    """
+    Yield the parts of a multipart body in order. A part must be consumed
+    before the next one is requested; whatever is left of it is skipped.
+    """
+    if isinstance(boundary, str):
+        boundary = boundary.encode('latin-1')
+    parser = _StreamParser(stream, boundary, chunk_size, max_parts)
+
+    while True:
+        event = parser.next_event()
+        if isinstance(event, Epilogue):
+            return
+        if isinstance(event, (File, Field)):
+            part = MultipartPart(parser, event.name, getattr(event, 'filename', None), event.headers)
+            yield part
+            part.drain()
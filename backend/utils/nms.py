@@ -0,0 +1,183 @@
+"""
+Array-based non-maximum suppression for detection post-processing.
+
+Boxes are (N, 4) float arrays of x1, y1, x2, y2 corners. IoU uses plain
+width * height areas (no +1), like the detector always has. Greedy NMS
+keeps boxes in descending score order (ties keep input order) and drops
+any box whose IoU with an already kept box exceeds the threshold.
+
+Small candidate sets are suppressed against a dense IoU row per kept
+box. Large sets first bucket boxes into a uniform grid sized to the
+largest box, so only boxes in neighbouring cells are ever compared and
+the cost grows with the number of overlapping pairs, not N squared.
+"""
+import numpy as np
+
+# Candidate count above which the spatial-grid prefilter is used.
+GRID_MIN_BOXES = 512
+
+
+def boxes_from_detections(detections):
+    """(N, 4) corner array from detection dicts with dict or [x, y, w, h] bboxes."""
+    boxes = np.zeros((len(detections), 4), dtype=np.float64)
+    for index, detection in enumerate(detections):
+        bbox = detection['bbox']
+        if isinstance(bbox, dict):
+            x, y, w, h = bbox['x'], bbox['y'], bbox['width'], bbox['height']
+        else:
+            x, y, w, h = bbox
+        boxes[index] = (x, y, x + w, y + h)
+    return boxes
+
+
+def box_areas(boxes):
+    """Width * height of every box."""
+    return (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+
+
+def iou_matrix(boxes_a, boxes_b):
+    """Pairwise IoU, shape (len(boxes_a), len(boxes_b))."""
+    boxes_a = np.asarray(boxes_a, dtype=np.float64).reshape(-1, 4)
+    boxes_b = np.asarray(boxes_b, dtype=np.float64).reshape(-1, 4)
+
+    left = np.maximum(boxes_a[:, None, 0], boxes_b[None, :, 0])
+    top = np.maximum(boxes_a[:, None, 1], boxes_b[None, :, 1])
+    right = np.minimum(boxes_a[:, None, 2], boxes_b[None, :, 2])
+    bottom = np.minimum(boxes_a[:, None, 3], boxes_b[None, :, 3])
+
+    intersection = np.clip(right - left, 0, None) * np.clip(bottom - top, 0, None)
+    union = box_areas(boxes_a)[:, None] + box_areas(boxes_b)[None, :] - intersection
+    return np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
+
+
+def pairwise_iou(boxes, first, second):
+    """IoU of boxes[first[k]] and boxes[second[k]] for every k."""
+    a, b = boxes[first], boxes[second]
+    width = np.clip(np.minimum(a[:, 2], b[:, 2]) - np.maximum(a[:, 0], b[:, 0]), 0, None)
+    height = np.clip(np.minimum(a[:, 3], b[:, 3]) - np.maximum(a[:, 1], b[:, 1]), 0, None)
+    intersection = width * height
+    union = box_areas(a) + box_areas(b) - intersection
+    return np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
+
+
+def nms(boxes, scores, iou_threshold, classes=None):
+    """
+    Greedy NMS. Returns the indices of kept boxes in descending score order.
+    With `classes`, boxes only suppress boxes of the same class.
+    """
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    order = np.argsort(-np.asarray(scores, dtype=np.float64), kind='stable')
+    if len(order) == 0:
+        return order
+
+    if len(order) >= GRID_MIN_BOXES:
+        return _nms_grid(boxes, order, iou_threshold, classes)
+
+    keep = []
+    suppressed = np.zeros(len(boxes), dtype=bool)
+    for position, index in enumerate(order):
+        if suppressed[index]:
+            continue
+        keep.append(index)
+        rest = order[position + 1:]
+        overlaps = iou_matrix(boxes[index], boxes[rest])[0] > iou_threshold
+        if classes is not None:
+            overlaps &= classes[rest] == classes[index]
+        suppressed[rest[overlaps]] = True
+
+    return np.asarray(keep, dtype=np.int64)
+
+
+def soft_nms(boxes, scores, iou_threshold, sigma=0.5, score_threshold=0.001,
+             method='gaussian', classes=None):
+    """
+    Soft-NMS: overlapping boxes have their scores decayed instead of being
+    dropped. Returns (indices, scores) of boxes still above score_threshold,
+    in the order they were selected.
+    """
+    if method not in ('gaussian', 'linear'):
+        raise ValueError(f"Unknown Soft-NMS method: {method}")
+
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    scores = np.asarray(scores, dtype=np.float64).copy()
+    remaining = np.arange(len(boxes))
+    keep, kept_scores = [], []
+
+    while remaining.size:
+        best = np.argmax(scores[remaining])
+        index = remaining[best]
+        if scores[index] < score_threshold:
+            break
+        keep.append(index)
+        kept_scores.append(scores[index])
+        remaining = np.delete(remaining, best)
+
+        overlap = iou_matrix(boxes[index], boxes[remaining])[0]
+        if method == 'gaussian':
+            decay = np.exp(-(overlap ** 2) / sigma)
+        else:
+            decay = np.where(overlap > iou_threshold, 1 - overlap, 1.0)
+        if classes is not None:
+            decay = np.where(classes[remaining] == classes[index], decay, 1.0)
+        scores[remaining] *= decay
+
+    return np.asarray(keep, dtype=np.int64), np.asarray(kept_scores)
+
+
+def _nms_grid(boxes, order, iou_threshold, classes):
+    """Greedy NMS over the sparse overlap graph found with a uniform grid."""
+    first, second = _candidate_pairs(boxes)
+    if classes is not None:
+        same = classes[first] == classes[second]
+        first, second = first[same], second[same]
+
+    conflict = pairwise_iou(boxes, first, second) > iou_threshold
+    first, second = first[conflict], second[conflict]
+
+    # Adjacency lists (both directions) in CSR form
+    sources = np.concatenate([first, second])
+    targets = np.concatenate([second, first])
+    sorting = np.argsort(sources, kind='stable')
+    targets = targets[sorting]
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(sources, minlength=len(boxes)))])
+
+    keep = []
+    suppressed = np.zeros(len(boxes), dtype=bool)
+    for index in order:
+        if suppressed[index]:
+            continue
+        keep.append(index)
+        suppressed[targets[offsets[index]:offsets[index + 1]]] = True
+
+    return np.asarray(keep, dtype=np.int64)
+
+
+def _candidate_pairs(boxes):
+    """Index pairs (i < j) of boxes that share or neighbour a grid cell."""
+    sizes = np.concatenate([boxes[:, 2] - boxes[:, 0], boxes[:, 3] - boxes[:, 1]])
+    cell = max(float(sizes.max()), 1.0)
+
+    # Overlapping boxes have top-left corners at most one cell apart
+    cell_x = np.floor((boxes[:, 0] - boxes[:, 0].min()) / cell).astype(np.int64)
+    cell_y = np.floor((boxes[:, 1] - boxes[:, 1].min()) / cell).astype(np.int64)
+    stride = int(cell_x.max()) + 3
+    keys = (cell_y + 1) * stride + (cell_x + 1)
+
+    by_cell = np.argsort(keys, kind='stable')
+    sorted_keys = keys[by_cell]
+
+    firsts, seconds = [], []
+    for dy in (-1, 0, 1):
+        for dx in (-1, 0, 1):
+            target = keys + dy * stride + dx
+            start = np.searchsorted(sorted_keys, target, side='left')
+            stop = np.searchsorted(sorted_keys, target, side='right')
+            counts = stop - start
+            source = np.repeat(np.arange(len(boxes)), counts)
+            offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            partner = by_cell[np.repeat(start, counts) + offsets]
+            forward = source < partner
+            firsts.append(source[forward])
+            seconds.append(partner[forward])
+
+    return np.concatenate(firsts), np.concatenate(seconds)
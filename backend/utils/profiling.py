@@ -0,0 +1,175 @@
+"""
+Per-stage timing instrumentation and aggregated stage metrics.
+
+StageProfiler measures wall time, CPU time of the calling thread, peak
+traced memory and candidate counts for each named pipeline stage.
+MetricsRegistry folds those measurements into fixed-bucket histograms
+that can be served from a metrics endpoint.
+
+Memory is measured with tracemalloc, which NumPy reports its buffers
+to. Tracing slows allocation down, so it only runs while at least one
+profiler asks for it. Its peak is process-wide: stages of one request that
+would overlap are run one after another while memory is traced (see
+StageScheduler.run), but with concurrent traced requests the figures
+include the other requests' allocations.
+"""
+import time
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from typing import Dict, List
+
+# Upper bounds (seconds) of the stage latency histogram buckets.
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_tracing_lock = threading.Lock()
+_tracing_users = 0
+
+
+def _start_tracing():
+    global _tracing_users
+    with _tracing_lock:
+        if _tracing_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        _tracing_users += 1
+
+
+def _stop_tracing():
+    global _tracing_users
+    with _tracing_lock:
+        _tracing_users -= 1
+        if _tracing_users == 0 and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+
+class StageRecord:
+    """Accumulated measurements for one stage name."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0
+        self.wall_time = 0.0
+        self.cpu_time = 0.0
+        self.peak_memory_bytes = None
+        self.candidates = None
+
+    def add_candidates(self, count: int):
+        self.candidates = (self.candidates or 0) + count
+
+    def to_dict(self) -> Dict:
+        return {
+            'stage': self.name,
+            'calls': self.calls,
+            'wall_time': self.wall_time,
+            'cpu_time': self.cpu_time,
+            'peak_memory_bytes': self.peak_memory_bytes,
+            'candidates': self.candidates
+        }
+
+
+class StageProfiler:
+    def __init__(self, enabled: bool = True, trace_memory: bool = False):
+        self.enabled = enabled
+        self.trace_memory = enabled and trace_memory
+        self._records = {}
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str):
+        """Measure the enclosed block as (another call of) stage `name`."""
+        record = self._records.get(name)
+        if record is None:
+            record = StageRecord(name)
+            if self.enabled:
+                self._records[name] = record
+
+        if not self.enabled:
+            yield record
+            return
+
+        if self.trace_memory:
+            _start_tracing()
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time()
+        try:
+            yield record
+        finally:
+            record.calls += 1
+            record.wall_time += time.perf_counter() - wall_start
+            record.cpu_time += time.thread_time() - cpu_start
+            if self.trace_memory:
+                peak = tracemalloc.get_traced_memory()[1] - baseline
+                record.peak_memory_bytes = max(record.peak_memory_bytes or 0, peak)
+                _stop_tracing()
+
+    def records(self) -> List[Dict]:
+        """Stage measurements in the order stages first ran."""
+        return [record.to_dict() for record in self._records.values()]
+
+    def to_dict(self) -> Dict:
+        """The `timings` block returned to clients."""
+        return {
+            'stages': self.records(),
+            'total_wall_time': time.perf_counter() - self._started,
+            'memory_traced': self.trace_memory
+        }
+
+
+class MetricsRegistry:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def observe(self, profiler: StageProfiler):
+        """Fold one request's stage measurements into the histograms."""
+        with self._lock:
+            for record in profiler.records():
+                stage = self._stages.get(record['stage'])
+                if stage is None:
+                    stage = {
+                        'count': 0,
+                        'wall_time_sum': 0.0,
+                        'cpu_time_sum': 0.0,
+                        'candidates_sum': 0,
+                        'max_peak_memory_bytes': 0,
+                        'bucket_counts': [0] * (len(self.buckets) + 1)
+                    }
+                    self._stages[record['stage']] = stage
+
+                stage['count'] += 1
+                stage['wall_time_sum'] += record['wall_time']
+                stage['cpu_time_sum'] += record['cpu_time']
+                stage['candidates_sum'] += record['candidates'] or 0
+                if record['peak_memory_bytes'] is not None:
+                    stage['max_peak_memory_bytes'] = max(stage['max_peak_memory_bytes'],
+                                                         record['peak_memory_bytes'])
+                index = len(self.buckets)
+                for position, bound in enumerate(self.buckets):
+                    if record['wall_time'] <= bound:
+                        index = position
+                        break
+                stage['bucket_counts'][index] += 1
+
+    def snapshot(self) -> Dict:
+        """Cumulative histograms per stage (le = bucket upper bound)."""
+        with self._lock:
+            stages = {}
+            for name, stage in self._stages.items():
+                cumulative, running = [], 0
+                for bound, count in zip(self.buckets + (float('inf'),), stage['bucket_counts']):
+                    running += count
+                    cumulative.append({'le': 'inf' if bound == float('inf') else bound,
+                                       'count': running})
+                stages[name] = {
+                    'count': stage['count'],
+                    'wall_time_sum': stage['wall_time_sum'],
+                    'cpu_time_sum': stage['cpu_time_sum'],
+                    'mean_wall_time': stage['wall_time_sum'] / stage['count'],
+                    'candidates_sum': stage['candidates_sum'],
+                    'max_peak_memory_bytes': stage['max_peak_memory_bytes'],
+                    'wall_time_histogram': cumulative
+                }
+            return {'stages': stages}
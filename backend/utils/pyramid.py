@@ -0,0 +1,71 @@
+"""
+Coarse levels and candidate regions for coarse-to-fine detection.
+
+A film is reduced by block averaging, cheap tests on the coarse level
+mark where defects could be, and only those regions (grown by a margin
+that covers the detectors' reach) are processed at full resolution.
+Regions are returned as (core, tile) box pairs like tiling.tile_layout:
+detections are searched in the tile and kept when centred in the core.
+"""
+import numpy as np
+
+
+def downsample(image, factor):
+    """Block mean of a 2-D image; edge blocks are padded by replication."""
+    if factor <= 1:
+        return np.asarray(image)
+    height, width = image.shape
+    pad_y, pad_x = -height % factor, -width % factor
+    if pad_y or pad_x:
+        image = np.pad(image, ((0, pad_y), (0, pad_x)), mode='edge')
+    blocks = image.reshape(image.shape[0] // factor, factor, image.shape[1] // factor, factor)
+    return blocks.mean(axis=(1, 3))
+
+
+def upsample_mask(mask, factor, shape):
+    """Nearest-neighbour upscaling of a coarse mask, cropped to shape."""
+    return np.repeat(np.repeat(mask, factor, axis=0), factor, axis=1)[:shape[0], :shape[1]]
+
+
+def transitions(mask):
+    """Pixels on either side of a foreground/background change (image edges excluded)."""
+    edges = np.zeros(mask.shape, dtype=bool)
+    horizontal = mask[:, 1:] != mask[:, :-1]
+    vertical = mask[1:, :] != mask[:-1, :]
+    edges[:, 1:] |= horizontal
+    edges[:, :-1] |= horizontal
+    edges[1:, :] |= vertical
+    edges[:-1, :] |= vertical
+    return edges
+
+
+def candidate_layout(mask, factor, bounds, cell_size, overlap):
+    """
+    (core, tile) boxes covering the coarse candidate mask at full resolution.
+
+    The bounds are split into a grid of cell_size cells as tile_layout does,
+    and only cells holding a candidate are kept; neighbouring kept cells in
+    a grid row are joined into one core. Cores never overlap, and each tile
+    is its core grown by overlap, clipped to the bounds.
+    """
+    x_min, y_min, x_max, y_max = bounds
+    full = upsample_mask(mask, factor, (y_max, x_max))[y_min:y_max, x_min:x_max]
+
+    layout = []
+    for top in range(y_min, y_max, cell_size):
+        bottom = min(top + cell_size, y_max)
+        band = full[top - y_min:bottom - y_min].any(axis=0)
+        lefts = range(x_min, x_max, cell_size)
+        occupied = [band[left - x_min:left - x_min + cell_size].any() for left in lefts]
+
+        start = None
+        for left, busy in zip(list(lefts) + [x_max], occupied + [False]):
+            if busy and start is None:
+                start = left
+            elif not busy and start is not None:
+                core = (start, top, min(left, x_max), bottom)
+                tile = (max(x_min, core[0] - overlap), max(y_min, core[1] - overlap),
+                        min(x_max, core[2] + overlap), min(y_max, core[3] + overlap))
+                layout.append((core, tile))
+                start = None
+    return layout
@@ -0,0 +1,184 @@
+"""
+Content-addressed cache for analysis results.
+
+Results are keyed by a hash of the uploaded bytes plus a fingerprint of
+the detector configuration, so a re-upload of the same film under the
+same thresholds and model is answered without running detection again.
+An in-memory LRU tier is bounded by entry count and age; an optional
+on-disk tier of JSON files survives restarts.
+"""
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from utils.ingest import iter_chunks
+
+
+# The disk tier may grow this far past max_disk_entries (as a fraction of it)
+# before the oldest files are pruned; pruning lists the whole directory, so
+# it runs once per batch of new entries rather than on every write.
+DISK_PRUNE_SLACK = 0.125
+
+
+def config_fingerprint(config: Dict[str, Any]) -> str:
+    """Stable hash of a detector configuration dict."""
+    encoded = json.dumps(config, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def cache_key(image_data, config: Dict[str, Any]) -> str:
+    """Key for an upload (bytes or a seekable file) analysed under a given configuration."""
+    digest = hashlib.sha256()
+    for chunk in iter_chunks(image_data):
+        digest.update(chunk)
+    return f"{digest.hexdigest()}-{config_fingerprint(config)[:16]}"
+
+
+class ResultCache:
+    def __init__(self, max_entries: int = 256, ttl: float = 3600,
+                 disk_dir: Optional[str] = None, max_disk_entries: int = 4096):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk_dir = disk_dir
+        self.max_disk_entries = max_disk_entries
+        self.hits = 0
+        self.misses = 0
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Files in the disk tier when last listed, plus those written since
+        self._disk_entries = None
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Return the cached result for key, or None."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, value = entry
+                if now - stored_at <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+
+        value = self._read_disk(key, now)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            # Promote disk hits into memory
+            self._store(key, value, now)
+            self.hits += 1
+        return value
+
+    def put(self, key: str, value: Dict) -> None:
+        """Store a JSON-serializable result."""
+        now = time.time()
+        with self._lock:
+            self._store(key, value, now)
+        self._write_disk(key, value, now)
+
+    def clear(self) -> None:
+        """Drop every entry from both tiers."""
+        with self._lock:
+            self._entries.clear()
+        if self.disk_dir:
+            for filename in os.listdir(self.disk_dir):
+                if filename.endswith('.json'):
+                    os.remove(os.path.join(self.disk_dir, filename))
+            with self._lock:
+                self._disk_entries = 0
+
+    def get_stats(self) -> Dict:
+        """Hit/miss counters and tier sizes."""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'disk_enabled': bool(self.disk_dir)
+            }
+
+    def _store(self, key, value, now):
+        self._entries[key] = (now, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _read_disk(self, key, now):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, 'r') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if now - entry.get('stored_at', 0) > self.ttl:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return entry.get('value')
+
+    def _write_disk(self, key, value, now):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        is_new = not os.path.exists(path)
+        try:
+            with open(temp_path, 'w') as f:
+                json.dump({'stored_at': now, 'value': value}, f)
+            # Atomic rename so concurrent readers never see a partial file
+            os.replace(temp_path, path)
+        except (OSError, TypeError, ValueError) as e:
+            print(f"Error writing result cache entry {key}: {e}")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return
+        if is_new:
+            high_water = self.max_disk_entries + max(1, int(self.max_disk_entries * DISK_PRUNE_SLACK))
+            with self._lock:
+                if self._disk_entries is not None:
+                    self._disk_entries += 1
+                prune = self._disk_entries is None or self._disk_entries > high_water
+            if prune:
+                self._prune_disk()
+
+    def _prune_disk(self):
+        """
+        Remove the oldest files once the disk tier is over its limit, and
+        recount it. Other processes sharing disk_dir keep their own counts,
+        so the tier can overshoot until one of them prunes.
+        """
+        try:
+            files = [os.path.join(self.disk_dir, name)
+                     for name in os.listdir(self.disk_dir) if name.endswith('.json')]
+            if len(files) > self.max_disk_entries:
+                files.sort(key=os.path.getmtime)
+                for path in files[:len(files) - self.max_disk_entries]:
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass  # pruned by another process
+                files = files[len(files) - self.max_disk_entries:]
+        except OSError:
+            files = None
+        with self._lock:
+            self._disk_entries = len(files) if files is not None else None
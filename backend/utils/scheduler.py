@@ -0,0 +1,98 @@
+"""
+Shared intermediates and concurrent execution for independent stages.
+
+SharedBuffers computes named intermediates (normalized image, blurred
+image, gradient magnitude, ...) on first use and hands the same array
+to every stage that asks for it. StageScheduler runs independent stages
+on a small thread pool; the heavy work is NumPy code that releases the
+GIL, so the stages overlap on multi-core machines.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Sequence, Tuple
+
+
+class SharedBuffers:
+    """Lazily computed, read-only intermediates of one image."""
+
+    def __init__(self, image, factories: Dict[str, Callable]):
+        """factories[name](buffers) computes the buffer called name."""
+        self.image = image
+        self._factories = factories
+        self._values = {}
+        self._locks = {name: threading.Lock() for name in factories}
+
+    def get(self, name: str):
+        """Return the named buffer, computing it once across threads."""
+        if name in self._values:
+            return self._values[name]
+        with self._locks[name]:
+            if name not in self._values:
+                value = self._factories[name](self)
+                if hasattr(value, 'setflags'):
+                    value.setflags(write=False)
+                self._values[name] = value
+        return self._values[name]
+
+
+class StageScheduler:
+    def __init__(self, max_workers: int = 3):
+        self.max_workers = max_workers
+        self._executor = None
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def run(self, tasks: Sequence[Tuple[str, Callable]], report=None, profiler=None) -> List:
+        """
+        Run (name, fn) tasks and return their results in task order.
+
+        Each task reports report(name, 'started') when it begins and
+        report(name, 'completed') when it returns, so overlapping tasks are
+        never shown as finished early. With a profiler, each task is
+        measured as its own stage (CPU time is per thread); a profiler that
+        traces memory makes the tasks run one after another.
+        """
+        report = report or (lambda stage, state='running': None)
+
+        def run_task(name, fn):
+            report(name, 'started')
+            if profiler is None:
+                result = fn()
+            else:
+                with profiler.stage(name) as stage:
+                    result = fn()
+                    if isinstance(result, list):
+                        stage.add_candidates(len(result))
+            report(name, 'completed')
+            return result
+
+        # tracemalloc's peak is process-wide, so traced stages run one at a time
+        # to keep each stage's peak memory its own
+        tracing = profiler is not None and profiler.trace_memory
+        if self.max_workers <= 1 or len(tasks) <= 1 or tracing:
+            return [run_task(name, fn) for name, fn in tasks]
+
+        with self._lock:
+            # A scheduler that was shut down still runs tasks, one after another
+            if self._closed:
+                futures = None
+            else:
+                # The thread pool starts on first use
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                        thread_name_prefix='detector-stage')
+                futures = [self._executor.submit(run_task, name, fn) for name, fn in tasks]
+        if futures is None:
+            return [run_task(name, fn) for name, fn in tasks]
+        return [future.result() for future in futures]
+
+    def shutdown(self, wait: bool = True):
+        """
+        Stop the thread pool. Tasks already handed out still finish; with
+        wait=False their threads exit afterwards instead of being waited for.
+        """
+        with self._lock:
+            self._closed = True
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
@@ -0,0 +1,39 @@
+"""
+Reusable scratch buffers for detector temporaries.
+
+Whole-array stages allocate several image-sized temporaries per call;
+allocating them fresh for every tile and request costs page faults and
+cache misses. scratch() hands out an uninitialized array backed by a
+per-thread buffer that only grows, so repeated calls of the same shape
+reuse warm memory. Callers must not keep or return scratch arrays, and
+a name must not be requested twice while the first array is in use.
+"""
+import threading
+
+import numpy as np
+
+_local = threading.local()
+
+
+def scratch(name, shape, dtype):
+    """Uninitialized array of shape/dtype backed by this thread's `name` buffer."""
+    dtype = np.dtype(dtype)
+    size = int(np.prod(shape)) * dtype.itemsize
+    buffers = getattr(_local, 'buffers', None)
+    if buffers is None:
+        buffers = _local.buffers = {}
+
+    buffer = buffers.get(name)
+    if buffer is None or buffer.size < size:
+        buffer = buffers[name] = np.empty(size, dtype=np.uint8)
+    return buffer[:size].view(dtype).reshape(shape)
+
+
+def release():
+    """Drop this thread's scratch buffers."""
+    _local.buffers = {}
+
+
+def scratch_bytes():
+    """Bytes currently held by this thread's scratch buffers."""
+    return sum(buffer.size for buffer in getattr(_local, 'buffers', {}).values())
@@ -0,0 +1,155 @@
+"""
+Tile sources and tile layout for streaming inference on very large films.
+
+A tile source hands out grayscale float32 regions of an image on demand,
+so the detector only ever holds one tile of working buffers. Uncompressed
+images (.npy files and raw single-strip PGM/PPM/TIFF/BMP) are memory-mapped
+and read lazily from disk; compressed formats are decoded once into their
+compact 8-bit form and tiles are converted from that.
+"""
+import math
+import threading
+
+import numpy as np
+from PIL import Image
+
+# Luma weights used by the detector for RGB films.
+GRAY_WEIGHTS = np.array([0.2989, 0.5870, 0.1140], dtype=np.float32)
+
+# Grayscale value of each 8-bit level seen through GRAY_WEIGHTS, so an 'L'
+# film converts to exactly the values its RGB copy would.
+GRAY_LEVELS = np.dot(np.repeat(np.arange(256, dtype=np.uint8), 3).reshape(256, 1, 3),
+                     GRAY_WEIGHTS)[:, 0].astype(np.float32)
+
+# Rough working-set size of the detector stages per tile pixel (float32
+# image, padded copies, gradients and the Hough accumulators).
+BYTES_PER_TILE_PIXEL = 160
+
+# PIL modes that can be memory-mapped straight from a raw tile.
+_MAPPABLE_MODES = {'L': 1, 'RGB': 3}
+
+# Serializes lifting Image.MAX_IMAGE_PIXELS in _open_trusted
+_bomb_check_lock = threading.Lock()
+
+
+def to_grayscale(array):
+    """Grayscale float32 copy of an (H, W) or (H, W, C) image array."""
+    if array.ndim == 3:
+        return np.dot(array[..., :3], GRAY_WEIGHTS).astype(np.float32, copy=False)
+    if array.dtype == np.uint8:
+        return GRAY_LEVELS[array]
+    return np.asarray(array, dtype=np.float32)
+
+
+def intensity_histogram(gray):
+    """256-bin histogram of grayscale values in [0, 256), one bin per integer level."""
+    return np.bincount(gray.astype(np.uint8).ravel(), minlength=256)[:256]
+
+
+def tile_size_for_budget(budget_mb, overlap):
+    """Largest square tile whose working set fits in budget_mb."""
+    side = int(math.sqrt(budget_mb * 1024 * 1024 / BYTES_PER_TILE_PIXEL))
+    if side <= 2 * overlap:
+        raise ValueError("Tile memory budget too small for the requested overlap")
+    return side
+
+
+def tile_layout(bounds, tile_size, overlap):
+    """
+    Split (x_min, y_min, x_max, y_max) into tiles.
+
+    Yields (core, tile) box pairs: the cores partition the bounds, and each
+    tile is its core grown by `overlap` on every side, clipped to the bounds.
+    """
+    x_min, y_min, x_max, y_max = bounds
+    step = tile_size - 2 * overlap
+    for core_y in range(y_min, y_max, step):
+        for core_x in range(x_min, x_max, step):
+            core = (core_x, core_y, min(core_x + step, x_max), min(core_y + step, y_max))
+            tile = (max(x_min, core[0] - overlap), max(y_min, core[1] - overlap),
+                    min(x_max, core[2] + overlap), min(y_max, core[3] + overlap))
+            yield core, tile
+
+
+class ArrayTileSource:
+    """Tiles cut from an in-memory or memory-mapped image array."""
+
+    def __init__(self, array):
+        self.array = array
+        self.height, self.width = array.shape[:2]
+
+    @property
+    def size(self):
+        return (self.width, self.height)
+
+    def read(self, box):
+        """Grayscale float32 pixels of an (x_min, y_min, x_max, y_max) box."""
+        x_min, y_min, x_max, y_max = box
+        return to_grayscale(self.array[y_min:y_max, x_min:x_max])
+
+    def histogram(self, rows=1024):
+        """256-bin intensity histogram, accumulated a strip of rows at a time."""
+        hist = np.zeros(256, dtype=np.int64)
+        for top in range(0, self.height, rows):
+            strip = self.read((0, top, self.width, min(self.height, top + rows)))
+            hist += intensity_histogram(strip)
+        return hist
+
+
+def open_tile_source(source):
+    """Wrap a path, PIL image or array in a tile source."""
+    if isinstance(source, ArrayTileSource):
+        return source
+    if isinstance(source, np.ndarray):
+        return ArrayTileSource(source)
+    if isinstance(source, Image.Image):
+        return ArrayTileSource(np.asarray(source))
+
+    path = str(source)
+    if path.endswith('.npy'):
+        return ArrayTileSource(np.load(path, mmap_mode='r'))
+
+    image = _open_trusted(path)
+    mapped = _map_raw_image(path, image)
+    if mapped is not None:
+        return ArrayTileSource(mapped)
+
+    # Compressed formats must be decoded, but keep them at 8 bits per channel
+    if image.mode not in _MAPPABLE_MODES:
+        image = image.convert('RGB' if 'A' in image.mode or image.mode == 'P' else 'L')
+    return ArrayTileSource(np.asarray(image))
+
+
+def _open_trusted(path):
+    """
+    Image.open without Pillow's decompression-bomb limit, which rejects the
+    8k-16k scans this path exists for. Only films read from local paths
+    come through here, never uploads. The limit is lifted only while the
+    header is read, but it is process-wide for that moment.
+    """
+    with _bomb_check_lock:
+        limit, Image.MAX_IMAGE_PIXELS = Image.MAX_IMAGE_PIXELS, None
+        try:
+            return Image.open(path)
+        finally:
+            Image.MAX_IMAGE_PIXELS = limit
+
+
+def _map_raw_image(path, image):
+    """Memory-map an uncompressed single-strip image, or return None."""
+    channels = _MAPPABLE_MODES.get(image.mode)
+    if channels is None or len(image.tile) != 1:
+        return None
+
+    decoder, extent, offset, args = image.tile[0]
+    raw_mode = args[0] if isinstance(args, tuple) else args
+    if decoder != 'raw' or raw_mode != image.mode or tuple(extent) != (0, 0) + image.size:
+        return None
+    # A stride other than the packed row size or a bottom-up layout needs decoding
+    if isinstance(args, tuple) and len(args) > 1 and args[1] not in (0, image.width * channels):
+        return None
+    if isinstance(args, tuple) and len(args) > 2 and args[2] != 1:
+        return None
+
+    shape = (image.height, image.width) + ((channels,) if channels > 1 else ())
+    return np.memmap(path, dtype=np.uint8, mode='r', offset=offset, shape=shape)
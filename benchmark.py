@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for the welding defect detection pipeline.
+
+Builds synthetic films from the demo generators at several sizes and
+defect densities, times every detector stage and the /api/analyze
+round trip (through the Flask test client), and writes throughput,
+latency percentiles and peak memory to a JSON file. Results can be
+saved as a baseline and later runs compared against it:
+
+    python benchmark.py --save-baseline          # record bench_baseline.json
+    python benchmark.py                          # compare, exit 1 on regression
+    python benchmark.py --quick > bench_output.txt
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from demo_images import create_xray_with_defects, create_clean_xray
+from test_boundary_fix import create_test_xray_image
+from models.yolo_detector import YOLODetector
+from utils.profiling import StageProfiler
+
+GENERATORS = {
+    'defects': create_xray_with_defects,
+    'clean': create_clean_xray,
+    'bordered': create_test_xray_image
+}
+DEFAULT_SIZES = ((512, 384), (1024, 768), (2048, 1536))
+QUICK_SIZES = ((512, 384), (1024, 768))
+DEFAULT_DENSITIES = (0, 8, 32)
+QUICK_DENSITIES = (0, 16)
+
+DEFAULT_BASELINE = 'bench_baseline.json'
+DEFAULT_OUTPUT = 'bench_results.json'
+
+# A metric regresses when it is both this much slower/larger than the baseline...
+DEFAULT_TOLERANCE = 0.25
+# ...and worse by more than these absolute amounts (filters timer noise)
+MIN_TIME_DELTA = 0.005  # seconds
+MIN_MEMORY_DELTA = 1024 * 1024  # bytes
+
+
+def create_benchmark_film(generator, size, density, seed=0):
+    """Grayscale film from a demo generator, resized, with `density` extra defects."""
+    np.random.seed(seed)
+    film = GENERATORS[generator]().convert('L').resize(size, Image.BILINEAR)
+    width, height = size
+    rng = np.random.default_rng(seed)
+    draw = ImageDraw.Draw(film)
+    scale = width / 1024
+
+    # Defects are scattered along the weld band in the middle of the film
+    for index in range(density):
+        x = rng.uniform(0.1, 0.9) * width
+        y = height / 2 + rng.uniform(-0.03, 0.03) * height
+        kind = index % 3
+        if kind == 0:
+            radius = rng.uniform(4, 10) * scale
+            draw.ellipse([x - radius, y - radius, x + radius, y + radius], fill=30)
+        elif kind == 1:
+            length = rng.uniform(30, 60) * scale
+            angle = rng.uniform(-0.3, 0.3)
+            end = (x + length * np.cos(angle), y + length * np.sin(angle))
+            draw.line([(x, y), end], fill=40, width=max(1, round(3 * scale)))
+        else:
+            radius = rng.uniform(8, 14) * scale
+            angles = np.sort(rng.uniform(0, 2 * np.pi, 5))
+            points = [(x + radius * np.cos(a), y + radius * np.sin(a)) for a in angles]
+            draw.polygon(points, fill=200)
+    return film
+
+
+def summarize_latencies(samples):
+    """Percentiles and mean of a list of durations in seconds."""
+    samples = np.asarray(samples, dtype=np.float64)
+    return {
+        'runs': int(samples.size),
+        'mean': float(samples.mean()),
+        'min': float(samples.min()),
+        'p50': float(np.percentile(samples, 50)),
+        'p90': float(np.percentile(samples, 90)),
+        'p99': float(np.percentile(samples, 99))
+    }
+
+
+def load_backend_app():
+    """Import the Flask app with its upload and cache folders in a temp dir."""
+    from utils.result_cache import ResultCache
+
+    workdir = tempfile.mkdtemp(prefix='weld-bench-')
+    previous = os.getcwd()
+    os.chdir(workdir)
+    try:
+        import app as backend_app
+    finally:
+        os.chdir(previous)
+    # Every request must run the detector, so results are never cached
+    backend_app.result_cache = ResultCache(max_entries=0, disk_dir=None)
+    return backend_app
+
+
+def bench_scenario(detector, client, generator, size, density, repeats, seed=0):
+    """Time detector stages and the API round trip for one synthetic film."""
+    film = create_benchmark_film(generator, size, density, seed)
+    rgb = film.convert('RGB')
+    megapixels = size[0] * size[1] / 1e6
+
+    detector.detect_defects(rgb)  # warm-up
+
+    totals = []
+    stage_samples = {}
+    found = 0
+    for _ in range(repeats):
+        profiler = StageProfiler()
+        start = time.perf_counter()
+        found = len(detector.detect_defects(rgb, profiler=profiler))
+        totals.append(time.perf_counter() - start)
+        for record in profiler.records():
+            stage_samples.setdefault(record['stage'], []).append(record['wall_time'])
+
+    # Memory tracing slows allocation, so it gets a run of its own
+    traced = StageProfiler(trace_memory=True)
+    detector.detect_defects(rgb, profiler=traced)
+    stage_memory = {record['stage']: record['peak_memory_bytes'] for record in traced.records()}
+
+    stages = {}
+    for name, samples in stage_samples.items():
+        stages[name] = summarize_latencies(samples)
+        stages[name]['peak_memory_bytes'] = stage_memory.get(name)
+
+    detect = summarize_latencies(totals)
+    detect['images_per_second'] = 1 / detect['mean']
+    detect['megapixels_per_second'] = megapixels / detect['mean']
+    detect['peak_memory_bytes'] = max((value or 0) for value in stage_memory.values())
+    detect['detections'] = found
+
+    api = None
+    if client is not None:
+        buffer = io.BytesIO()
+        film.save(buffer, format='PNG')
+        upload = buffer.getvalue()
+        latencies = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            response = client.post('/api/analyze', data={'file': (io.BytesIO(upload), 'film.png')},
+                                   content_type='multipart/form-data')
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                raise RuntimeError(f"/api/analyze failed: {response.get_json()}")
+        api = summarize_latencies(latencies)
+        api['images_per_second'] = 1 / api['mean']
+        api['upload_bytes'] = len(upload)
+
+    return {
+        'generator': generator,
+        'width': size[0],
+        'height': size[1],
+        'density': density,
+        'detect': detect,
+        'stages': stages,
+        'api': api
+    }
+
+
+def run_benchmarks(generators=tuple(GENERATORS), sizes=DEFAULT_SIZES, densities=DEFAULT_DENSITIES,
+                   repeats=3, include_api=True, seed=0, log=print):
+    """Run every generator x size x density scenario and return the results document."""
+    detector = YOLODetector()
+    client = load_backend_app().app.test_client() if include_api else None
+
+    scenarios = {}
+    for generator in generators:
+        for size in sizes:
+            for density in densities:
+                name = f"{generator}-{size[0]}x{size[1]}-d{density}"
+                result = bench_scenario(detector, client, generator, size, density, repeats, seed)
+                scenarios[name] = result
+                line = f"{name:<28} detect p50 {result['detect']['p50'] * 1000:8.1f} ms"
+                if result['api'] is not None:
+                    line += f"  api p50 {result['api']['p50'] * 1000:8.1f} ms"
+                line += f"  {result['detect']['megapixels_per_second']:6.2f} MP/s"
+                log(line)
+
+    return {
+        'created_at': time.time(),
+        'environment': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count()
+        },
+        'config': {'repeats': repeats, 'seed': seed, 'detector': detector.get_config()},
+        'scenarios': scenarios
+    }
+
+
+def _compared_metrics(scenario):
+    """(metric name, value, absolute noise floor) pairs checked against the baseline."""
+    yield 'detect.p50', scenario['detect']['p50'], MIN_TIME_DELTA
+    yield 'detect.peak_memory_bytes', scenario['detect']['peak_memory_bytes'], MIN_MEMORY_DELTA
+    if scenario.get('api'):
+        yield 'api.p50', scenario['api']['p50'], MIN_TIME_DELTA
+    for name, stage in scenario['stages'].items():
+        yield f"stages.{name}.p50", stage['p50'], MIN_TIME_DELTA
+
+
+def compare_to_baseline(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """List the metrics that regressed beyond tolerance; scenarios missing from either side are skipped."""
+    regressions = []
+    for name, scenario in results['scenarios'].items():
+        reference = baseline.get('scenarios', {}).get(name)
+        if reference is None:
+            continue
+        expected = dict((metric, value) for metric, value, _ in _compared_metrics(reference))
+        for metric, value, floor in _compared_metrics(scenario):
+            before = expected.get(metric)
+            if before is None or value is None:
+                continue
+            if value > before * (1 + tolerance) and value - before > floor:
+                regressions.append({
+                    'scenario': name,
+                    'metric': metric,
+                    'baseline': before,
+                    'current': value,
+                    'change': value / before - 1 if before else float('inf')
+                })
+    return regressions
+
+
+def _parse_sizes(text):
+    return tuple(tuple(int(part) for part in item.split('x')) for item in text.split(','))
+
+
+def _parse_ints(text):
+    return tuple(int(item) for item in text.split(','))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the welding defect detection pipeline.')
+    parser.add_argument('--sizes', type=_parse_sizes, help='comma separated WxH list, e.g. 512x384,1024x768')
+    parser.add_argument('--densities', type=_parse_ints, help='comma separated extra defect counts')
+    parser.add_argument('--generators', help=f"comma separated subset of {', '.join(GENERATORS)}")
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--quick', action='store_true', help='smaller scenario matrix')
+    parser.add_argument('--no-api', action='store_true', help='skip the /api/analyze round trip')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help='write the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args()
+
+    results = run_benchmarks(
+        generators=tuple(args.generators.split(',')) if args.generators else tuple(GENERATORS),
+        sizes=args.sizes or (QUICK_SIZES if args.quick else DEFAULT_SIZES),
+        densities=args.densities or (QUICK_DENSITIES if args.quick else DEFAULT_DENSITIES),
+        repeats=args.repeats,
+        include_api=not args.no_api,
+        seed=args.seed
+    )
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --save-baseline to create one")
+        return 0
+
+    with open(args.baseline, 'r') as f:
+        baseline = json.load(f)
+    regressions = compare_to_baseline(results, baseline, args.tolerance)
+    if not regressions:
+        print(f"No regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+        return 0
+
+    print(f"{len(regressions)} regression(s) against {args.baseline}:")
+    for regression in regressions:
+        print(f"  {regression['scenario']:<28} {regression['metric']:<28} "
+              f"{regression['baseline']:.4g} -> {regression['current']:.4g} ({regression['change']:+.0%})")
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,18 +1,36 @@
 #!/usr/bin/env python3
 """
 Script to start the welding defect detection backend server.
+
+    python start_backend.py                          # Flask development server
+    python start_backend.py --production --workers 4 --threads 4 --timeout 120
+
+With --production the remaining options are passed to backend/server.py,
+the multi-worker server that preloads the detector before forking.
 """
+import argparse
 import subprocess
 import sys
 import os
 
 def main():
+    parser = argparse.ArgumentParser(description='Start the welding defect detection backend.')
+    parser.add_argument('--production', action='store_true',
+                        help='run the multi-worker production server (see backend/server.py --help)')
+    args, server_args = parser.parse_known_args()
+    if server_args and not args.production:
+        parser.error(f"unrecognized arguments: {' '.join(server_args)}")
+
     # Change to backend directory
     backend_dir = os.path.join(os.path.dirname(__file__), 'backend')
     os.chdir(backend_dir)
     
+    if args.production:
+        # Replace this process so signals reach the server's master directly
+        os.execv(sys.executable, [sys.executable, 'server.py'] + server_args)
+
     # Start the Flask server
     subprocess.run([sys.executable, 'app.py'])
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
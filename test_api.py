@@ -0,0 +1,695 @@
+#!/usr/bin/env python3
+"""
+API tests for the welding defect detection backend, using the Flask test client.
+"""
+
+import io
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+
+import numpy as np
+import pytest
+from PIL import Image
+
+
+@pytest.fixture
+def backend(tmp_path, monkeypatch):
+    """The backend app module, with uploads and caches under a temp dir."""
+    monkeypatch.chdir(tmp_path)
+    import app as backend_app
+    from utils.result_cache import ResultCache
+
+    monkeypatch.setattr(backend_app, 'result_cache',
+                        ResultCache(disk_dir=str(tmp_path / 'result_cache')))
+    return backend_app
+
+
+def create_upload(seed=0, size=(160, 120), fmt='PNG'):
+    """Encoded synthetic film with a dark pore on a noisy background."""
+    rng = np.random.default_rng(seed)
+    width, height = size
+    film = rng.integers(100, 200, (height, width, 3), dtype=np.uint8)
+    yy, xx = np.mgrid[:height, :width]
+    film[(xx - width // 2) ** 2 + (yy - height // 2) ** 2 <= 100] = 20
+
+    buffer = io.BytesIO()
+    Image.fromarray(film).save(buffer, format=fmt)
+    return buffer.getvalue()
+
+
+def test_analyze_result_cache(backend):
+    """A repeated upload is served from the cache with identical results."""
+    client = backend.app.test_client()
+    data = create_upload()
+
+    first = client.post('/api/analyze', data={'file': (io.BytesIO(data), 'film.png')},
+                        content_type='multipart/form-data').get_json()
+    second = client.post('/api/analyze', data={'file': (io.BytesIO(data), 'again.png')},
+                         content_type='multipart/form-data').get_json()
+
+    assert first['success'] and second['success']
+    assert first['summary']['cache_hit'] is False
+    assert second['summary']['cache_hit'] is True
+    assert second['detections'] == first['detections']
+    assert second['image_info']['filename'] == 'again.png'
+
+    # A changed detector configuration must not reuse the old result
+    backend.active_detector.current().confidence_threshold = 0.6
+    try:
+        third = client.post('/api/analyze', data={'file': (io.BytesIO(data), 'film.png')},
+                            content_type='multipart/form-data').get_json()
+    finally:
+        backend.active_detector.current().confidence_threshold = 0.5
+    assert third['summary']['cache_hit'] is False
+
+
+def test_result_cache_tiers(tmp_path, monkeypatch):
+    """Entries expire after the TTL, fall out of the LRU, and survive restarts on disk."""
+    from utils import result_cache
+    from utils.result_cache import ResultCache
+
+    cache = ResultCache(max_entries=2, ttl=60, disk_dir=str(tmp_path))
+    for key in ('a', 'b', 'c'):
+        cache.put(key, {'value': key})
+    assert cache.get_stats()['entries'] == 2
+
+    restarted = ResultCache(max_entries=2, ttl=60, disk_dir=str(tmp_path))
+    assert restarted.get('a') == {'value': 'a'}
+
+    # The disk tier is listed and pruned once per batch of new entries, not on every write
+    listings = []
+    listdir = os.listdir
+    monkeypatch.setattr(result_cache.os, 'listdir', lambda path: listings.append(path) or listdir(path))
+    bounded = ResultCache(max_entries=2, ttl=60, disk_dir=str(tmp_path / 'bounded'), max_disk_entries=16)
+    for index in range(100):
+        bounded.put(f'key{index}', {'value': index})
+        assert len(listdir(tmp_path / 'bounded')) <= 18
+    assert len(listings) <= 100 // 3 + 1
+    assert bounded.get('key99') == {'value': 99}
+
+    expired = ResultCache(max_entries=2, ttl=0, disk_dir=None)
+    expired.put('a', {'value': 'a'})
+    expired._entries['a'] = (0, {'value': 'a'})
+    assert expired.get('a') is None
+
+
+def test_analyze_batch(backend):
+    """Multipart files and zip members are analysed and aggregated in order."""
+    import zipfile
+
+    client = backend.app.test_client()
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, 'w') as bundle:
+        bundle.writestr('films/c.jpg', create_upload(3, fmt='JPEG'))
+        bundle.writestr('notes.txt', 'not an image')
+
+    response = client.post('/api/analyze/batch', data={
+        'files': [(io.BytesIO(create_upload(1)), 'a.png'),
+                  (io.BytesIO(create_upload(2)), 'b.png')],
+        'archive': (io.BytesIO(archive.getvalue()), 'shift.zip')
+    }, content_type='multipart/form-data')
+    body = response.get_json()
+
+    assert response.status_code == 200 and body['success']
+    assert [r['image_info']['filename'] for r in body['results']] == ['a.png', 'b.png', 'c.jpg']
+    assert body['summary']['total_images'] == 3
+    assert body['summary']['total_defects'] == sum(r['summary']['total_defects'] for r in body['results'])
+
+    single = client.post('/api/analyze', data={'file': (io.BytesIO(create_upload(1)), 'a.png')},
+                         content_type='multipart/form-data').get_json()
+    assert single['summary']['cache_hit'] is True
+    assert single['detections'] == body['results'][0]['detections']
+
+    # Pool workers run the detector stages in their own thread
+    import batch_processing
+    batch_processing._init_worker()
+    assert batch_processing._worker_detector.stage_workers == 1
+    assert batch_processing._detector_for(backend.YOLODetector().get_config()).stage_workers == 1
+
+    # Another profile runs on the same worker pool
+    pool = backend.batch_analyzer._executor
+    fast = client.post('/api/analyze/batch?profile=fast', data={
+        'files': [(io.BytesIO(create_upload(4)), 'd.png')]
+    }, content_type='multipart/form-data').get_json()
+    assert backend.batch_analyzer._executor is pool
+    expected = backend.YOLODetector().with_profile('fast').detect_defects(Image.open(io.BytesIO(create_upload(4))))
+    assert fast['results'][0]['summary']['total_defects'] == len(expected)
+
+    empty = client.post('/api/analyze/batch', data={}, content_type='multipart/form-data')
+    assert empty.status_code == 400
+    backend.batch_analyzer.shutdown()
+
+
+def test_upload_size_limits(backend, monkeypatch):
+    """Oversized uploads get a 413 naming the limit of the endpoint they hit."""
+    monkeypatch.setitem(backend.app.config, 'MAX_CONTENT_LENGTH', 1024 * 1024)
+    monkeypatch.setattr(backend, 'MAX_BATCH_SIZE', 2 * 1024 * 1024)
+    client = backend.app.test_client()
+
+    for url, field, limit in (('/api/analyze', 'file', 1), ('/api/analyze/async', 'file', 1),
+                              ('/api/analyze/batch', 'files', 2)):
+        body = io.BytesIO(bytes(3 * 1024 * 1024))
+        response = client.post(url, data={field: (body, 'film.png')}, content_type='multipart/form-data')
+        assert response.status_code == 413
+        assert response.get_json()['message'] == f'File too large. Maximum size is {limit}MB.'
+
+    # A small archive whose members expand past the batch limit is refused before extraction
+    import zipfile
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, 'w', zipfile.ZIP_DEFLATED) as bundle:
+        for index in range(3):
+            bundle.writestr(f'film{index}.png', bytes(1024 * 1024))
+    assert len(archive.getvalue()) < 1024 * 1024
+    response = client.post('/api/analyze/batch', data={
+        'archive': (io.BytesIO(archive.getvalue()), 'films.zip')
+    }, content_type='multipart/form-data')
+    assert response.status_code == 413
+    assert response.get_json()['message'] == 'Batch too large. Maximum size is 2MB.'
+
+
+def test_batch_pool_recovers(backend):
+    """A worker that dies fails its batch with a 503; the next batch gets a fresh pool."""
+    import signal
+
+    client = backend.app.test_client()
+
+    def post(seed):
+        return client.post('/api/analyze/batch', data={'files': [(io.BytesIO(create_upload(seed)), 'a.png')]},
+                           content_type='multipart/form-data')
+
+    try:
+        assert post(21).status_code == 200
+        pool = backend.batch_analyzer._executor
+        assert pool._mp_context.get_start_method() in ('forkserver', 'spawn')
+        for process in list(pool._processes.values()):
+            os.kill(process.pid, signal.SIGKILL)
+        assert post(22).status_code == 503
+        assert post(23).status_code == 200 and backend.batch_analyzer._executor is not pool
+    finally:
+        backend.batch_analyzer.shutdown()
+
+
+def test_analyze_async_job(backend):
+    """An async job reports progress and ends with the same result as /api/analyze."""
+    import time
+
+    client = backend.app.test_client()
+    data = create_upload(4)
+    queued = client.post('/api/analyze/async', data={'file': (io.BytesIO(data), 'film.png')},
+                         content_type='multipart/form-data')
+    assert queued.status_code == 202
+    job_id = queued.get_json()['job_id']
+
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        job = client.get(f'/api/jobs/{job_id}').get_json()['job']
+        if job['status'] in ('completed', 'failed'):
+            break
+        time.sleep(0.05)
+
+    assert job['status'] == 'completed' and job['progress'] == 100
+    assert set(job['stages'].values()) == {'completed'}
+    assert 'content' in job['stages'] and 'porosity' in job['stages']
+
+    sync = client.post('/api/analyze', data={'file': (io.BytesIO(data), 'film.png')},
+                       content_type='multipart/form-data').get_json()
+    assert sync['detections'] == job['result']['detections']
+    assert client.get('/api/jobs/job_missing').status_code == 404
+
+
+def test_job_queue_backpressure_and_expiry():
+    """A full queue rejects new jobs and finished results expire."""
+    import threading
+    import time
+    from job_queue import AnalysisJobQueue, QueueFullError
+
+    release = threading.Event()
+
+    def run_job(payload, progress_callback):
+        progress_callback('work')
+        release.wait(5)
+        return payload
+
+    jobs = AnalysisJobQueue(run_job, stages=('work',), max_pending=1, workers=1, result_ttl=0.2)
+    first = jobs.submit(1)
+    deadline = time.time() + 5
+    while jobs.get_job_status(first['id'])['status'] == 'queued' and time.time() < deadline:
+        time.sleep(0.01)
+    jobs.submit(2)
+    with pytest.raises(QueueFullError):
+        jobs.submit(3)
+
+    release.set()
+    while jobs.get_job_status(first['id']).get('status') != 'completed' and time.time() < deadline:
+        time.sleep(0.01)
+    assert jobs.get_job_status(first['id'])['result'] == 1
+    time.sleep(0.3)
+    assert jobs.get_job_status(first['id']) == {'error': 'Job not found'}
+
+
+def test_job_queue_concurrent_stages():
+    """Stages running side by side are completed only by their own completion report."""
+    import threading
+    import time
+    from job_queue import AnalysisJobQueue
+
+    steps = [threading.Event() for _ in range(2)]
+
+    def run_job(payload, progress_callback):
+        progress_callback('content')
+        progress_callback('cracks', 'started')
+        progress_callback('slag', 'started')
+        progress_callback('slag', 'completed')
+        steps[0].set()
+        steps[1].wait(5)
+        progress_callback('cracks', 'completed')
+        progress_callback('nms')
+        return payload
+
+    jobs = AnalysisJobQueue(run_job, stages=('content', 'cracks', 'slag', 'nms'), workers=1)
+    job = jobs.submit(1)
+    assert steps[0].wait(5)
+    stages = jobs.get_job_status(job['id'])['stages']
+    assert stages == {'content': 'completed', 'cracks': 'running', 'slag': 'completed', 'nms': 'pending'}
+    steps[1].set()
+    deadline = time.time() + 5
+    while jobs.get_job_status(job['id'])['status'] != 'completed' and time.time() < deadline:
+        time.sleep(0.01)
+    assert set(jobs.get_job_status(job['id'])['stages'].values()) == {'completed'}
+
+
+def test_analyze_timings_and_metrics(backend):
+    """?timings=1 returns per-stage measurements that also feed /api/metrics."""
+    from models.yolo_detector import YOLODetector
+
+    client = backend.app.test_client()
+    response = client.post('/api/analyze?timings=1',
+                           data={'file': (io.BytesIO(create_upload(5)), 'film.png')},
+                           content_type='multipart/form-data').get_json()
+
+    stages = {record['stage']: record for record in response['timings']['stages']}
+    assert set(YOLODetector.STAGES) <= set(stages)
+    assert all(record['wall_time'] >= 0 and record['calls'] == 1 for record in stages.values())
+    assert stages['decode']['peak_memory_bytes'] > 0
+    assert stages['bounds']['candidates'] == response['summary']['total_defects']
+
+    plain = client.post('/api/analyze', data={'file': (io.BytesIO(create_upload(6)), 'film.png')},
+                        content_type='multipart/form-data').get_json()
+    assert 'timings' not in plain
+
+    metrics = client.get('/api/metrics').get_json()
+    assert metrics['success']
+    porosity = metrics['stages']['porosity']
+    assert porosity['count'] >= 2
+    assert porosity['wall_time_histogram'][-1] == {'le': 'inf', 'count': porosity['count']}
+
+
+def test_analyze_detector_selection(backend):
+    """A detector subset runs only those stages and is cached separately."""
+    client = backend.app.test_client()
+    data = create_upload(7)
+
+    full = client.post('/api/analyze?timings=1', data={'file': (io.BytesIO(data), 'film.png')},
+                       content_type='multipart/form-data').get_json()
+    porosity = client.post('/api/analyze?timings=1&detectors=porosity',
+                           data={'file': (io.BytesIO(data), 'film.png')},
+                           content_type='multipart/form-data').get_json()
+
+    assert porosity['summary']['cache_hit'] is False
+    stages = {record['stage'] for record in porosity['timings']['stages']}
+    assert 'porosity' in stages and not stages & {'cracks', 'slag'}
+    assert porosity['detections'] and porosity['detections'] == [d for d in full['detections'] if d['class'] == 'porosity']
+
+    invalid = client.post('/api/analyze', data={'file': (io.BytesIO(data), 'film.png'),
+                                                'detectors': 'porosity,undercut'},
+                          content_type='multipart/form-data')
+    assert invalid.status_code == 400
+
+
+def test_analyze_fast_path(backend):
+    """A blank film skips every detector and says so in the summary."""
+    buffer = io.BytesIO()
+    Image.new('RGB', (640, 480), (128, 128, 128)).save(buffer, format='PNG')
+    client = backend.app.test_client()
+
+    body = client.post('/api/analyze', data={'file': (io.BytesIO(buffer.getvalue()), 'blank.png')},
+                       content_type='multipart/form-data').get_json()
+    assert body['success'] and body['summary']['total_defects'] == 0
+    assert body['summary']['fast_path'] is True
+    assert set(body['summary']['skipped_detectors']) == {'cracks', 'porosity', 'slag'}
+
+    again = client.post('/api/analyze', data={'file': (io.BytesIO(buffer.getvalue()), 'blank.png')},
+                        content_type='multipart/form-data').get_json()
+    assert again['summary']['cache_hit'] and again['summary']['fast_path'] is True
+
+    # Films first analysed in a batch are cached with the same pre-screen outcome
+    batch = io.BytesIO()
+    Image.new('RGB', (320, 240), (90, 90, 90)).save(batch, format='PNG')
+    client.post('/api/analyze/batch', data={'files': [(io.BytesIO(batch.getvalue()), 'blank.png')]},
+                content_type='multipart/form-data')
+    backend.batch_analyzer.shutdown()
+    cached = client.post('/api/analyze', data={'file': (io.BytesIO(batch.getvalue()), 'blank.png')},
+                         content_type='multipart/form-data').get_json()
+    assert cached['summary']['cache_hit'] and cached['summary']['fast_path'] is True
+
+
+def test_analyze_grayscale_decode(backend):
+    """Gray and RGB encodings of a film decode to the same detections and cache key."""
+    from utils.ingest import decode_grayscale, open_upload
+    from utils.result_cache import cache_key
+
+    rgb = create_upload(seed=3)
+    film = Image.open(io.BytesIO(rgb)).convert('L')
+    gray = io.BytesIO()
+    film.save(gray, format='PNG')
+
+    pixels = decode_grayscale(open_upload(gray.getvalue()))
+    assert pixels.shape == (120, 160) and pixels.dtype == np.uint8
+    assert not pixels.flags.writeable
+    assert decode_grayscale(Image.new('LA', (8, 4))).shape == (4, 8)
+    # Colour JPEGs keep their channels, so the detector's luma weights apply
+    jpeg = io.BytesIO()
+    Image.open(io.BytesIO(rgb)).convert('RGB').save(jpeg, format='JPEG')
+    assert np.array_equal(decode_grayscale(open_upload(jpeg.getvalue())),
+                          np.asarray(Image.open(io.BytesIO(jpeg.getvalue())).convert('RGB')))
+    assert cache_key(io.BytesIO(rgb), {}) == cache_key(rgb, {})
+
+    client = backend.app.test_client()
+    results = []
+    for data in (Image.fromarray(np.repeat(np.asarray(film)[..., None], 3, axis=2)), film):
+        buffer = io.BytesIO()
+        data.save(buffer, format='PNG')
+        body = client.post('/api/analyze', data={'file': (io.BytesIO(buffer.getvalue()), 'film.png')},
+                           content_type='multipart/form-data').get_json()
+        assert body['success'] and body['image_info']['size_bytes'] == len(buffer.getvalue())
+        results.append(body['detections'])
+    assert results[0] == results[1] and results[0]
+
+
+def test_server_batch_timeout():
+    """Batch analyses run under the batch timeout, other requests under the request timeout."""
+    import threading
+    import time
+    import server
+
+    sock = server.bind_socket('127.0.0.1', 0)
+    seen = []
+
+    def app(environ, start_response):
+        with pool._lock:
+            seen.append(pool._inflight[threading.current_thread()] - time.monotonic())
+        return []
+
+    pool = server.PooledWSGIServer(app, sock.fileno(), *sock.getsockname()[:2],
+                                   request_timeout=10, batch_timeout=600)
+    try:
+        for path in ('/api/analyze', '/api/analyze/batch'):
+            with pool._lock:
+                pool._inflight[threading.current_thread()] = time.monotonic() + pool.request_timeout
+            pool.app({'PATH_INFO': path}, None)
+        assert 9 < seen[0] <= 10 and 599 < seen[1] <= 600
+    finally:
+        pool.server_close()
+        sock.close()
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='the production server forks workers')
+def test_production_server(tmp_path):
+    """The pre-fork server serves analyses from several workers and drains on SIGTERM."""
+    import re
+    import signal
+    import subprocess
+    import uuid
+    import http.client
+    from concurrent.futures import ThreadPoolExecutor
+
+    server = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend', 'server.py')
+    process = subprocess.Popen([sys.executable, server, '--host', '127.0.0.1', '--port', '0',
+                                '--workers', '2', '--threads', '2', '--graceful-timeout', '10'],
+                               cwd=tmp_path, stderr=subprocess.PIPE, text=True)
+    try:
+        match = re.search(r"\('127\.0\.0\.1', (\d+)\)", process.stderr.readline())
+        assert match
+        port = int(match.group(1))
+
+        def post(seed):
+            boundary = uuid.uuid4().hex
+            body = (f'--{boundary}\r\nContent-Disposition: form-data; name="file"; '
+                    f'filename="film{seed}.png"\r\nContent-Type: image/png\r\n\r\n').encode()
+            body += create_upload(seed) + f'\r\n--{boundary}--\r\n'.encode()
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+            connection.request('POST', '/api/analyze', body,
+                               {'Content-Type': f'multipart/form-data; boundary={boundary}'})
+            response = connection.getresponse()
+            return response.status, response.read()
+
+        with ThreadPoolExecutor(4) as pool:
+            responses = list(pool.map(post, range(4)))
+        assert [status for status, _ in responses] == [200] * 4
+    finally:
+        process.send_signal(signal.SIGTERM)
+        assert process.wait(timeout=20) == 0
+
+
+def test_training_dataset_store(tmp_path, monkeypatch):
+    """Datasets are stored as pack shards plus an index, and read back lazily."""
+    import base64
+    import json
+    monkeypatch.chdir(tmp_path)
+    from training import ModelTrainer
+    from utils.dataset_store import DatasetReader, DatasetWriter
+
+    trainer = ModelTrainer()
+    uploads = [create_upload(seed) for seed in range(12)]
+    labels = [{'type': 'porosity', 'bbox': [1, 2, 3, 4]}, {'type': 'crack', 'bbox': [5, 6, 7, 8]},
+              {'type': 'porosity', 'bbox': [9, 9, 4, 4]}]
+    dataset_id = trainer.save_training_dataset([
+        {'filename': f'film{index}.png', 'image_base64': base64.b64encode(data).decode('ascii'),
+         'labels': labels if index % 3 else []}
+        for index, data in enumerate(uploads)
+    ])
+
+    stats = trainer.get_dataset_stats(dataset_id)
+    assert stats['total_images'] == 12 and stats['labeled_images'] == 8
+    assert stats['total_labels'] == 24
+    assert stats['label_distribution'] == {'porosity': 16, 'crack': 8}
+    assert trainer.start_training(dataset_id)['dataset_stats'] == stats
+    trainer.executor.shutdown()
+
+    with trainer.open_dataset(dataset_id) as reader:
+        assert len(reader) == 12
+        assert bytes(reader.sample_bytes(5)) == uploads[5]
+        assert reader.entries[4]['filename'] == 'film4.png' and reader.entries[4]['labels'] == labels
+        for sample, data in zip(reader.samples(), uploads):
+            assert bytes(sample.pop('data')) == data
+            del sample
+
+    # Pack files roll over at the shard size, and streams are copied as-is
+    with DatasetWriter(str(tmp_path / 'sharded'), 'sharded', shard_size=len(uploads[0]) + 1) as writer:
+        for index, data in enumerate(uploads[:3]):
+            writer.add(data, filename=f'{index}.png')
+        writer.add(io.BytesIO(uploads[3]), filename='3.png')
+    assert len(writer.shards) == 3
+    header = json.loads((tmp_path / 'sharded' / 'dataset.json').read_text())
+    assert header['statistics']['total_images'] == 4
+    with DatasetReader(str(tmp_path / 'sharded')) as reader:
+        assert [bytes(reader.sample_bytes(index)) for index in range(4)] == uploads[:4]
+
+    # Datasets saved as a single JSON file before the pack format still load
+    (tmp_path / 'training_data' / 'dataset_legacy.json').write_text(json.dumps({'statistics': stats}))
+    assert trainer.get_dataset_stats('dataset_legacy') == stats
+
+
+def test_training_import_is_inert(tmp_path):
+    """Importing the training module, as spawned job processes do, builds no trainer."""
+    import subprocess
+    backend_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend')
+    subprocess.run([sys.executable, '-c', 'import training; assert training.trainer is None'],
+                   cwd=tmp_path, env=dict(os.environ, PYTHONPATH=backend_dir), check=True)
+    assert os.listdir(tmp_path) == []
+
+
+def test_training_streaming_upload(tmp_path, monkeypatch):
+    """/api/train stores multipart images unchanged, one at a time, and rejects non-images."""
+    monkeypatch.chdir(tmp_path)
+    import training
+
+    monkeypatch.setattr(training, 'trainer', training.ModelTrainer())
+    client = training.create_app().test_client()
+    uploads = [create_upload(seed, fmt='PNG' if seed % 2 else 'JPEG') for seed in range(10)]
+
+    response = client.post('/api/train', data={
+        'note': 'shift 3',
+        'images': [(io.BytesIO(data), f'film{index}.png') for index, data in enumerate(uploads)]
+    }, content_type='multipart/form-data')
+    body = response.get_json()
+    assert response.status_code == 200 and body['success']
+
+    with training.trainer.open_dataset(body['dataset_id']) as reader:
+        assert reader.statistics['total_images'] == 10 and reader.statistics['total_labels'] == 30
+        assert [bytes(reader.sample_bytes(index)) for index in range(10)] == uploads
+        assert [entry['format'] for entry in reader.entries[:2]] == ['JPEG', 'PNG']
+
+    rejected = client.post('/api/train', data={
+        'images': [(io.BytesIO(uploads[0]), 'ok.jpg'), (io.BytesIO(b'not an image'), 'notes.png')]
+    }, content_type='multipart/form-data')
+    assert rejected.status_code == 400 and 'notes.png' in rejected.get_json()['message']
+    assert os.listdir(tmp_path / 'training_data') == [body['dataset_id']]
+    training.trainer.executor.shutdown()
+
+
+def test_training_executor(tmp_path, monkeypatch):
+    """Trainings run in a background process one at a time, report epochs and can be cancelled."""
+    import base64
+    import time
+    monkeypatch.chdir(tmp_path)
+    import training
+
+    monkeypatch.setattr(training, 'TRAINING_EPOCH_SECONDS', 0.2)
+    monkeypatch.setattr(training, 'trainer', training.ModelTrainer())
+    client = training.create_app().test_client()
+    labels = [{'type': 'crack'}, {'type': 'slag'}]
+    images = [{'filename': f'film{seed}.png', 'labels': labels,
+               'image_base64': base64.b64encode(create_upload(seed)).decode('ascii')}
+              for seed in range(10)]
+
+    def start(epochs):
+        response = client.post('/api/train', json={'images': images, 'config': {'epochs': epochs}})
+        assert response.status_code == 200
+        return response.get_json()['training_id']
+
+    def status(training_id):
+        return client.get(f'/api/training/{training_id}/status').get_json()['training']
+
+    def wait_for(training_id, states, timeout=30):
+        deadline = time.time() + timeout
+        while status(training_id)['status'] not in states:
+            assert time.time() < deadline
+            time.sleep(0.05)
+        return status(training_id)
+
+    try:
+        invalid = client.post('/api/train', json={'images': images,
+                                                  'config': {'detector_config': {'nms_threshold': 'x'}}})
+        assert invalid.status_code == 400
+        first, second, third = start(4), start(200), start(200)
+        # At most one training runs at a time; the others wait in the queue
+        assert status(second)['status'] == 'queued'
+        cancelled = client.post(f'/api/training/{third}/cancel').get_json()['training']
+        assert cancelled['status'] == 'cancelled'
+
+        completed = wait_for(first, ('completed', 'failed'))
+        assert completed['status'] == 'completed' and completed['progress'] == 100
+        assert completed['current_epoch'] == 4 and completed['accuracy'] > 0.9
+        registry = training.trainer.registry
+        assert registry.get(completed['model_id'])['training_id'] == first
+        generation = registry.generation()
+
+        # Polling a finished training changes nothing
+        assert status(first) == completed
+        assert registry.generation() == generation
+
+        running = wait_for(second, ('training',))
+        assert running['current_epoch'] < 200
+        client.post(f'/api/training/{second}/cancel')
+        assert wait_for(second, ('cancelled',))['finished_at'] is not None
+        assert client.get('/api/training/training_missing/status').status_code == 404
+    finally:
+        training.trainer.executor.shutdown()
+
+
+def test_model_registry(backend, tmp_path):
+    """Models are listed from the registry, and activating one swaps the analysis detector."""
+    import json
+    import training
+    from utils.model_registry import ActiveModel, InvalidModelError, ModelRegistry
+
+    # Model files saved before the registry are imported once
+    (tmp_path / 'models').mkdir(exist_ok=True)
+    (tmp_path / 'models' / 'model_1.json').write_text(json.dumps(
+        {'id': 'model_1', 'name': 'Custom Model - 10 images', 'version': '1.0.0', 'accuracy': 0.9}))
+    trainer = training.ModelTrainer()
+    assert training.ModelTrainer().registry.list_models() == trainer.get_available_models()
+    models = trainer.get_available_models()
+    assert [model['id'] for model in models] == ['default', 'model_1']
+    assert [model['is_active'] for model in models] == [True, False]
+
+    trainer.registry.register({'id': 'strict', 'name': 'Strict', 'version': '2.1.0',
+                               'detector_config': {'confidence_threshold': 0.99}})
+    assert trainer.registry.get('strict')['version'] == '2.1.0'
+    with pytest.raises(ValueError):
+        trainer.registry.register({'id': 'strict', 'name': 'Strict', 'version': '2.2.0'})
+    # Models whose detector cannot be built are rejected
+    with pytest.raises(InvalidModelError):
+        trainer.registry.register({'id': 'broken', 'name': 'Broken', 'version': '1.0.0',
+                                   'detector_config': {'confidence_threshold': 'high'}})
+    ModelRegistry(trainer.registry.path).register({'id': 'unchecked', 'name': 'Unchecked', 'version': '1.0.0',
+                                                   'detector_config': {'porosity_stride': 2}})
+
+    client = backend.app.test_client()
+    closed = []
+    active = ActiveModel(ModelRegistry(trainer.registry.path), backend.build_detector, check_interval=0,
+                         close=closed.append)
+    original = active.current()
+    backend.active_detector, saved = active, backend.active_detector
+    try:
+        data = create_upload()
+        before = client.post('/api/analyze', data={'file': (io.BytesIO(data), 'film.png')},
+                             content_type='multipart/form-data').get_json()
+        assert before['detections']
+
+        training_client = training.create_app().test_client()
+        original_trainer, training.trainer = training.trainer, trainer
+        try:
+            assert training_client.post('/api/models/missing/activate').status_code == 404
+            assert training_client.post('/api/models/unchecked/activate').status_code == 400
+            response = training_client.post('/api/models/strict/activate')
+            assert response.get_json()['active_model'] == 'strict'
+            assert [model['id'] for model in training_client.get('/api/models').get_json()['models']
+                    if model['is_active']] == ['strict']
+        finally:
+            training.trainer = original_trainer
+
+        # New requests use the new model; a request holding the old detector is unaffected
+        after = client.post('/api/analyze', data={'file': (io.BytesIO(data), 'film.png')},
+                            content_type='multipart/form-data').get_json()
+        assert after['summary']['cache_hit'] is False and after['detections'] == []
+        assert active.current() is not original and original.confidence_threshold == 0.5
+        assert closed == [original]
+        assert client.get('/api/health').get_json()['active_model'] == 'strict-2.1.0'
+    finally:
+        backend.active_detector = saved
+
+
+def test_analyze_profile(backend, tmp_path):
+    """?profile= picks a detector profile per request; the profile file is reloaded when edited."""
+    import json
+    from models.profiles import ProfileStore
+
+    client = backend.app.test_client()
+    data = create_upload()
+    profiles = tmp_path / 'profiles.json'
+    saved = backend.profile_store
+    backend.profile_store = ProfileStore(str(profiles))
+    try:
+        def analyze(profile):
+            return client.post(f'/api/analyze?profile={profile}', data={'file': (io.BytesIO(data), 'film.png')},
+                               content_type='multipart/form-data')
+
+        default = analyze('default').get_json()
+        fast = analyze('fast').get_json()
+        assert fast['success'] and fast['summary']['cache_hit'] is False
+        assert analyze('tuned').status_code == 400
+
+        profiles.write_text(json.dumps({'tuned': {'version': '1.0.0', 'confidence_threshold': 0.99}}))
+        tuned = analyze('tuned').get_json()
+        assert tuned['success'] and tuned['detections'] == [] and default['detections']
+        profiles.write_text(json.dumps({'tuned': {'version': '1.0.1'}}))
+        assert analyze('tuned').get_json()['detections'] == default['detections']
+
+        # A broken edit keeps the previous profiles
+        profiles.write_text('{"tuned": {"porosity_stride": ')
+        assert analyze('tuned').status_code == 200
+    finally:
+        backend.profile_store = saved
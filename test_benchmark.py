@@ -0,0 +1,25 @@
+#!/usr/bin/env python3
+"""
+Smoke test for the benchmark harness and its baseline comparison.
+"""
+
+import copy
+
+from benchmark import compare_to_baseline, run_benchmarks
+
+
+def test_benchmark_baseline_regressions():
+    """A tiny run produces the JSON document, and slowed metrics are flagged."""
+    results = run_benchmarks(generators=('bordered',), sizes=((192, 128),), densities=(4,),
+                             repeats=2, log=lambda line: None)
+    scenario = results['scenarios']['bordered-192x128-d4']
+    assert scenario['detect']['runs'] == 2 and scenario['api']['runs'] == 2
+    assert {'content', 'porosity', 'nms'} <= set(scenario['stages'])
+    assert scenario['detect']['peak_memory_bytes'] > 0
+
+    assert compare_to_baseline(results, results) == []
+
+    slower = copy.deepcopy(results)
+    slower['scenarios']['bordered-192x128-d4']['detect']['p50'] += 1.0
+    regressions = compare_to_baseline(slower, results)
+    assert [r['metric'] for r in regressions] == ['detect.p50']
@@ -64,7 +64,8 @@ def test_boundary_constraints():
     all_within_bounds = True
     
     for i, detection in enumerate(detections):
-        x, y, w, h = detection['bbox']
+        bbox = detection['bbox']
+        x, y, w, h = bbox['x'], bbox['y'], bbox['width'], bbox['height']
         center_x = x + w // 2
         center_y = y + h // 2
         
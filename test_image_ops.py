@@ -0,0 +1,653 @@
+#!/usr/bin/env python3
+"""
+Parity tests for the vectorized image operations used by the detector.
+Each backend is checked against the original per-pixel implementation.
+"""
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+
+import numpy as np
+from PIL import Image
+from utils.convolution import convolve2d, choose_method
+from utils.rank_filter import rank_filter
+from utils import morphology
+from utils.labeling import label_components, component_stats
+from utils.hough import hough_circles, perimeter_support
+from utils.nms import boxes_from_detections, iou_matrix, nms, soft_nms
+from utils.tiling import open_tile_source, tile_layout
+from utils.pyramid import downsample, candidate_layout
+from models.yolo_detector import YOLODetector
+
+
+def reference_convolve(image, kernel):
+    """Original per-pixel convolution from YOLODetector._convolve."""
+    height, width = image.shape
+    k_height, k_width = kernel.shape
+    pad_h, pad_w = k_height // 2, k_width // 2
+
+    padded = np.pad(image, ((pad_h, pad_h), (pad_w, pad_w)), mode='edge')
+    result = np.zeros_like(image)
+
+    for i in range(height):
+        for j in range(width):
+            result[i, j] = np.sum(padded[i:i+k_height, j:j+k_width] * kernel)
+
+    return result
+
+
+def create_test_image(height=37, width=53, seed=0):
+    """Create a small float64 grayscale image like the detector produces."""
+    rng = np.random.default_rng(seed)
+    rgb = rng.integers(0, 256, (height, width, 3))
+    return np.dot(rgb[..., :3], [0.2989, 0.5870, 0.1140])
+
+
+def test_convolution_parity():
+    """Every backend matches the per-pixel loop for the detector's kernels."""
+    image = create_test_image()
+    sobel_x = np.array([[-1, 0, 1], [-2, 0, 2], [-1, 0, 1]])
+    gaussian = np.exp(-np.add.outer(np.arange(-1, 2) ** 2, np.arange(-1, 2) ** 2) / 2.0)
+    random_kernel = np.random.default_rng(1).normal(size=(4, 5))
+    large_kernel = np.random.default_rng(2).normal(size=(9, 11))
+
+    for kernel in (sobel_x, sobel_x.T, gaussian, random_kernel, large_kernel):
+        expected = reference_convolve(image, kernel)
+        for method in ('auto', 'direct', 'fft'):
+            result = convolve2d(image, kernel, method=method)
+            assert result.dtype == expected.dtype
+            assert np.allclose(result, expected, atol=1e-8)
+
+    for kernel in (sobel_x, gaussian):
+        assert choose_method(kernel) == 'separable'
+    assert choose_method(random_kernel) == 'direct'
+    assert choose_method(large_kernel) == 'fft'
+
+
+def reference_gaussian_kernel(size):
+    """Original per-tap Gaussian kernel loop from YOLODetector._gaussian_kernel."""
+    kernel = np.zeros((size, size))
+    center = size // 2
+    sigma = size / 3
+    for i in range(size):
+        for j in range(size):
+            x, y = i - center, j - center
+            kernel[i, j] = np.exp(-(x**2 + y**2) / (2 * sigma**2))
+    return kernel
+
+
+def test_kernel_cache():
+    """Fixed kernels are built and factored once, and match the original construction."""
+    from utils.convolution import gaussian_kernel, separate_kernel
+
+    for size in (1, 3, 5, 7, 15):
+        assert np.array_equal(gaussian_kernel(size), reference_gaussian_kernel(size))
+    assert gaussian_kernel(3) is gaussian_kernel(3) and not gaussian_kernel(3).flags.writeable
+
+    column, row = separate_kernel(gaussian_kernel(5))
+    assert separate_kernel(gaussian_kernel(5).copy())[0] is column
+    assert np.allclose(np.outer(column, row), gaussian_kernel(5))
+    assert separate_kernel(np.array([[0, 1, 0], [1, 1, 1], [0, 1, 0]])) is None
+
+    # Repeated detection does no kernel setup
+    detector = YOLODetector()
+    film = create_test_image(120, 160).astype(np.uint8)
+    detector.detect_defects(film)
+    svd = np.linalg.svd
+    calls = []
+    np.linalg.svd = lambda *args, **kwargs: calls.append(args) or svd(*args, **kwargs)
+    try:
+        detector.detect_defects(film)
+    finally:
+        np.linalg.svd = svd
+    assert calls == []
+
+
+def reference_median_filter(image, kernel_size):
+    """Original per-pixel median filter from YOLODetector._median_filter."""
+    height, width = image.shape
+    filtered = np.zeros_like(image)
+    pad = kernel_size // 2
+
+    for i in range(pad, height - pad):
+        for j in range(pad, width - pad):
+            window = image[i-pad:i+pad+1, j-pad:j+pad+1]
+            filtered[i, j] = np.median(window)
+
+    return filtered
+
+
+def test_rank_filter_parity():
+    """Window and histogram rank filters match the per-pixel median."""
+    image = create_test_image()
+    step = (image.max() - image.min()) / 256
+    for kernel_size in (3, 5, 9):
+        expected = reference_median_filter(image, kernel_size)
+        assert np.array_equal(rank_filter(image, kernel_size, method='window'), expected)
+        # Many distinct values: the histogram path quantizes the image's own range
+        histogram = rank_filter(image, kernel_size, method='histogram')
+        assert np.all((histogram <= expected) & (histogram > expected - step))
+        # 8-bit film, also scaled to 0-1 like the detector's, is ranked exactly
+        for film in (np.floor(image), np.floor(image) / 255.0):
+            assert np.array_equal(rank_filter(film, kernel_size, method='histogram'),
+                                  reference_median_filter(film, kernel_size))
+
+    assert not rank_filter(image, 61).any()
+    normalized = np.floor(image) / 255.0
+    assert np.array_equal(rank_filter(normalized, 19), rank_filter(normalized, 19, method='window'))
+
+    integral = np.floor(image)
+    low = rank_filter(integral, 7, 10, method='window')
+    assert np.array_equal(rank_filter(integral, 7, 10, method='histogram'), low)
+
+
+def reference_dilate(image, kernel):
+    """Original per-pixel dilation from YOLODetector._dilate."""
+    height, width = image.shape
+    k_height, k_width = kernel.shape
+    pad_h, pad_w = k_height // 2, k_width // 2
+
+    padded = np.pad(image, ((pad_h, pad_h), (pad_w, pad_w)), mode='constant')
+    result = np.zeros_like(image)
+
+    for i in range(height):
+        for j in range(width):
+            if np.any(padded[i:i+k_height, j:j+k_width] * kernel):
+                result[i, j] = 1
+
+    return result
+
+
+def reference_erode(image, kernel):
+    """Original per-pixel erosion from YOLODetector._erode."""
+    height, width = image.shape
+    k_height, k_width = kernel.shape
+    pad_h, pad_w = k_height // 2, k_width // 2
+
+    padded = np.pad(image, ((pad_h, pad_h), (pad_w, pad_w)), mode='constant')
+    result = np.zeros_like(image)
+
+    for i in range(height):
+        for j in range(width):
+            if np.all(padded[i:i+k_height, j:j+k_width] >= kernel):
+                result[i, j] = 1
+
+    return result
+
+
+def test_morphology_parity():
+    """Rectangular and arbitrary structuring elements match the per-pixel operators."""
+    rng = np.random.default_rng(3)
+    binary = (rng.random((41, 47)) > 0.6).astype(np.uint8)
+    edges = np.abs(create_test_image(41, 47) - 128)
+    cross = np.array([[0, 1, 0], [1, 1, 1], [0, 1, 0]], np.uint8)
+
+    for image in (binary, edges):
+        for kernel in (np.ones((5, 5), np.uint8), np.ones((7, 1), np.uint8),
+                       np.ones((2, 4), np.uint8), cross):
+            dilated = morphology.dilate(image, kernel)
+            assert dilated.dtype == image.dtype
+            assert np.array_equal(dilated, reference_dilate(image, kernel))
+            assert np.array_equal(morphology.erode(image, kernel), reference_erode(image, kernel))
+            closed = reference_erode(reference_dilate(image, kernel), kernel)
+            assert np.array_equal(morphology.closing(image, kernel), closed)
+
+    kernel = np.ones((3, 3), np.uint8)
+    opened = morphology.opening(binary, kernel)
+    assert np.array_equal(morphology.top_hat(binary, kernel), binary - opened)
+    boundary = morphology.dilate(binary, kernel) - morphology.erode(binary, kernel)
+    assert np.array_equal(morphology.gradient(binary, kernel), boundary)
+
+
+def reference_flood_labels(mask, connectivity):
+    """Stack-based flood fill in raster order, as the old contour/region search did."""
+    if connectivity == 8:
+        neighbours = [(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1) if dx or dy]
+    else:
+        neighbours = [(0, 1), (0, -1), (1, 0), (-1, 0)]
+
+    labels = np.zeros(mask.shape, dtype=np.int32)
+    count = 0
+    for y in range(mask.shape[0]):
+        for x in range(mask.shape[1]):
+            if mask[y, x] and not labels[y, x]:
+                count += 1
+                stack = [(x, y)]
+                while stack:
+                    px, py = stack.pop()
+                    if (0 <= px < mask.shape[1] and 0 <= py < mask.shape[0] and
+                            mask[py, px] and not labels[py, px]):
+                        labels[py, px] = count
+                        stack.extend((px + dx, py + dy) for dx, dy in neighbours)
+    return labels, count
+
+
+def test_labeling_parity():
+    """Run-based union-find labels and statistics match a pixel flood fill."""
+    rng = np.random.default_rng(4)
+    mask = rng.random((60, 70)) > 0.55
+
+    for connectivity in (4, 8):
+        expected, expected_count = reference_flood_labels(mask, connectivity)
+        labels, count = label_components(mask, connectivity)
+        assert labels.dtype == np.int32
+        assert count == expected_count
+        assert np.array_equal(labels, expected)
+
+        _, stats = component_stats(mask, connectivity)
+        for index in range(count):
+            ys, xs = np.nonzero(expected == index + 1)
+            assert stats['area'][index] == len(xs)
+            assert list(stats['bbox'][index]) == [xs.min(), ys.min(), xs.max(), ys.max()]
+            assert np.allclose(stats['centroid'][index], [xs.mean(), ys.mean()])
+            dx, dy = xs - xs.mean(), ys - ys.mean()
+            assert np.allclose(stats['moments'][index], [(dx * dx).sum(), (dy * dy).sum(), (dx * dy).sum()])
+
+    labels, count = label_components(np.zeros((5, 5), bool))
+    assert count == 0 and not labels.any()
+
+
+def reference_circularity(circle, binary_image):
+    """Original trigonometric perimeter check from YOLODetector._calculate_circularity."""
+    x, y, radius = circle
+    circle_points = 0
+    total_points = 0
+
+    for angle in range(0, 360, 10):
+        px = int(x + radius * np.cos(np.radians(angle)))
+        py = int(y + radius * np.sin(np.radians(angle)))
+
+        if 0 <= px < binary_image.shape[1] and 0 <= py < binary_image.shape[0]:
+            total_points += 1
+            if binary_image[py, px] > 0:
+                circle_points += 1
+
+    return circle_points / total_points if total_points > 0 else 0
+
+
+def test_hough_circles():
+    """Pores of any radius are found at full resolution; squares and empty masks are not."""
+    height, width = 200, 300
+    yy, xx = np.mgrid[:height, :width]
+    binary = np.zeros((height, width), np.uint8)
+    pores = [(50, 60, 8), (150, 100, 20), (243, 47, 12), (100, 160, 30), (271, 151, 6)]
+    for cx, cy, r in pores:
+        binary[(xx - cx) ** 2 + (yy - cy) ** 2 <= r * r] = 1
+    binary[170:195, 200:250] = 1
+
+    circles = hough_circles(binary, min_radius=5, max_radius=50)
+    assert len(circles) == len(pores)
+    for cx, cy, r in pores:
+        assert any(abs(x - cx) <= 1 and abs(y - cy) <= 1 and abs(radius - r) <= 2
+                   for x, y, radius in circles)
+
+    assert hough_circles(np.zeros((50, 50), np.uint8)) == []
+
+    for circle in [(50, 60, 8), (0, 5, 20), (299, 199, 7), (120, 40, 45)]:
+        assert perimeter_support(binary, *circle) == reference_circularity(circle, binary)
+
+
+def reference_nms(detections, nms_threshold):
+    """Original pairwise NMS from YOLODetector._apply_nms/_calculate_iou."""
+    def calculate_iou(bbox1, bbox2):
+        x1 = max(bbox1['x'], bbox2['x'])
+        y1 = max(bbox1['y'], bbox2['y'])
+        x2 = min(bbox1['x'] + bbox1['width'], bbox2['x'] + bbox2['width'])
+        y2 = min(bbox1['y'] + bbox1['height'], bbox2['y'] + bbox2['height'])
+        if x2 <= x1 or y2 <= y1:
+            return 0
+        intersection = (x2 - x1) * (y2 - y1)
+        union = bbox1['width'] * bbox1['height'] + bbox2['width'] * bbox2['height'] - intersection
+        return intersection / union if union > 0 else 0
+
+    filtered = []
+    for detection in sorted(detections, key=lambda x: x['confidence'], reverse=True):
+        if all(calculate_iou(detection['bbox'], existing['bbox']) <= nms_threshold
+               for existing in filtered):
+            filtered.append(detection)
+    return filtered
+
+
+def create_detections(count, seed):
+    """Random overlapping detections, with tied confidences."""
+    rng = np.random.default_rng(seed)
+    return [{
+        'class': ['crack', 'porosity', 'slag'][rng.integers(3)],
+        'confidence': round(float(rng.uniform(0.5, 0.95)), 2),
+        'bbox': {'x': int(rng.integers(0, 400)), 'y': int(rng.integers(0, 300)),
+                 'width': int(rng.integers(0, 40)), 'height': int(rng.integers(0, 40))}
+    } for _ in range(count)]
+
+
+def test_nms_parity():
+    """Dense and grid NMS keep exactly what the pairwise loop kept, in the same order."""
+    for count in (0, 1, 50, 300, 1500):
+        detections = create_detections(count, count)
+        expected = reference_nms(detections, 0.4)
+        boxes = boxes_from_detections(detections)
+        scores = np.array([d['confidence'] for d in detections])
+        keep = nms(boxes, scores, 0.4)
+        assert [detections[i] for i in keep] == expected
+
+    detections = create_detections(1500, 7)
+    boxes = boxes_from_detections(detections)
+    scores = np.array([d['confidence'] for d in detections])
+    classes = np.array([d['class'] for d in detections])
+    keep = nms(boxes, scores, 0.4, classes=classes)
+    for name in ('crack', 'porosity', 'slag'):
+        subset = [d for d in detections if d['class'] == name]
+        assert [detections[i] for i in keep if classes[i] == name] == reference_nms(subset, 0.4)
+
+    iou = iou_matrix(boxes[:20], boxes[:20])
+    assert np.allclose(np.diag(iou)[box_has_area(boxes[:20])], 1.0)
+
+    keep, decayed = soft_nms(boxes, scores, 0.4, score_threshold=0.5)
+    assert keep[0] == np.argmax(scores) and len(set(keep.tolist())) == len(keep)
+    assert np.all(decayed >= 0.5) and np.all(decayed <= scores[keep])
+
+
+def box_has_area(boxes):
+    """Mask of boxes with non-zero width and height."""
+    return (boxes[:, 2] > boxes[:, 0]) & (boxes[:, 3] > boxes[:, 1])
+
+
+def test_tiled_detection():
+    """Tiles cover the film once, content bounds match, and seams do not duplicate detections."""
+    cores = np.zeros((300, 500), np.int32)
+    for core, tile in tile_layout((20, 10, 500, 300), 128, 16):
+        cores[core[1]:core[3], core[0]:core[2]] += 1
+        assert tile[0] <= core[0] and tile[2] >= core[2] and tile[2] - tile[0] <= 128
+    assert not cores[:10].any() and not cores[:, :20].any() and (cores[10:, 20:] == 1).all()
+
+    rng = np.random.default_rng(5)
+    film = np.zeros((300, 420, 3), np.uint8)
+    film[40:260, 30:390] = rng.integers(100, 200, (220, 360, 3))
+    yy, xx = np.mgrid[:300, :420]
+    for cx, cy, r in [(120, 150, 12), (255, 100, 9)]:
+        film[(xx - cx) ** 2 + (yy - cy) ** 2 <= r * r] = 20
+
+    detector = YOLODetector()
+    gray = np.dot(film[..., :3], [0.2989, 0.5870, 0.1140])
+    expected_bounds = detector._get_content_bounds(detector._detect_radiographic_content(gray))
+    assert detector._tiled_content_bounds(open_tile_source(film), 96) == expected_bounds
+
+    tiled = detector.detect_defects_tiled(film, tile_size=160, overlap=48)
+    boxes = boxes_from_detections(tiled)
+    iou = iou_matrix(boxes, boxes)
+    assert not (np.triu(iou, 1) > detector.nms_threshold).any()
+    for cx, cy, r in [(120, 150, 12), (255, 100, 9)]:
+        assert any(d['class'] == 'porosity' and
+                   abs(d['bbox']['x'] + d['bbox']['width'] / 2 - cx) <= 3 and
+                   abs(d['bbox']['y'] + d['bbox']['height'] / 2 - cy) <= 3 for d in tiled)
+
+
+def test_tiled_source_above_bomb_limit(tmp_path):
+    """Raw films above Pillow's decompression-bomb limit are still memory-mapped."""
+    side = 16384
+    header = f'P5\n{side} {side}\n255\n'.encode()
+    path = tmp_path / 'scan.pgm'
+    with open(path, 'wb') as f:
+        f.write(header)
+        f.truncate(len(header) + side * side)  # sparse: no pixel data is written
+    film = np.memmap(path, dtype=np.uint8, mode='r+', offset=len(header), shape=(side, side))
+    film[8000:8010, 9000:9010] = 200
+    film.flush()
+    del film
+
+    limit = Image.MAX_IMAGE_PIXELS
+    assert side * side > 2 * limit
+    source = open_tile_source(str(path))
+    assert Image.MAX_IMAGE_PIXELS == limit
+    assert isinstance(source.array, np.memmap) and source.size == (side, side)
+    tile = source.read((8995, 7995, 9015, 8015))
+    assert tile.shape == (20, 20) and tile[5:15, 5:15].min() > 0 and tile[0, 0] == 0
+
+
+def test_detector_profiles():
+    """Profiles are validated, compiled once, and switch detector parameters without touching the detector."""
+    import pytest
+    from models.profiles import DEFAULT_PROFILE, compile_profile
+
+    profile = compile_profile('fast')
+    assert profile is compile_profile(dict(DEFAULT_PROFILE, name='fast', porosity_radius_step=2,
+                                           circularity_step_degrees=20))
+    assert profile.porosity_radii == tuple(range(5, 50, 2)) and profile.key == 'fast-1.0.0'
+    assert not profile.crack_kernel.flags.writeable
+    with pytest.raises(ValueError):
+        compile_profile({'porosity_stride': 2})
+    with pytest.raises(ValueError):
+        compile_profile({'porosity_median_size': 4})
+
+    rng = np.random.default_rng(11)
+    film = rng.integers(100, 200, (160, 200), dtype=np.uint8)
+    yy, xx = np.mgrid[:160, :200]
+    film[(xx - 60) ** 2 + (yy - 80) ** 2 <= 144] = 20
+    film[(xx - 140) ** 2 + (yy - 70) ** 2 <= 81] = 20
+
+    detector = YOLODetector()
+    fast = detector.with_profile('fast')
+    assert fast is detector.with_profile(profile) and detector.with_profile('default') is detector
+    assert detector.get_config()['profile'] == compile_profile().settings
+    assert fast.get_config()['profile']['porosity_radius_step'] == 2
+
+    # Variants are a bounded LRU, rebuilt after the detector is reconfigured
+    base = compile_profile('fast')
+    for step in range(1, YOLODetector.MAX_PROFILE_VARIANTS + 3):
+        detector.with_profile(base.replace(circularity_step_degrees=step))
+        assert detector.with_profile(profile) is fast
+    assert len(detector._variants) == YOLODetector.MAX_PROFILE_VARIANTS
+    detector.configure({'tile_overlap': 64})
+    assert detector.with_profile(profile) is not fast
+    assert detector.with_profile(profile).tile_overlap == 64
+    detector.configure({'tile_overlap': 128})
+    fast = detector.with_profile(profile)
+
+    pores = [d for d in fast.detect_defects(film) if d['class'] == 'porosity']
+    assert len(pores) == 2
+    strict = YOLODetector().configure({'confidence_threshold': 0.99})
+    assert strict.confidence_threshold == 0.99 and strict.detect_defects(film) == []
+    assert detector.confidence_threshold == 0.5
+
+    # Medians above 17 x 17 take the histogram path, on the 0-1 normalized film
+    for size in (19, 21):
+        large = detector.with_profile(profile.replace(porosity_median_size=size))
+        assert len(large.detect_defects(film, detectors=['porosity'])) == 2
+
+
+def test_pyramid_detection():
+    """Coarse-to-fine detection skips flat areas and still finds pores at full resolution."""
+    image = np.arange(35, dtype=np.float64).reshape(5, 7)
+    assert downsample(image, 2).shape == (3, 4)
+    assert downsample(image, 2)[0, 0] == image[:2, :2].mean()
+
+    mask = np.zeros((40, 60), bool)
+    mask[5, 50] = True
+    layout = candidate_layout(mask, 4, (0, 0, 240, 160), 64, 16)
+    assert layout == [((192, 0, 240, 64), (176, 0, 240, 80))]
+    assert candidate_layout(np.zeros((40, 60), bool), 4, (0, 0, 240, 160), 64, 16) == []
+
+    rng = np.random.default_rng(7)
+    film = np.full((480, 640, 3), 150, np.uint8)
+    film[:, :] += rng.integers(0, 6, (480, 640, 1), dtype=np.uint8)
+    yy, xx = np.mgrid[:480, :640]
+    for cx, cy, r in [(500, 380, 12), (420, 400, 9)]:
+        film[(xx - cx) ** 2 + (yy - cy) ** 2 <= r * r] = 20
+
+    detector = YOLODetector()
+    full = detector.detect_defects(Image.fromarray(film))
+    detector.pyramid_factor = 4
+    coarse = detector._pyramid_candidates(downsample(np.dot(film, [0.2989, 0.5870, 0.1140]), 4))
+    assert not coarse[:60].any()
+
+    pyramid = detector.detect_defects_pyramid(film)
+    assert sorted(tuple(d['bbox'].values()) for d in pyramid) == sorted(tuple(d['bbox'].values()) for d in full)
+    for cx, cy, r in [(500, 380, 12), (420, 400, 9)]:
+        assert any(d['class'] == 'porosity' and
+                   abs(d['bbox']['x'] + d['bbox']['width'] / 2 - cx) <= 3 and
+                   abs(d['bbox']['y'] + d['bbox']['height'] / 2 - cy) <= 3 for d in pyramid)
+
+
+def test_prescreen_fast_path():
+    """Skipped detectors are exactly those that would have found nothing."""
+    rng = np.random.default_rng(11)
+    films = {
+        'blank': np.full((240, 320, 3), 128, np.uint8),
+        'mid_gray': rng.integers(120, 160, (240, 320, 3), dtype=np.uint8),
+        'slag': rng.integers(120, 160, (240, 320, 3), dtype=np.uint8),
+        'pores': rng.integers(120, 160, (240, 320, 3), dtype=np.uint8)
+    }
+    films['slag'][100:130, 150:170] = 230
+    films['slag'][110:120, 140:180] = 230
+    yy, xx = np.mgrid[:240, :320]
+    films['pores'][(xx - 160) ** 2 + (yy - 120) ** 2 <= 100] = 20
+
+    detector = YOLODetector()
+    unscreened = YOLODetector()
+    unscreened._prescreen = lambda buffers, detectors: {}
+    for name, film in films.items():
+        screening = {}
+        image = Image.fromarray(film)
+        detections = detector.detect_defects(image, screening=screening)
+        assert detections == unscreened.detect_defects(image), name
+        if name == 'blank':
+            assert set(screening['skipped']) == set(YOLODetector.DETECTORS)
+        if name == 'mid_gray':
+            assert {'porosity', 'slag'} <= set(screening['skipped'])
+        assert screening['fast_path'] == bool(screening['skipped'])
+    assert any(d['class'] == 'porosity' for d in detector.detect_defects(Image.fromarray(films['pores'])))
+
+
+def test_compact_dtypes():
+    """Grayscale and shared buffers are float32/bool, and scratch memory is reused."""
+    from utils.scratch import scratch
+    from utils.tiling import to_grayscale
+
+    rng = np.random.default_rng(13)
+    film = rng.integers(0, 256, (64, 80, 3), dtype=np.uint8)
+    gray = to_grayscale(film)
+    assert gray.dtype == np.float32
+    assert np.allclose(gray, np.dot(film, [0.2989, 0.5870, 0.1140]), atol=1e-3)
+
+    kernel = np.outer([1, 2, 1], [1, 2, 1]) / 16
+    smoothed = convolve2d(gray, kernel)
+    assert smoothed.dtype == np.float32
+    assert np.allclose(smoothed, convolve2d(gray.astype(np.float64), kernel), atol=1e-3)
+
+    first = scratch('test', (32, 32), np.float32)
+    second = scratch('test', (16, 16), np.float64)
+    assert np.shares_memory(first, second)
+
+    buffers = YOLODetector()._stage_buffers(gray)
+    assert buffers.get('normalized').dtype == np.float32
+    assert buffers.get('edges').dtype == bool
+    assert buffers.get('edges') is buffers.get('edges')
+
+
+def reference_process_detections(detections):
+    """Original per-dict ImageProcessor.process_detections and calculate_defect_severity."""
+    processed, defect_types, total_confidence = [], {}, 0
+    for detection in detections:
+        bbox = detection['bbox']
+        processed.append({'class': detection['class'], 'confidence': detection['confidence'], 'bbox': bbox,
+                          'center': {'x': bbox['x'] + bbox['width'] / 2, 'y': bbox['y'] + bbox['height'] / 2}})
+        defect_types[detection['class']] = defect_types.get(detection['class'], 0) + 1
+        total_confidence += detection['confidence']
+    average = total_confidence / len(detections) if detections else 0
+
+    if not detections:
+        severity = "No defects"
+    elif defect_types.get('crack'):
+        severity = "Critical"
+    elif len(detections) > 5 or average > 0.9:
+        severity = "High"
+    elif len(detections) > 2 or average > 0.7:
+        severity = "Medium"
+    else:
+        severity = "Low"
+    return {'detections': processed, 'total_defects': len(detections), 'defect_types': defect_types,
+            'average_confidence': average, 'severity': severity}
+
+
+def test_columnar_image_processor():
+    """Batch processing over a DetectionTable matches per-film processing."""
+    from utils.detections import DetectionTable
+    from utils.image_processor import ImageProcessor
+
+    rng = np.random.default_rng(17)
+    films = []
+    for _ in range(60):
+        films.append([{
+            'class': str(rng.choice(['crack', 'porosity', 'slag'], p=[0.1, 0.5, 0.4])),
+            'confidence': float(rng.uniform(0.5, 0.95)),
+            'bbox': {'x': int(rng.integers(0, 500)), 'y': int(rng.integers(0, 400)),
+                     'width': int(rng.integers(5, 60)), 'height': int(rng.integers(5, 60))}
+        } for _ in range(int(rng.choice([0, 1, 2, 4, 7])))])
+
+    processor = ImageProcessor()
+    table = DetectionTable.from_detections(films)
+    results = processor.process_batch(table)
+    for film, result in zip(films, results):
+        assert result == reference_process_detections(film)
+        assert processor.calculate_defect_severity(film) == result['severity']
+
+    summary = processor.summarize_batch(table)
+    assert summary['total_defects'] == sum(len(film) for film in films)
+    assert sum(summary['severity_counts'].values()) == len(films)
+    assert summary['defect_types'] == {name: sum(r['defect_types'].get(name, 0) for r in results)
+                                       for name in ('crack', 'porosity', 'slag')}
+
+    recommendations = processor.batch_recommendations(table)
+    assert recommendations[[len(film) for film in films].index(0)] == [
+        "No defects detected. Weld quality appears satisfactory."]
+
+
+def test_stage_scheduler():
+    """Detector stages overlap, except while a profiler traces memory."""
+    import threading
+    import time
+    from utils.profiling import StageProfiler
+    from utils.scheduler import StageScheduler
+
+    active, overlap = [0], [0]
+    lock = threading.Lock()
+
+    def task():
+        with lock:
+            active[0] += 1
+            overlap[0] = max(overlap[0], active[0])
+        time.sleep(0.05)
+        with lock:
+            active[0] -= 1
+        return []
+
+    scheduler = StageScheduler(3)
+    tasks = [(name, task) for name in YOLODetector.DETECTORS]
+    scheduler.run(tasks, profiler=StageProfiler(trace_memory=True))
+    assert overlap[0] == 1
+    scheduler.run(tasks, profiler=StageProfiler())
+    assert overlap[0] > 1
+    # After shutdown the tasks still run, one at a time
+    scheduler.shutdown()
+    overlap[0] = 0
+    assert scheduler.run(tasks) == [[], [], []] and overlap[0] == 1
+
+    # Concurrent first requests share one scheduler; a replaced one is shut down
+    detector = YOLODetector()
+    detector.stage_workers = 3
+    film = create_test_image(64, 64)
+    threads = [threading.Thread(target=detector.detect_defects, args=(film,)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    first = detector._stage_scheduler()
+    detector.stage_workers = 2
+    second = detector._stage_scheduler()
+    assert second is not first and first._closed and first._executor is None
+    # Profile variants share the detector's stage threads
+    fast = detector.with_profile('fast')
+    assert fast._stage_scheduler() is second and fast.with_profile('default') is detector
+    detector.close()
+    assert second._closed and fast._stage_scheduler()._closed
+    assert detector.detect_defects(film) == YOLODetector().detect_defects(film)